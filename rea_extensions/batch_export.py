@@ -0,0 +1,267 @@
+"""Export many tracks at once.
+
+Raw MIDI buffers and tempo maps of all tracks are fetched from REAPER
+in one batch: the connection is held for the whole fetch, but every
+RPR call is still its own round trip. Then every track is decoded and
+rendered in the separate process.
+
+usage: python -m rea_extensions.batch_export [-h] [-w WORKERS] [-o OUTPUT]
+                                              [-k KEY] [--all-tracks]
+
+Without OUTPUT the whole score is printed to stdout.
+"""
+import argparse
+import concurrent.futures
+import os
+import re
+import sys
+import typing as ty
+
+import numpy as np
+
+from rea_extensions.lilypond import LY_VERSION, ly_file, source_to_ly
+from rea_extensions.midi_codec import MidiEvents, get_midi_buffer
+from rea_extensions.note_table import NoteTable
+from rea_extensions.sources import NotationEventType, NoteInfoType, Source
+from rea_extensions.spelling import DEFAULT_KEY
+from rea_extensions.time_map import TimeMap, fetch_take_time_map
+
+if ty.TYPE_CHECKING:
+    import reapy as rpr
+
+
+class TrackSnapshot(Source):
+    """Plain-data copy of MIDI items of one track.
+
+    Picklable, so it can be rendered in another process. Items are
+    merged into single timeline, which starts at the project start.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        name: str,
+        items: ty.Sequence[ty.Dict[str, ty.Any]],
+    ) -> None:
+        """
+        Parameters
+        ----------
+        index : int
+            track index in project
+        name : str
+        items : Sequence[Dict[str, Any]]
+            every item is dict with keys 'buffer' (raw MIDI buffer of
+            take) and 'time_map' (kwargs of TimeMap)
+        """
+        self.index = index
+        self._name = name
+        self.items = items
+
+    def __repr__(self) -> str:
+        return f'<TrackSnapshot {self.index} "{self.name}">'
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def get_time_map(self) -> TimeMap:
+        if not self.items:
+            return TimeMap()
+        kwargs = dict(self.items[0]['time_map'])
+        kwargs['qn_offset'] = 0.0
+        return TimeMap(**kwargs)
+
+    def _item_events(
+        self
+    ) -> ty.Iterator[ty.Tuple[float, float, MidiEvents]]:
+        resolution = self.get_time_map().ppq_resolution
+        for item in self.items:
+            time_map = item['time_map']
+            scale = resolution / time_map['ppq_resolution']
+            yield (
+                time_map['qn_offset'] * resolution, scale,
+                MidiEvents.decode(item['buffer'])
+            )
+
+    def get_midi(self) -> ty.List['rpr.MIDIEventDict']:
+        midi = []
+        for offset, scale, events in self._item_events():
+            for event in events.to_dicts():
+                event['ppq'] = offset + event['ppq'] * scale
+                midi.append(event)
+        midi.sort(key=lambda event: event['ppq'])
+        return midi
+
+    def get_notes(self) -> ty.List[NoteInfoType]:
+        notes = []
+        for offset, scale, events in self._item_events():
+            for note in events.note_infos():
+                note['ppq_position'] = offset + note['ppq_position'] * scale
+                note['ppq_end'] = offset + note['ppq_end'] * scale
+                notes.append(note)
+        return notes
+
+    def get_notation_events(self) -> ty.List[NotationEventType]:
+        notations = []
+        for offset, scale, events in self._item_events():
+            notations.extend(
+                (offset + ppq * scale, text)
+                for ppq, text in events.notation_events()
+            )
+        notations.sort(key=lambda event: event[0])
+        return notations
+
+    def get_note_table(self, ppq_resolution: int) -> NoteTable:
+        parts = []
+        for offset, scale, events in self._item_events():
+            data = events.notes()
+            data['start'] = offset + data['start'] * scale
+            data['end'] = offset + data['end'] * scale
+            parts.append(data)
+        if not parts:
+            return NoteTable.from_notes([], ppq_resolution)
+        return NoteTable(np.concatenate(parts), ppq_resolution)
+
+
+def fetch_tracks(all_tracks: bool = False) -> ty.List[TrackSnapshot]:
+    """Fetch MIDI of selected items (or all items of selected tracks).
+
+    All data is fetched from REAPER in one batch: the connection is
+    held, but calls of every item (MIDI buffer, tempo map and the
+    properties read) are round trips of their own.
+    """
+    return [
+        TrackSnapshot(track['index'], track['name'], track['items'])
+        for track in _fetch_tracks_data(all_tracks)
+    ]
+
+
+def _fetch_tracks_data(all_tracks: bool) -> ty.List[ty.Dict[str, ty.Any]]:
+    import reapy as rpr
+    with rpr.inside_reaper():
+        return _collect_tracks_data(rpr.Project(), all_tracks)
+
+
+def _collect_tracks_data(
+    project: 'rpr.Project', all_tracks: bool
+) -> ty.List[ty.Dict[str, ty.Any]]:
+    by_track: ty.Dict[int, ty.Tuple['rpr.Track', ty.List['rpr.Item']]] = {}
+    if all_tracks:
+        for track in project.selected_tracks:
+            by_track[track.index] = track, list(track.items)
+    else:
+        for item in project.selected_items:
+            track = item.track
+            by_track.setdefault(track.index, (track, []))[1].append(item)
+    tracks = []
+    for index in sorted(by_track):
+        track, items = by_track[index]
+        fetched = []
+        for item in sorted(items, key=lambda item: item.position):
+            take = item.active_take
+            if take is None or not take.is_midi:
+                continue
+            fetched.append(
+                {
+                    'buffer': get_midi_buffer(take),
+                    'time_map': fetch_take_time_map(take),
+                }
+            )
+        if fetched:
+            tracks.append(
+                {
+                    'index': index,
+                    'name': track.name,
+                    'items': fetched
+                }
+            )
+    return tracks
+
+
+def _render(snapshot: TrackSnapshot, key: str) -> str:
+    return source_to_ly(snapshot, key)
+
+
+def render_tracks(
+    snapshots: ty.Sequence[TrackSnapshot],
+    key: str = DEFAULT_KEY,
+    workers: ty.Optional[int] = None,
+) -> ty.List[str]:
+    """Render every track in process pool.
+
+    Result is in the order of snapshots, regardless of the scheduling.
+    If `workers` is 1, tracks are rendered in the current process.
+    """
+    if workers == 1 or len(snapshots) < 2:
+        return [_render(snapshot, key) for snapshot in snapshots]
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        return list(
+            executor.map(_render, snapshots, [key] * len(snapshots))
+        )
+
+
+def track_file_name(snapshot: TrackSnapshot) -> str:
+    name = re.sub(r'[^\w\-]+', '_', snapshot.name).strip('_') or 'track'
+    return f'{snapshot.index + 1:03d}_{name}.ly'
+
+
+def export_tracks(
+    snapshots: ty.Sequence[TrackSnapshot],
+    output_dir: ty.Optional[str] = None,
+    key: str = DEFAULT_KEY,
+    workers: ty.Optional[int] = None,
+    version: str = LY_VERSION,
+) -> ty.Union[str, ty.List[str]]:
+    """Export tracks as one score, or as file per track.
+
+    Returns
+    -------
+    Union[str, List[str]]
+        if output_dir is None — LilyPond code of the score
+        else — paths of the written files
+    """
+    rendered = render_tracks(snapshots, key, workers)
+    if output_dir is None:
+        staves = '\n'.join(rendered)
+        return f'\\version "{version}"\n<<\n{staves}\n>>\n'
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for snapshot, music in zip(snapshots, rendered):
+        path = os.path.join(output_dir, track_file_name(snapshot))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(ly_file(music, version))
+        paths.append(path)
+    return paths
+
+
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m rea_extensions.batch_export',
+        description='Export selected MIDI items of REAPER to LilyPond.',
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=None,
+        help='number of worker processes (default: number of CPUs)'
+    )
+    parser.add_argument('-o', '--output', help='folder for file per track')
+    parser.add_argument('-k', '--key', default=DEFAULT_KEY)
+    parser.add_argument(
+        '--all-tracks',
+        action='store_true',
+        help='export all items of selected tracks'
+    )
+    args = parser.parse_args(argv)
+    snapshots = fetch_tracks(args.all_tracks)
+    result = export_tracks(snapshots, args.output, args.key, args.workers)
+    if isinstance(result, str):
+        print(result)
+    else:
+        print(*result, sep='\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
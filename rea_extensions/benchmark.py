@@ -0,0 +1,527 @@
+"""Benchmarks of the lilypond export on synthetic scores.
+
+Scores are generated by seeded random generator, so every run (and
+every machine) exports the same music. Kinds of score:
+
+    scales    monophonic runs of eighths and sixteenths
+    chords    dense block chords
+    voices    two lines with overlapping notes
+    tuplets   triplets and quintuplets among straight notes
+    meters    runs under tempo and time signature changes
+    notation  notation events: staves, voices and articulations
+
+Every case is exported from raw MIDI buffer (see `BufferSource`), so the
+whole pipeline but the fetch from REAPER is measured. Wall time of every
+stage (see `profiling`) is the best of repeats.
+
+Results can be saved as JSON baseline and later checked against it: the
+check fails if a stage became slower than baseline by more than the
+threshold. Digest of the exported LilyPond code is compared with the
+golden file, so optimizations can't silently change the engraving.
+
+With --write-back the local cost of MIDI write-back plans of every score
+is printed too: encoding the bulk buffer after every note moved and the
+sparse plan of one moved note. If reapy is installed, write costs are
+then measured by `write_back.calibrate` against the stand-in server
+(see `reaper_standin`), every request delayed by LATENCY, and the
+number of changed notes, from which the bulk path is cheaper, is
+printed. The stand-in takes reapy ports, so REAPER must not run.
+
+usage: python -m rea_extensions.benchmark [-h] [-k KINDS] [-s SIZES]
+                                          [-r REPEAT] [--memory]
+                                          [--write-back] [-l LATENCY]
+                                          [-b BASELINE]
+                                          [--save-baseline]
+                                          [-t THRESHOLD] [-g GOLDEN]
+                                          [--update-golden] [-d DIR]
+
+Exits with 1 on regression or golden mismatch.
+"""
+import argparse
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+import typing as ty
+import warnings
+
+from rea_extensions.lilypond import BAR_CACHE, write_ly
+from rea_extensions.midi_codec import MidiEvents, pack_events
+from rea_extensions.profiling import Profiler
+from rea_extensions.sources import BufferSource
+from rea_extensions.time_map import TempoMarker, TimeMap
+from rea_extensions.write_back import WriteCosts, calibrate, plan_write_back
+
+PPQ = 960
+SEED = 1
+KINDS = ('scales', 'chords', 'voices', 'tuplets', 'meters', 'notation')
+SIZES = (100, 1000, 10000, 100000)
+DEFAULT_SIZES = (100, 1000, 10000)
+BASELINE = os.path.join('benchmarks', 'baseline.json')
+GOLDEN = os.path.join('benchmarks', 'golden.json')
+# stages faster than this (seconds) are too noisy to be checked
+MIN_CHECKED_TIME = 0.005
+# seconds of the round trip to REAPER over the distant API
+WRITE_BACK_LATENCY = 0.001
+
+# start ppq, end ppq, pitch, channel
+NoteType = ty.Tuple[int, int, int, int]
+CaseResultType = ty.Dict[str, ty.Any]
+
+_major = (0, 2, 4, 5, 7, 9, 11)
+_chords = (
+    (0, 4, 7),
+    (0, 3, 7),
+    (0, 4, 7, 11),
+    (0, 3, 7, 10),
+    (0, 4, 7, 12, 16),
+)
+
+
+class Score(ty.NamedTuple):
+    """Synthetic take: raw MIDI buffer and its tempo map."""
+    name: str
+    buffer: bytes
+    time_map: TimeMap
+    notes: int
+
+    def source(self) -> BufferSource:
+        return BufferSource(self.buffer, self.time_map, self.name)
+
+
+def _degree_pitch(degree: int, base: int = 60) -> int:
+    octave, step = divmod(degree, len(_major))
+    return base + octave * 12 + _major[step]
+
+
+def _scales(rng: random.Random, count: int) -> ty.List[NoteType]:
+    notes = []
+    pos, degree, step = 0, 0, 1
+    while len(notes) < count:
+        length = rng.choice((PPQ // 2, PPQ // 4, PPQ // 4))
+        notes.append((pos, pos + length, _degree_pitch(degree), 0))
+        pos += length
+        if not -7 < degree + step < 14:
+            step = -step
+        degree += step
+    return notes
+
+
+def _chords_notes(rng: random.Random, count: int) -> ty.List[NoteType]:
+    notes: ty.List[NoteType] = []
+    pos = 0
+    while len(notes) < count:
+        length = rng.choice((PPQ, PPQ, PPQ * 2, PPQ // 2))
+        root = rng.randrange(48, 66)
+        for interval in rng.choice(_chords)[:count - len(notes)]:
+            notes.append((pos, pos + length, root + interval, 0))
+        pos += length
+    return notes
+
+
+def _voices(rng: random.Random, count: int) -> ty.List[NoteType]:
+    notes: ty.List[NoteType] = []
+    upper = lower = 0
+    while len(notes) < count:
+        if upper <= lower:
+            length = rng.choice((PPQ // 2, PPQ, PPQ // 2 * 3))
+            # sometimes the note is held over the next one
+            held = length + (PPQ // 2 if rng.random() < 0.2 else 0)
+            notes.append((upper, upper + held, rng.randrange(67, 84), 0))
+            upper += length
+        else:
+            length = rng.choice((PPQ, PPQ * 2, PPQ * 3))
+            notes.append((lower, lower + length, rng.randrange(55, 67), 0))
+            lower += length
+    return notes
+
+
+def _tuplets(rng: random.Random, count: int) -> ty.List[NoteType]:
+    notes: ty.List[NoteType] = []
+    pos, degree = 0, 0
+    while len(notes) < count:
+        division = rng.choice((2, 3, 4, 5))
+        for idx in range(division):
+            start = pos + PPQ * idx // division
+            end = pos + PPQ * (idx + 1) // division
+            notes.append((start, end, _degree_pitch(degree % 14), 0))
+            degree += 1
+        pos += PPQ
+    return notes[:count]
+
+
+def _meters(rng: random.Random,
+            count: int) -> ty.Tuple[ty.List[NoteType], ty.List[TempoMarker]]:
+    notes = _scales(rng, count)
+    end = notes[-1][1] / PPQ
+    markers = []
+    qn, time, bpm = 0.0, 0.0, 120.0
+    while qn < end:
+        num, denom = rng.choice(((4, 4), (3, 4), (6, 8), (5, 8), (7, 8)))
+        new_bpm = float(rng.randrange(60, 180))
+        markers.append(TempoMarker(time, qn, new_bpm, num, denom))
+        bpm = new_bpm
+        length = rng.randrange(1, 5) * num * 4 / denom
+        qn += length
+        time += length * 60 / bpm
+    return notes, markers
+
+
+def _notation(
+    rng: random.Random, count: int
+) -> ty.Tuple[ty.List[NoteType], ty.List[ty.Tuple[int, bytes]]]:
+    notes = _voices(rng, count)
+    events = []
+    for start, _, pitch, channel in notes:
+        roll = rng.random()
+        if roll < 0.1:
+            text = f'staff {1 if pitch >= 60 else 2}'
+        elif roll < 0.2:
+            text = 'articulation staccato'
+        elif roll < 0.25:
+            text = f'voice {1 if pitch >= 67 else 2}'
+        else:
+            continue
+        events.append(
+            (start, f'NOTE {channel} {pitch} {text}'.encode('utf-8'))
+        )
+    return notes, events
+
+
+def generate(kind: str, count: int, seed: int = SEED) -> Score:
+    """Synthetic score of `count` notes."""
+    rng = random.Random(f'{kind}:{count}:{seed}')
+    markers: ty.List[TempoMarker] = []
+    notations: ty.List[ty.Tuple[int, bytes]] = []
+    if kind == 'scales':
+        notes = _scales(rng, count)
+    elif kind == 'chords':
+        notes = _chords_notes(rng, count)
+    elif kind == 'voices':
+        notes = _voices(rng, count)
+    elif kind == 'tuplets':
+        notes = _tuplets(rng, count)
+    elif kind == 'meters':
+        notes, markers = _meters(rng, count)
+    elif kind == 'notation':
+        notes, notations = _notation(rng, count)
+    else:
+        raise ValueError(f'unknown kind of score: {kind}')
+    events = []
+    for start, end, pitch, channel in notes:
+        # offs first: REAPER keeps note-off before note-on at same ppq
+        events.append((end, 0, bytes((0x80 | channel, pitch, 0))))
+        events.append((start, 0, bytes((0x90 | channel, pitch, 100))))
+    events.sort(key=lambda event: (event[0], event[2][0] & 0xf0 != 0x80))
+    events.extend((ppq, 0, b'\xff\x0f' + text) for ppq, text in notations)
+    return Score(
+        f'{kind}/{count}', pack_events(events),
+        TimeMap(PPQ, markers=markers), len(notes)
+    )
+
+
+def export(score: Score, memory: bool = False) -> ty.Tuple[str, Profiler]:
+    """Export score with empty bar cache, return code and profile.
+
+    Exceptions of the export propagate, so a crash is never hashed.
+    """
+    BAR_CACHE.clear()
+    out = io.StringIO()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with Profiler(memory=memory) as profiler:
+            write_ly(score.source(), out)
+    return out.getvalue(), profiler
+
+
+def digest(code: str) -> str:
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+def run_case(score: Score,
+             repeat: int = 3,
+             memory: bool = False) -> ty.Tuple[str, CaseResultType]:
+    """Export score `repeat` times, return code and best timings."""
+    code, best = '', None
+    for _ in range(repeat):
+        code, profiler = export(score)
+        report = profiler.report()
+        if best is None:
+            best = report
+            continue
+        best['wall'] = min(best['wall'], report['wall'])
+        for name, stats in report['stages'].items():
+            best_stats = best['stages'].setdefault(name, stats)
+            best_stats['wall'] = min(best_stats['wall'], stats['wall'])
+    assert best is not None
+    result: CaseResultType = {
+        'notes': score.notes,
+        'wall': best['wall'],
+        'stages': {
+            name: stats['wall']
+            for name, stats in best['stages'].items()
+        },
+        'sha256': digest(code),
+        'bytes': len(code),
+    }
+    if memory:
+        result['peak_memory'] = export(score, True)[1].peak_memory
+    return code, result
+
+
+def write_back_case(score: Score, repeat: int = 3) -> CaseResultType:
+    """Best seconds of bulk and sparse write-back plans of the score."""
+    events = MidiEvents.decode(score.buffer)
+    ons, offs = events.pair_notes()
+    moved_all = events.ppq + 1
+    moved_one = events.ppq.copy()
+    moved_one[[ons[0], offs[0]]] += 1
+    result: CaseResultType = {'events': len(events)}
+    for path, ppq in (('bulk', moved_all), ('sparse', moved_one)):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            plan = plan_write_back(events, ppq)
+            best = min(best, time.perf_counter() - start)
+        assert plan.path == path, plan.path
+        result[path] = best
+    return result
+
+
+def measure_write_costs(
+    scores: ty.Sequence[Score],
+    latency: float = WRITE_BACK_LATENCY,
+) -> ty.Optional[ty.Dict[str, WriteCosts]]:
+    """Write costs of every score, calibrated against the stand-in.
+
+    Every score is the item of its own track of one stand-in project,
+    as reapy connects once per process. None if reapy is not installed.
+    """
+    if importlib.util.find_spec('reapy') is None:
+        return None
+    from rea_extensions.reaper_standin import Project, StandInServer
+    project = Project()
+    for score in scores:
+        track = project.add_track(score.name)
+        track.add_midi_item(0.0, 1.0, score.buffer, score.name, ppq=PPQ)
+    with StandInServer(project, latency=latency):
+        # reapy connects on import, so the server goes first
+        import reapy as rpr
+        tracks = rpr.Project().tracks
+        return {
+            score.name: calibrate(tracks[idx].items[0].active_take)
+            for idx, score in enumerate(scores)
+        }
+
+
+def check_regressions(
+    results: ty.Dict[str, CaseResultType],
+    baseline: ty.Dict[str, CaseResultType],
+    threshold: float = 0.25,
+) -> ty.List[str]:
+    """Messages about stages slower than baseline by over threshold."""
+    messages = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        timings = dict(result['stages'], total=result['wall'])
+        base_timings = dict(base['stages'], total=base['wall'])
+        for stage_name, wall in timings.items():
+            base_wall = base_timings.get(stage_name)
+            if base_wall is None or base_wall < MIN_CHECKED_TIME:
+                continue
+            if wall > base_wall * (1 + threshold):
+                messages.append(
+                    f'{name} {stage_name}: {wall:.4f}s, baseline '
+                    f'{base_wall:.4f}s (+{wall / base_wall - 1:.0%})'
+                )
+    return messages
+
+
+def check_golden(
+    results: ty.Dict[str, CaseResultType],
+    golden: ty.Dict[str, ty.Dict[str, ty.Any]],
+) -> ty.List[str]:
+    """Messages about cases, which output differs from golden."""
+    return [
+        f'{name}: output differs from golden'
+        for name, result in results.items()
+        if name in golden and golden[name]['sha256'] != result['sha256']
+    ]
+
+
+def _read_json(path: str) -> ty.Dict[str, ty.Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return ty.cast(ty.Dict[str, ty.Any], json.load(f))
+
+
+def _write_json(path: str, data: ty.Dict[str, ty.Any]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def _names(value: str) -> ty.List[str]:
+    return [name for name in value.split(',') if name]
+
+
+def _sizes(value: str) -> ty.List[int]:
+    return [int(size) for size in _names(value)]
+
+
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m rea_extensions.benchmark',
+        description='Benchmark lilypond export on synthetic scores.',
+    )
+    parser.add_argument(
+        '-k',
+        '--kinds',
+        type=_names,
+        default=list(KINDS),
+        help=f'comma-separated kinds of score (default: all of '
+        f'{",".join(KINDS)})'
+    )
+    parser.add_argument(
+        '-s',
+        '--sizes',
+        type=_sizes,
+        default=list(DEFAULT_SIZES),
+        help='comma-separated numbers of notes '
+        f'(default: {",".join(map(str, DEFAULT_SIZES))})'
+    )
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=3, help='(default: 3)'
+    )
+    parser.add_argument(
+        '--memory',
+        action='store_true',
+        help='measure peak memory in additional run'
+    )
+    parser.add_argument(
+        '--write-back',
+        action='store_true',
+        help='measure cost of MIDI write-back plans'
+    )
+    parser.add_argument(
+        '-l',
+        '--latency',
+        type=float,
+        default=WRITE_BACK_LATENCY,
+        help='seconds of the round trip for --write-back '
+        f'(default: {WRITE_BACK_LATENCY})'
+    )
+    parser.add_argument(
+        '-b', '--baseline', default=BASELINE, help=f'(default: {BASELINE})'
+    )
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='write results to baseline instead of checking'
+    )
+    parser.add_argument(
+        '-t',
+        '--threshold',
+        type=float,
+        default=0.25,
+        help='allowed slowdown of stage (default: 0.25)'
+    )
+    parser.add_argument(
+        '-g', '--golden', default=GOLDEN, help=f'(default: {GOLDEN})'
+    )
+    parser.add_argument(
+        '--update-golden',
+        action='store_true',
+        help='write digests of outputs to golden file'
+    )
+    parser.add_argument(
+        '-d', '--dump', metavar='DIR', help='write exported .ly files'
+    )
+    args = parser.parse_args(argv)
+
+    results: ty.Dict[str, CaseResultType] = {}
+    scores: ty.List[Score] = []
+    for kind in args.kinds:
+        for size in args.sizes:
+            score = generate(kind, size)
+            code, result = run_case(score, args.repeat, args.memory)
+            results[score.name] = result
+            print(
+                f'{score.name:>16}: {result["wall"]:8.4f}s  ' + '  '.join(
+                    f'{name} {wall:.4f}'
+                    for name, wall in result['stages'].items()
+                )
+            )
+            if args.write_back:
+                scores.append(score)
+                wb = write_back_case(score, args.repeat)
+                print(
+                    f'{"write-back":>16}: {wb["events"]} events  '
+                    f'bulk {wb["bulk"]:.4f}s '
+                    f'({wb["bulk"] / wb["events"] * 1e6:.2f} us/event)  '
+                    f'sparse {wb["sparse"]:.4f}s'
+                )
+            if args.dump:
+                path = os.path.join(args.dump, f'{kind}_{size}.ly')
+                os.makedirs(args.dump, exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write(code)
+
+    if scores:
+        measured = measure_write_costs(scores, args.latency)
+        if measured is None:
+            print('write costs are not measured: reapy is not installed')
+        for score in scores if measured else ():
+            costs = measured[score.name]
+            events = len(MidiEvents.decode(score.buffer))
+            print(
+                f'{score.name:>16}: call {costs.call * 1e3:.3f}ms  '
+                f'bulk {costs.base * 1e3:.3f}ms + '
+                f'{costs.per_event * 1e6:.2f}us/event  '
+                f'crossover {costs.crossover(events)} notes'
+            )
+
+    failures = []
+    if args.save_baseline:
+        baseline = _read_json(args.baseline)
+        baseline.setdefault('cases', {}).update(results)
+        baseline['python'] = platform.python_version()
+        baseline['machine'] = platform.machine()
+        _write_json(args.baseline, baseline)
+    else:
+        failures += check_regressions(
+            results,
+            _read_json(args.baseline).get('cases', {}), args.threshold
+        )
+    golden = _read_json(args.golden)
+    if args.update_golden:
+        golden.update(
+            {
+                name: {
+                    'sha256': result['sha256'],
+                    'bytes': result['bytes']
+                }
+                for name, result in results.items()
+            }
+        )
+        _write_json(args.golden, golden)
+    else:
+        failures += check_golden(results, golden)
+    for message in failures:
+        print(message)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
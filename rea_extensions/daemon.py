@@ -0,0 +1,473 @@
+"""Resident worker, which keeps reapy, the exporter and caches warm.
+
+Every REAPER action, which runs a script, pays for the interpreter
+start, imports of reapy, numpy and the exporter and for the connection
+to the distant API — more than the export of a small item itself. The
+daemon pays it once; actions become thin clients, which send one JSON
+line over the local socket and wait for the answer::
+
+    python -m rea_extensions.daemon serve &
+    python -m rea_extensions.daemon export -o item.ly
+    python -m rea_extensions.daemon quantize
+    python -m rea_extensions.daemon fx-start
+    python -m rea_extensions.daemon stats
+
+Inside REAPER action use `request` directly, the client needs only the
+standard library::
+
+    from rea_extensions.daemon import request
+    request('export', output='item.ly')
+
+Jobs are queued and run one by one in the worker thread (REAPER serves
+one request at a time anyway). `stats` and `stop` are answered at once,
+without queuing. The FX scheduler polls the play position from its own
+thread: it shares the connection with the worker under a lock, so
+calls to REAPER never interleave. After the connection is lost, only
+the commands of IDEMPOTENT are run again.
+
+usage: python -m rea_extensions.daemon [-h] [-p PORT]
+                                       {serve,export,quantize,fx-start,
+                                        fx-stop,stats,stop} ...
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import typing as ty
+
+# Only the standard library is imported here: thin clients import this
+# module too. Commands and their heavy imports are loaded by `serve`.
+
+DAEMON_PORT = 2310
+QUEUE_SIZE = 64
+# commands, safe to run again after the connection to REAPER was lost
+# in the middle: quantize may have written back part of the takes
+IDEMPOTENT = frozenset(('export', 'fx-start', 'fx-stop'))
+
+CommandType = ty.Callable[..., ty.Any]
+
+
+class DaemonError(Exception):
+    """Error of the job, or of the daemon, reported to the client."""
+
+
+class CommandStats:
+    """Accumulated numbers of one command."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.wall = 0.0
+        self.last_wall = 0.0
+
+    def as_dict(self) -> ty.Dict[str, ty.Union[int, float]]:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'wall': self.wall,
+            'last_wall': self.last_wall,
+        }
+
+
+def load_commands() -> ty.Dict[str, CommandType]:
+    """Import the exporter and reapy, return commands by name."""
+    import reapy as rpr
+
+    from rea_extensions.fx_scheduler import FxScheduler
+    from rea_extensions.lilypond import (
+        BAR_CACHE, item_to_ly, ly_file, rhythm_cache_info
+    )
+    from rea_extensions.quantize import GRIDS, quantize_selected
+    from rea_extensions.spelling import DEFAULT_KEY
+
+    schedulers: ty.List[ty.Tuple[FxScheduler, threading.Thread]] = []
+    # held by the worker and by the scheduler thread while they call
+    # REAPER; fx-stop doesn't hold it: the scheduler restores FX under it
+    reaper = threading.Lock()
+
+    def export(
+        output: ty.Optional[str] = None,
+        item: int = 0,
+        key: str = DEFAULT_KEY,
+        profile: bool = False,
+    ) -> ty.Dict[str, ty.Any]:
+        """Export selected item, write it to output if given."""
+        report: ty.Optional[ty.Dict[str, ty.Any]] = {} if profile else None
+        with reaper:
+            music = item_to_ly(
+                rpr.Project().selected_items[item], key, report
+            )
+        result: ty.Dict[str, ty.Any] = {}
+        if report is not None:
+            result['report'] = report
+        if output is None:
+            result['music'] = music
+            return result
+        tmp = output + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(ly_file(music))
+        os.replace(tmp, output)
+        result['output'] = output
+        return result
+
+    def quantize(
+        grids: ty.Optional[ty.Dict[str, int]] = None
+    ) -> ty.Dict[str, int]:
+        divisions = tuple((grids or GRIDS).values())
+        with reaper:
+            return {'changed': quantize_selected(divisions)}
+
+    def fx_stop() -> ty.Dict[str, int]:
+        """Stop running schedulers, FX are put back online."""
+        stopped = 0
+        while schedulers:
+            scheduler, thread = schedulers.pop()
+            scheduler.stop()
+            thread.join()
+            stopped += 1
+        return {'stopped': stopped}
+
+    def fx_start(
+        pre_roll: float = 2.0,
+        tail: float = 5.0,
+        selected: bool = False,
+        interval: float = 0.1,
+    ) -> ty.Dict[str, int]:
+        """(Re)start FX scheduler in the background thread."""
+        fx_stop()
+        with reaper:
+            scheduler = FxScheduler.from_project(
+                pre_roll, tail, selected, interval, reaper
+            )
+        thread = threading.Thread(target=scheduler.run, daemon=True)
+        thread.start()
+        schedulers.append((scheduler, thread))
+        return {'tracks': len(scheduler.schedules)}
+
+    def caches() -> ty.Dict[str, ty.Any]:
+        return {
+            'bars': BAR_CACHE.info(),
+            **{
+                name: info._asdict()
+                for name, info in rhythm_cache_info().items()
+            },
+        }
+
+    def reconnect() -> None:
+        with reaper:
+            rpr.reconnect()
+
+    return {
+        'export': export,
+        'quantize': quantize,
+        'fx-start': fx_start,
+        'fx-stop': fx_stop,
+        # not commands of clients, used by the daemon itself
+        '_caches': caches,
+        '_reconnect': reconnect,
+    }
+
+
+class Daemon:
+    """Serves commands over local TCP socket, one JSON line each.
+
+    Request is ``{"command": name, "args": {...}}``, response is
+    ``{"ok": true, "result": ...}`` or ``{"ok": false, "error": text}``.
+    Connection may send any number of requests.
+
+    Parameters
+    ----------
+    commands : Dict[str, Callable]
+        see `load_commands`. Names, starting with underscore, are not
+        available to clients.
+    port : int
+    queue_size : int
+        jobs waiting for the worker; if the queue is full, request is
+        refused at once
+    """
+
+    def __init__(
+        self,
+        commands: ty.Dict[str, CommandType],
+        port: int = DAEMON_PORT,
+        queue_size: int = QUEUE_SIZE,
+    ) -> None:
+        self.commands = commands
+        self.port = port
+        self.queue_size = queue_size
+        self.stats: ty.Dict[str, CommandStats] = {}
+        self.started = time.time()
+        self.current: ty.Optional[str] = None
+        self._queue: ty.Optional[asyncio.Queue[ty.Any]] = None
+        self._stopped: ty.Optional[asyncio.Event] = None
+        # REAPER serves one request at a time: jobs don't run in parallel
+        self._executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    def __repr__(self) -> str:
+        return f'<Daemon port: {self.port} commands: {self.public}>'
+
+    @property
+    def public(self) -> ty.List[str]:
+        return [name for name in self.commands if not name.startswith('_')]
+
+    def health(self) -> ty.Dict[str, ty.Any]:
+        """Uptime, queue, per-command numbers and caches of exporter."""
+        caches = self.commands.get('_caches')
+        return {
+            'pid': os.getpid(),
+            'uptime': time.time() - self.started,
+            'current': self.current,
+            'queued': self._queue.qsize() if self._queue else 0,
+            'commands': {
+                name: stats.as_dict()
+                for name, stats in self.stats.items()
+            },
+            'caches': caches() if caches else None,
+        }
+
+    def run_job(self, command: str, args: ty.Dict[str, ty.Any]) -> ty.Any:
+        """Run command in the worker thread, reconnect on lost REAPER.
+
+        Command of IDEMPOTENT is retried once after reconnect, error of
+        other commands is raised: they may have changed the project
+        before the connection was lost.
+        """
+        function = self.commands[command]
+        try:
+            return function(**args)
+        except ConnectionError:
+            reconnect = self.commands.get('_reconnect')
+            if reconnect is None:
+                raise
+            reconnect()
+            if command not in IDEMPOTENT:
+                raise
+            return function(**args)
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            command, args, future = await self._queue.get()
+            stats = self.stats.setdefault(command, CommandStats())
+            self.current = command
+            start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(
+                    self._executor, self.run_job, command, args
+                )
+            except Exception:
+                stats.errors += 1
+                if not future.done():
+                    future.set_exception(
+                        DaemonError(traceback.format_exc())
+                    )
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                stats.last_wall = time.perf_counter() - start
+                stats.wall += stats.last_wall
+                stats.calls += 1
+                self.current = None
+                self._queue.task_done()
+
+    async def answer(self, request: ty.Dict[str, ty.Any]) -> ty.Any:
+        """Result of the request, raises DaemonError."""
+        assert self._queue is not None and self._stopped is not None
+        command = request.get('command')
+        if command == 'stats':
+            return self.health()
+        if command == 'stop':
+            self._stopped.set()
+            return None
+        if command not in self.public:
+            raise DaemonError(
+                f'unknown command: {command}, expected one of '
+                f'{self.public + ["stats", "stop"]}'
+            )
+        args = request.get('args') or {}
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((command, args, future))
+        except asyncio.QueueFull:
+            raise DaemonError(f'queue is full ({self.queue_size} jobs)')
+        return await future
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    result = await self.answer(json.loads(line))
+                    response = {'ok': True, 'result': result}
+                except DaemonError as e:
+                    response = {'ok': False, 'error': str(e)}
+                except Exception:
+                    response = {'ok': False, 'error': traceback.format_exc()}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        """Serve until `stop` request."""
+        self._queue = asyncio.Queue(self.queue_size)
+        self._stopped = asyncio.Event()
+        worker = asyncio.create_task(self._worker())
+        server = await asyncio.start_server(
+            self._handle, '127.0.0.1', self.port
+        )
+        async with server:
+            await self._stopped.wait()
+        worker.cancel()
+        stop = self.commands.get('fx-stop')
+        if stop is not None:
+            stop()
+        self._executor.shutdown()
+
+
+def request(
+    command: str,
+    port: int = DAEMON_PORT,
+    timeout: ty.Optional[float] = None,
+    **args: ty.Any,
+) -> ty.Any:
+    """Send one request to the daemon and wait for its result.
+
+    Raises
+    ------
+    DaemonError
+        with the traceback of the failed job
+    ConnectionRefusedError
+        if the daemon is not running
+    """
+    with socket.create_connection(('127.0.0.1', port), timeout) as conn:
+        conn.sendall(
+            json.dumps({
+                'command': command,
+                'args': args
+            }).encode() + b'\n'
+        )
+        with conn.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise DaemonError('daemon closed the connection')
+    response = json.loads(line)
+    if not response['ok']:
+        raise DaemonError(response['error'])
+    return response['result']
+
+
+def _grid(value: str) -> ty.Tuple[str, int]:
+    name, _, divisions = value.partition('=')
+    return name, int(divisions)
+
+
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m rea_extensions.daemon',
+        description='Resident export worker and its thin client.',
+    )
+    parser.add_argument(
+        '-p',
+        '--port',
+        type=int,
+        default=DAEMON_PORT,
+        help=f'(default: {DAEMON_PORT})'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='run the daemon')
+    serve.add_argument(
+        '-q',
+        '--queue-size',
+        type=int,
+        default=QUEUE_SIZE,
+        help=f'jobs waiting for the worker (default: {QUEUE_SIZE})'
+    )
+    export = commands.add_parser('export', help='export selected item')
+    export.add_argument('-o', '--output', help='.ly file to write')
+    export.add_argument(
+        '-i', '--item', type=int, default=0, help='index of selected item'
+    )
+    export.add_argument('-k', '--key')
+    export.add_argument(
+        '--profile', action='store_true', help='print stage numbers'
+    )
+    quantize = commands.add_parser(
+        'quantize', help='quantize selected notes of selected items'
+    )
+    quantize.add_argument(
+        '-g',
+        '--grid',
+        type=_grid,
+        action='append',
+        metavar='NAME=DIVISIONS',
+        help='candidate grid as divisions of quarter note'
+    )
+    fx_start = commands.add_parser(
+        'fx-start', help='keep FX online only around items'
+    )
+    fx_start.add_argument('--pre-roll', type=float, default=2.0)
+    fx_start.add_argument('--tail', type=float, default=5.0)
+    fx_start.add_argument('--interval', type=float, default=0.1)
+    fx_start.add_argument('--selected', action='store_true')
+    commands.add_parser('fx-stop', help='stop FX scheduling')
+    commands.add_parser('stats', help='print health and numbers')
+    commands.add_parser('stop', help='stop the daemon')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        daemon = Daemon(load_commands(), args.port, args.queue_size)
+        print(daemon)
+        try:
+            asyncio.run(daemon.serve())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    kwargs: ty.Dict[str, ty.Any] = {}
+    if args.command == 'export':
+        kwargs = dict(output=args.output, item=args.item)
+        if args.key:
+            kwargs['key'] = args.key
+        if args.profile:
+            kwargs['profile'] = True
+    elif args.command == 'quantize' and args.grid:
+        kwargs = dict(grids=dict(args.grid))
+    elif args.command == 'fx-start':
+        kwargs = dict(
+            pre_roll=args.pre_roll,
+            tail=args.tail,
+            selected=args.selected,
+            interval=args.interval
+        )
+    try:
+        result = request(args.command, args.port, **kwargs)
+    except ConnectionRefusedError:
+        print(f'daemon is not running on port {args.port}', file=sys.stderr)
+        return 1
+    except DaemonError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if args.command == 'export' and 'music' in result:
+        print(result.pop('music'))
+    if result:
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Idempotent writing of envelope points.
+
+The desired point set is diffed against the existing points; only the
+missing points are inserted and only the extra ones are deleted, in one
+batch per envelope (the connection is held, but every RPR call is still
+its own round trip). Writing the same points twice changes nothing.
+"""
+import typing as ty
+
+import reapy as rpr
+
+from reapy import reascript_api as RPR
+
+SHAPE_SQUARE = 1
+# points closer than this are considered to be at the same time
+TIME_PRECISION = 6
+
+
+class Point(ty.NamedTuple):
+    time: float
+    value: float
+    shape: int = SHAPE_SQUARE
+    tension: float = 0.0
+
+    def key(self) -> ty.Tuple[float, float, int, float]:
+        return (
+            round(self.time, TIME_PRECISION), self.value, self.shape,
+            self.tension
+        )
+
+
+class EnvelopeDiff(ty.NamedTuple):
+    """Indices of existing points to delete and points to insert."""
+    delete: ty.List[int]
+    insert: ty.List[Point]
+
+    def __bool__(self) -> bool:
+        return bool(self.delete or self.insert)
+
+
+def diff_points(
+    existing: ty.Sequence[Point], desired: ty.Iterable[Point]
+) -> EnvelopeDiff:
+    """Diff point sets, duplicated existing points are deleted."""
+    wanted: ty.Dict[ty.Tuple[float, float, int, float], Point] = {}
+    for point in desired:
+        wanted.setdefault(point.key(), point)
+    delete = []
+    for idx, point in enumerate(existing):
+        if wanted.pop(point.key(), None) is None:
+            delete.append(idx)
+    return EnvelopeDiff(delete, list(wanted.values()))
+
+
+def square_points(
+    intervals: ty.Iterable[ty.Tuple[float, float]],
+    inside: float,
+    outside: float,
+) -> ty.List[Point]:
+    """Square-shaped points, holding `inside` value on the intervals.
+
+    Intervals have to be sorted and not overlapping. Points at the same
+    time are collapsed to the last one.
+    """
+    points: ty.Dict[float, Point] = {0.0: Point(0.0, outside)}
+    for start, end in intervals:
+        points[round(start, TIME_PRECISION)] = Point(start, inside)
+        points[round(end, TIME_PRECISION)] = Point(end, outside)
+    return [points[time] for time in sorted(points)]
+
+
+def _read_points(env: rpr.Envelope) -> ty.List[Point]:
+    points = []
+    for idx in range(RPR.CountEnvelopePoints(env.id)):
+        _, _, _, time, value, shape, tension, _ = RPR.GetEnvelopePoint(
+            env.id, idx, 0, 0, 0, 0, 0
+        )
+        points.append(Point(time, value, shape, tension))
+    return points
+
+
+@rpr.inside_reaper()
+def sync_envelope(env: rpr.Envelope,
+                  desired: ty.Sequence[Point]) -> ty.Tuple[int, int]:
+    """Make points of the envelope equal to `desired`, in one batch.
+
+    Returns
+    -------
+    Tuple[int, int]
+        numbers of deleted and inserted points
+    """
+    diff = diff_points(_read_points(env), [Point(*p) for p in desired])
+    if not diff:
+        return 0, 0
+    # from the end, so indices of the rest points stay valid
+    for idx in reversed(diff.delete):
+        RPR.DeleteEnvelopePointEx(env.id, -1, idx)
+    for point in diff.insert:
+        RPR.InsertEnvelopePoint(
+            env.id, point.time, point.value, point.shape, point.tension,
+            False, True
+        )
+    RPR.Envelope_SortPoints(env.id)
+    return len(diff.delete), len(diff.insert)
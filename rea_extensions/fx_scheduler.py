@@ -0,0 +1,254 @@
+"""Keep FX online only around the regions, where tracks have items.
+
+Items of every track are merged into the union of intervals, widened by
+pre-roll (time for plugin to load before the first note) and tail
+(reverb and delay decay). While REAPER plays, FX of tracks outside of
+their intervals are put offline, which frees CPU and RAM; they are put
+back online when the play position comes into the pre-roll.
+
+usage: python -m rea_extensions.fx_scheduler [-h] [-p PRE_ROLL] [-t TAIL]
+                                             [-i INTERVAL] [--selected]
+
+On exit all FX of the scheduled tracks are put back online.
+"""
+import argparse
+import bisect
+import sys
+import threading
+import typing as ty
+
+import reapy as rpr
+
+from reapy import reascript_api as RPR
+
+IntervalType = ty.Tuple[float, float]
+
+
+def merge_intervals(
+    intervals: ty.Iterable[IntervalType],
+    pre_roll: float = 0.0,
+    tail: float = 0.0,
+) -> ty.List[IntervalType]:
+    """Union of intervals, every one widened by pre_roll and tail."""
+    merged: ty.List[IntervalType] = []
+    for start, end in sorted(intervals):
+        start, end = max(start - pre_roll, 0.0), end + tail
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = merged[-1][0], end
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def in_intervals(intervals: ty.Sequence[IntervalType], time: float) -> bool:
+    """If time is inside one of sorted not overlapping intervals."""
+    idx = bisect.bisect_right(intervals, (time, float('inf'))) - 1
+    return idx >= 0 and intervals[idx][0] <= time < intervals[idx][1]
+
+
+class TrackSchedule(ty.NamedTuple):
+    """Track, offline state of its every FX and merged intervals.
+
+    `offline` is the last known state, it's updated in place by
+    `set_tracks_offline`.
+    """
+    track: rpr.Track
+    offline: ty.List[bool]
+    intervals: ty.List[IntervalType]
+
+
+@rpr.inside_reaper()
+def fetch_track_items(
+    selected: bool = False
+) -> ty.List[ty.Tuple[rpr.Track, ty.List[bool], ty.List[IntervalType]]]:
+    """(track, offline state of every FX, intervals of items).
+
+    Tracks without FX are skipped.
+    """
+    project = rpr.Project()
+    tracks = project.selected_tracks if selected else project.tracks
+    out = []
+    for track in tracks:
+        fx_count = RPR.TrackFX_GetCount(track.id)
+        if not fx_count:
+            continue
+        out.append(
+            (
+                track, [
+                    bool(RPR.TrackFX_GetOffline(track.id, idx))
+                    for idx in range(fx_count)
+                ], [
+                    (item.position, item.position + item.length)
+                    for item in track.items
+                ]
+            )
+        )
+    return out
+
+
+@rpr.inside_reaper()
+def set_tracks_offline(
+    changes: ty.Sequence[ty.Tuple[rpr.Track, ty.List[bool], bool]]
+) -> int:
+    """Set FX of tracks offline or online, in one batch.
+
+    Parameters
+    ----------
+    changes : Sequence[Tuple[rpr.Track, List[bool], bool]]
+        (track, known offline state of every FX, offline). FX, which
+        are already in the state, are skipped; states are updated.
+
+    Returns
+    -------
+    int
+        number of calls to REAPER, one per switched FX
+    """
+    calls = 0
+    for track, states, offline in changes:
+        for idx, state in enumerate(states):
+            if state == offline:
+                continue
+            RPR.TrackFX_SetOffline(track.id, idx, offline)
+            states[idx] = offline
+            calls += 1
+    return calls
+
+
+@rpr.inside_reaper()
+def play_position() -> float:
+    """Play position while playing, else edit cursor position."""
+    if RPR.GetPlayState() & 1:
+        return ty.cast(float, RPR.GetPlayPosition2())
+    return ty.cast(float, RPR.GetCursorPosition())
+
+
+class FxScheduler:
+    """Switches FX of tracks online and offline by position.
+
+    Parameters
+    ----------
+    schedules : Sequence[TrackSchedule]
+        intervals have to be merged, see `merge_intervals`
+    interval : float
+        seconds between polls of play position
+    lock : Optional[threading.Lock]
+        held by `run` for every poll and for the restore, if the
+        connection to REAPER is shared with other threads
+    """
+
+    def __init__(
+        self,
+        schedules: ty.Sequence[TrackSchedule],
+        interval: float = 0.1,
+        lock: ty.Optional[threading.Lock] = None,
+    ) -> None:
+        self.schedules = schedules
+        self.interval = interval
+        self.lock = lock or threading.Lock()
+        self.online: ty.List[ty.Optional[bool]] = [None] * len(schedules)
+        self._stop = threading.Event()
+
+    def __repr__(self) -> str:
+        online = sum(1 for state in self.online if state)
+        return f'<FxScheduler tracks: {len(self.schedules)} online: {online}>'
+
+    @classmethod
+    def from_project(
+        cls,
+        pre_roll: float = 2.0,
+        tail: float = 5.0,
+        selected: bool = False,
+        interval: float = 0.1,
+        lock: ty.Optional[threading.Lock] = None,
+    ) -> 'FxScheduler':
+        return cls(
+            [
+                TrackSchedule(
+                    track, offline, merge_intervals(items, pre_roll, tail)
+                ) for track, offline, items in fetch_track_items(selected)
+            ],
+            interval,
+            lock,
+        )
+
+    def update(self, time: float) -> int:
+        """Switch FX for the position, return number of changed tracks."""
+        changes = []
+        for idx, schedule in enumerate(self.schedules):
+            online = in_intervals(schedule.intervals, time)
+            if online != self.online[idx]:
+                self.online[idx] = online
+                changes.append(
+                    (schedule.track, schedule.offline, not online)
+                )
+        if changes:
+            set_tracks_offline(changes)
+        return len(changes)
+
+    def restore(self) -> None:
+        """Put all FX online."""
+        set_tracks_offline(
+            [(s.track, s.offline, False) for s in self.schedules]
+        )
+        self.online = [True] * len(self.schedules)
+
+    def run(self) -> None:
+        """Follow play position until `stop()`, then restore FX."""
+        self._stop.clear()
+        try:
+            while not self._stop.is_set():
+                with self.lock:
+                    self.update(play_position())
+                self._stop.wait(self.interval)
+        finally:
+            with self.lock:
+                self.restore()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m rea_extensions.fx_scheduler',
+        description='Keep FX online only around items of their tracks.',
+    )
+    parser.add_argument(
+        '-p',
+        '--pre-roll',
+        type=float,
+        default=2.0,
+        help='seconds FX are online before item (default: 2)'
+    )
+    parser.add_argument(
+        '-t',
+        '--tail',
+        type=float,
+        default=5.0,
+        help='seconds FX stay online after item (default: 5)'
+    )
+    parser.add_argument(
+        '-i',
+        '--interval',
+        type=float,
+        default=0.1,
+        help='seconds between polls of play position (default: 0.1)'
+    )
+    parser.add_argument(
+        '--selected', action='store_true', help='only selected tracks'
+    )
+    args = parser.parse_args(argv)
+    scheduler = FxScheduler.from_project(
+        args.pre_roll, args.tail, args.selected, args.interval
+    )
+    print(scheduler)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
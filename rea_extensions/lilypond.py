@@ -1,232 +1,451 @@
+import collections
+import functools
+import hashlib
 import io
-import re
+import math
 import typing as ty
+import warnings
 
+from bisect import bisect_right
 from fractions import Fraction
-from pprint import pprint
 
-import librosa  # type: ignore
-import reapy as rpr
+import numpy as np
 
-from reapy import reascript_api as RPR
+from rea_extensions.notation import (
+    HAIRPIN_END, notation_keys, parse_notation, parse_track_notation
+)
+from rea_extensions.note_table import NO_NOTATION, NoteTable
+from rea_extensions.profiling import Profiler, stage
+from rea_extensions.sources import Source, TakeSource
+from rea_extensions.spelling import DEFAULT_KEY, key_table, spell_altered
+from rea_extensions.time_map import TimeMap
+
+if ty.TYPE_CHECKING:
+    import reapy as rpr
 
 EventsDictType = ty.Dict['Position', ty.List['Note']]
+LY_VERSION = '2.19'
+# voice, pitch, channel, ticks and `Note.after` of the note, sounding
+# into the next bar
+SpillPart = ty.Tuple[int, int, int, int, str]
+SpillType = ty.Tuple[SpillPart, ...]
+
+
+class NotationWarning(UserWarning):
+    """Notation event can't be matched to the single note."""
 
 
 class LyExpr:
+    __slots__ = ()
 
     @property
     def for_ly(self) -> str:
         return self.__repr__()
 
+    def write(self, out: ty.TextIO) -> None:
+        """Write LilyPond code to the file-like object."""
+        out.write(self.for_ly)
+
+    def pieces(self) -> ty.Tuple['PieceType', ...]:
+        """LilyPond code, split by tuplets, to be grouped with neighbours."""
+        return ((None, self.for_ly), )
+
 
 class Event(LyExpr):
-    ...
+    __slots__ = ()
+
+
+TICKS_PER_QUARTER = 3360  # 2**5 * 3 * 5 * 7: 128th notes and tuplets
+TICKS_PER_WHOLE = TICKS_PER_QUARTER * 4
+RHYTHM_CACHE_SIZE = 4096
+POSITION_CACHE_SIZE = 1024
+
+FractionOrFractured = ty.Union[Fraction, 'Fractured']
+
+
+TupletType = ty.Optional[ty.Tuple[int, int]]
+# rendered duration with everything around it and its tuplet, if any
+PieceType = ty.Tuple[TupletType, str]
+
+
+class Duration(ty.NamedTuple):
+    """Renderable duration: plain, dotted or of the tuplet."""
+    ticks: int
+    ly: str
+    tuplet: TupletType = None
+
+
+# num/den: num notes in the time of den
+TUPLETS = ((3, 2), (5, 4), (7, 4))
+BINARY_GRID = TICKS_PER_WHOLE // 128
+# lengths are snapped to 128th notes or to 32nd notes of tuplets: finer
+# tuplet grid would turn slightly late notes into short tuplets
+SNAP_GRIDS = (
+    BINARY_GRID,
+    *(TICKS_PER_WHOLE * den // (num * 32) for num, den in TUPLETS),
+)
+
+
+@functools.lru_cache(maxsize=RHYTHM_CACHE_SIZE)
+def quarters_to_ticks(quarters: float) -> int:
+    """Snap length in quarter notes to the nearest point of SNAP_GRIDS.
+
+    On equal distance the 128th grid wins.
+    """
+    ticks = quarters * TICKS_PER_QUARTER
+    best, best_error = 0, float('inf')
+    for grid in SNAP_GRIDS:
+        snapped = round(ticks / grid) * grid
+        error = abs(ticks - snapped)
+        if error < best_error:
+            best, best_error = snapped, error
+    return best
+
+
+def write_pieces(out: ty.TextIO, pieces: ty.Iterable[PieceType]) -> None:
+    """Write pieces separated by spaces.
+
+    Consecutive pieces of the same tuplet go to the single ``\\tuplet``
+    block.
+    """
+    sep = ''
+    opened: TupletType = None
+    for tuplet, text in pieces:
+        if tuplet != opened and opened is not None:
+            out.write(' }')
+        out.write(sep)
+        if tuplet != opened and tuplet is not None:
+            out.write(f'\\tuplet {tuplet[0]}/{tuplet[1]} {{ ')
+        opened = tuplet
+        out.write(text)
+        sep = ' '
+    if opened is not None:
+        out.write(' }')
+
+
+def join_pieces(pieces: ty.Iterable[PieceType]) -> str:
+    out = io.StringIO()
+    write_pieces(out, pieces)
+    return out.getvalue()
+
+
+class _DurationTable(ty.NamedTuple):
+    durations: ty.List[Duration]
+    ticks: ty.List[int]
+
+    @classmethod
+    def of(cls, durations: ty.Iterable[Duration]) -> '_DurationTable':
+        ordered = sorted(durations, key=lambda d: d.ticks)
+        return cls(ordered, [d.ticks for d in ordered])
+
+    def greedy(self, ticks: int) -> ty.Tuple[ty.List[Duration], int]:
+        """Durations, taking the longest fitting every time, and rest."""
+        out = []
+        while ticks >= self.ticks[0]:
+            duration = self.durations[bisect_right(self.ticks, ticks) - 1]
+            out.append(duration)
+            ticks -= duration.ticks
+        return out, ticks
+
+
+def _binary_durations() -> ty.Iterator[Duration]:
+    for power in range(8):
+        ticks = TICKS_PER_WHOLE >> power
+        for dots, scale in enumerate((Fraction(1), Fraction(3, 2),
+                                      Fraction(7, 4))):
+            if (ticks * scale).denominator == 1:
+                yield Duration(int(ticks * scale), f'{2**power}' + '.' * dots)
+
+
+def _tuplet_durations(num: int, den: int) -> ty.Iterator[Duration]:
+    for power in range(8):
+        ticks = Fraction(TICKS_PER_WHOLE >> power) * den / num
+        if ticks.denominator == 1:
+            yield Duration(int(ticks), f'{2**power}', (num, den))
+
+
+BINARY_DURATIONS = _DurationTable.of(_binary_durations())
+TUPLET_DURATIONS = {
+    (num, den): _DurationTable.of(_tuplet_durations(num, den))
+    for num, den in TUPLETS
+}
+# every renderable duration, sorted by length
+DURATIONS = sorted(
+    (
+        *BINARY_DURATIONS.durations, *(
+            duration for table in TUPLET_DURATIONS.values()
+            for duration in table.durations
+        )
+    ),
+    key=lambda d: d.ticks,
+)
+
+
+@functools.lru_cache(maxsize=RHYTHM_CACHE_SIZE)
+def decompose(ticks: int) -> ty.Tuple[Duration, ...]:
+    """The shortest sequence of tied durations of the length.
+
+    Plain and dotted durations come first. The part of length, which is
+    off the 128th grid, goes to the single kind of tuplet; of all
+    splits, giving whole tuplet notes, the shortest sequence wins.
+    Length, which is off every grid, is rounded to the 128th.
+    """
+    if ticks <= 0:
+        return ()
+    if ticks % BINARY_GRID == 0:
+        return tuple(BINARY_DURATIONS.greedy(ticks)[0])
+    best: ty.Optional[ty.Tuple[Duration, ...]] = None
+    for table in TUPLET_DURATIONS.values():
+        unit = table.ticks[0]
+        step = unit * BINARY_GRID // math.gcd(unit, BINARY_GRID)
+        first = next(
+            (
+                unit * k for k in range(1, step // unit)
+                if (ticks - unit * k) % BINARY_GRID == 0
+            ), None
+        )
+        if first is None:
+            continue
+        for tuplet_ticks in range(first, ticks + 1, step):
+            tuplet = table.greedy(tuplet_ticks)[0]
+            binary = BINARY_DURATIONS.greedy(ticks - tuplet_ticks)[0]
+            if best is None or len(binary) + len(tuplet) < len(best):
+                best = (*binary, *tuplet)
+    if best is not None:
+        return best
+    rounded = round(ticks / BINARY_GRID) * BINARY_GRID
+    return decompose(max(rounded, BINARY_GRID))
+
+
+def rhythm_cache_info() -> ty.Dict[str, ty.Any]:
+    """Hit/miss statistics of the rhythm caches."""
+    return {
+        'quarters_to_ticks': quarters_to_ticks.cache_info(),
+        'decompose': decompose.cache_info(),
+        'length': _interned_length.cache_info(),
+        'position': _interned_position.cache_info(),
+    }
 
 
 class Fractured:
+    """Rhythm value, stored as integer ticks of TICKS_PER_WHOLE grid."""
+    __slots__ = ('ticks', '_fraction')
 
     @property
     def fraction(self) -> Fraction:
-        raise NotImplementedError()
+        if self._fraction is None:
+            self._fraction = Fraction(self.ticks, TICKS_PER_WHOLE)
+        return self._fraction
 
-    @classmethod
-    def normalized(
-        cls, fraction: Fraction, head: ty.Tuple[Fraction, ...] = tuple()
-    ) -> ty.Tuple[Fraction, ...]:
-
-        def power_of_two(target: int) -> int:
-            if target > 1:
-                for i in range(1, int(target)):
-                    if (2**i >= target):
-                        return ty.cast(int, 2**(i - 1))
-            elif target in (1, 0):
-                return target
-            raise ValueError(f"can't resolve numerator: {target}")
-
-        num = fraction.numerator
-        den = fraction.denominator
-
-        if den == 1 or num < 5:
-            return fraction,
-        if num == power_of_two(num):
-            return fraction,
-        num_nr = power_of_two(num)
-        whole = Fraction(num_nr / den)
-        remainder = Fraction((num - num_nr) / den)
-        if remainder.numerator > 3:
-            return cls.normalized(remainder, head=tuple((*head, whole)))
-        return remainder, whole, *head
-
-    # @classmethod
-    # def normalized_duration(cls,
-    #                         fraction: Fraction) -> ty.Tuple['Length', ...]:
-    #     return (Length(fr) for fr in cls.normalized(fraction))
+    def _compare(self, other: FractionOrFractured) -> int:
+        if isinstance(other, Fractured):
+            return self.ticks - other.ticks
+        if isinstance(other, Fraction):
+            return (
+                self.ticks * other.denominator -
+                other.numerator * TICKS_PER_WHOLE
+            )
+        diff = self.fraction - other
+        return (diff > 0) - (diff < 0)
+
+    def _other_fraction(self, other: FractionOrFractured) -> Fraction:
+        if isinstance(other, Fractured):
+            return other.fraction
+        return other
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Fractured):
             return False
-        return other.fraction == self.fraction
+        return other.ticks == self.ticks
 
-    def __gt__(self, other: ty.Union[Fraction, 'Fractured']) -> bool:
-        if isinstance(other, Fractured):
-            other = other.fraction
-        return self.fraction > other
+    def __gt__(self, other: FractionOrFractured) -> bool:
+        return self._compare(other) > 0
 
-    def __lt__(self, other: ty.Union[Fraction, 'Fractured']) -> bool:
-        if isinstance(other, Fractured):
-            other = other.fraction
-        return self.fraction < other
+    def __lt__(self, other: FractionOrFractured) -> bool:
+        return self._compare(other) < 0
 
-    def __add__(self, other: ty.Union[Fraction, 'Fractured']) -> Fraction:
+    def __add__(self, other: FractionOrFractured) -> Fraction:
         if isinstance(other, Fractured):
-            other = other.fraction
+            return Fraction(self.ticks + other.ticks, TICKS_PER_WHOLE)
         return self.fraction + other
 
-    def __sub__(self, other: ty.Union[Fraction, 'Fractured']) -> Fraction:
+    def __sub__(self, other: FractionOrFractured) -> Fraction:
         if isinstance(other, Fractured):
-            other = other.fraction
+            return Fraction(self.ticks - other.ticks, TICKS_PER_WHOLE)
         return self.fraction - other
 
-    def __mul__(self, other: ty.Union[Fraction, 'Fractured']) -> Fraction:
-        if isinstance(other, Fractured):
-            other = other.fraction
-        return self.fraction * other
+    def __mul__(self, other: FractionOrFractured) -> Fraction:
+        return self.fraction * self._other_fraction(other)
 
-    def __div__(self, other: ty.Union[Fraction, 'Fractured']) -> Fraction:
-        if isinstance(other, Fractured):
-            other = other.fraction
-        return self.fraction / other
+    def __div__(self, other: FractionOrFractured) -> Fraction:
+        return self.fraction / self._other_fraction(other)
 
     def __hash__(self) -> int:
-        return hash(self.fraction)
+        return self.ticks
 
 
 class Length(Fractured, LyExpr):
-
-    def __init__(
-        self, length: ty.Union[float, Fraction], tie: bool = False
-    ) -> None:
-        """
-        Parameters
-        ----------
-        length : Union[float, Fraction]
-            if float — in quarter_notes
-        take : rpr.Take
-            Description
-        """
+    """Length of the event.
+
+    Lengths are interned: equal lengths are the same object, with
+    durations and LilyPond string computed once. So they must not be
+    changed: make the new Length instead.
+
+    Parameters
+    ----------
+    length : Union[float, Fraction]
+        if float — in quarter_notes, snapped by `quarters_to_ticks`,
+        if Fraction — of whole note
+    tie : bool
+    """
+    __slots__ = ('tie', 'durations', 'for_ly', '_ly')
+
+    def __new__(
+        cls, length: ty.Union[float, Fraction], tie: bool = False
+    ) -> 'Length':
         if isinstance(length, Fraction):
-            length = (length.numerator / length.denominator) * 4
-        self.length = length
-        self.tie = tie
+            ticks = round(length * TICKS_PER_WHOLE)
+        else:
+            ticks = quarters_to_ticks(length)
+        return _interned_length(cls, ticks, bool(tie))
 
     def __repr__(self) -> str:
         return f'Length({self.length}={self.fraction})'
 
     @property
-    def fraction(self) -> Fraction:
-        fr = Fraction(self.length / 4).limit_denominator(128)
-        # print(fr, fr.denominator, '//', fr.numerator)
-        if fr.denominator >= 1:
-            return fr
-        return Fraction(1 / (fr.denominator // fr.numerator))
+    def length(self) -> float:
+        """Length in quarter notes."""
+        return self.ticks / TICKS_PER_QUARTER
 
-    @classmethod
-    def _ly_duration(self, fraction: Fraction) -> str:
-        num = fraction.numerator
-        den = fraction.denominator
-
-        if den == 1:
-            return f'{num}'
-        elif num == 1:
-            return f'{den}'
-        elif num == 3:
-            return f'{den//2}.'
-        elif num < 5:
-            return str(fraction)
-        raise ValueError(f'can not render duration {fraction}')
+    def pieces(
+        self,
+        head: str,
+        tie: bool = True,
+        post: str = '',
+        first: ty.Optional[str] = None,
+    ) -> ty.Tuple[PieceType, ...]:
+        """Durations after head, repeated for every duration.
 
-    @property
-    def for_ly(self) -> str:
-        norm = self.normalized(self.fraction)
-        # print(self.fraction, norm, sep=' || ')
-        out = "~".join([self._ly_duration(fr) for fr in norm])
-        if self.tie:
-            out += '~'
-        return out
+        Parameters
+        ----------
+        head : str
+            pitch, chord or rest
+        tie : bool
+            if False, durations are not tied (as rests)
+        post : str
+            post-events (articulations, dynamics...) of the first
+            duration
+        first : Optional[str]
+            head of the first duration, if it differs (forced
+            accidentals)
+        """
+        end = '~' if tie and self.tie else ''
+        first = head if first is None else first
+        if self._ly is not None:
+            return ((None, first + self._ly + post + end), )
+        if not self.durations:
+            return ((None, first + post), )
+        link = '~' if tie else ''
+        last = len(self.durations) - 1
+        return tuple(
+            (
+                d.tuplet, (head if idx else first) + d.ly +
+                ('' if idx else post) + (end if idx == last else link)
+            ) for idx, d in enumerate(self.durations)
+        )
+
+    def render(self, head: str, tie: bool = True, post: str = '') -> str:
+        """`pieces` as LilyPond code."""
+        return join_pieces(self.pieces(head, tie, post))
+
+
+@functools.lru_cache(maxsize=RHYTHM_CACHE_SIZE)
+def _interned_length(cls: ty.Type[Length], ticks: int, tie: bool) -> Length:
+    length = object.__new__(cls)
+    length.ticks = ticks
+    length.tie = tie
+    length._fraction = None
+    length.durations = decompose(ticks)
+    # the most of lengths are the single plain duration
+    single = len(length.durations) == 1 and length.durations[0].tuplet is None
+    length._ly = length.durations[0].ly if single else None
+    length.for_ly = length.render('')
+    return length
 
 
 class Position(Fractured):
+    """Position of the event in the project.
 
-    def __init__(self, ppq: float, take: rpr.Take) -> None:
-        self.ppq_position = ppq
-        self.position = round(take.ppq_to_beat(ppq), 4)
-        self.bar, self._bar_position = self._get_bar_position(take)
+    Positions are interned by (ppq, time_map) in the bounded cache, so
+    they must not be changed.
+    """
+    __slots__ = (
+        'ppq_position', 'position', 'bar', '_bar_position', 'bar_ticks',
+        '_bar_fraction'
+    )
 
-    def _get_bar_position(self, take: rpr.Take) -> ty.Tuple[int, Fraction]:
-        # measure_start = RPR.MIDI_GetPPQPos_StartOfMeasure(
-        #     take,
-        # )
-        (
-            measure,
-            _,
-            _,
-            qnMeasureStart,
-            qnMeasureend,
-        ) = RPR.TimeMap_QNToMeasures(  # type: ignore
-            rpr.Project(), round(take.ppq_to_beat(self.ppq_position)), 1.0, 0.0
-        )
-        return measure, round(self.position - qnMeasureStart, 4)
+    def __new__(cls, ppq: float, time_map: TimeMap) -> 'Position':
+        return _interned_position(cls, ppq, time_map)
 
-    @property
-    def fraction(self) -> Fraction:
-        fr = Fraction(self.position / 4).limit_denominator(128)
-        # print(fr, fr.denominator, '//', fr.numerator)
-        if fr.denominator >= 1:
-            return fr
-        return Fraction(f'1/{fr.denominator//fr.numerator}')
+    def _get_bar_position(self,
+                          time_map: TimeMap) -> ty.Tuple[int, float]:
+        measure, measure_start, _ = time_map.beat_to_measure(self.position)
+        return measure, round(self.position - measure_start, 4)
 
     @property
     def bar_position(self) -> Fraction:
-        fr = Fraction(self._bar_position / 4).limit_denominator(128)
-        # print(fr, fr.denominator, '//', fr.numerator)
-        if fr.denominator >= 1:
-            return fr
-        return Fraction(f'1/{fr.denominator//fr.numerator}')
+        if self._bar_fraction is None:
+            self._bar_fraction = Fraction(self.bar_ticks, TICKS_PER_WHOLE)
+        return self._bar_fraction
 
     def __repr__(self) -> str:
         return f'<Position bar:{self.bar}, beat:{self.bar_position}>'
 
 
+@functools.lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _interned_position(
+    cls: ty.Type[Position], ppq: float, time_map: TimeMap
+) -> Position:
+    pos = object.__new__(cls)
+    pos.ppq_position = ppq
+    pos.position = round(time_map.ppq_to_beat(ppq), 4)
+    pos.bar, pos._bar_position = pos._get_bar_position(time_map)
+    pos.ticks = quarters_to_ticks(pos.position)
+    pos.bar_ticks = quarters_to_ticks(pos._bar_position)
+    pos._fraction = None
+    pos._bar_fraction = None
+    return pos
+
+
 class Pitch(LyExpr):
+    """MIDI pitch, spelled in the key.
+
+    Pitches are interned: 128 objects per key, made at the first use of
+    the key, with LilyPond names stored on them.
+    """
+    __slots__ = ('midi_pitch', 'key', 'for_ly')
+    _interned: ty.Dict[str, ty.Tuple['Pitch', ...]] = {}
+
+    def __new__(cls, midi_pitch: int, key: str = DEFAULT_KEY) -> 'Pitch':
+        pitches = cls._interned.get(key)
+        if pitches is None:
+            pitches = cls._interned[key] = tuple(
+                cls._make(number, key, name)
+                for number, name in enumerate(key_table(key))
+            )
+        return pitches[midi_pitch]
 
-    def __init__(self, midi_pitch: int) -> None:
-        self.midi_pitch = midi_pitch
-        self.key = 'C:min'
+    @classmethod
+    def _make(cls, midi_pitch: int, key: str, name: str) -> 'Pitch':
+        pitch = object.__new__(cls)
+        pitch.midi_pitch = midi_pitch
+        pitch.key = key
+        pitch.for_ly = name
+        return pitch
 
     def __repr__(self) -> str:
         return f'<Pitch({self.midi_pitch}) for_ly: "{self.for_ly}">'
 
-    @property
-    def for_ly(self) -> str:
-        string = '{}'.format(
-            librosa.convert.midi_to_note(self.midi_pitch, unicode=False)
-        ).lower()
-        if m := re.match(r'(\w)([#b]?)(\d)', string):
-            note, acc, str_octave = m.groups()
-        if acc == '#':
-            acc = 'is'
-        elif acc == 'b':
-            acc = 's' if note in ('a', 'e') else 'es'
-        octave = int(str_octave) - 3
-        if octave == 0:
-            oct_str = ''
-        elif octave > 0:
-            oct_str = "'" * octave
-        else:
-            oct_str = "," * -octave
-        return f'{note}{acc}{oct_str}'
-
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Pitch):
             return False
@@ -236,61 +455,70 @@ class Pitch(LyExpr):
 
 
 class Notation:
+    """REAPER notation event of one note, see `notation.parse_notation`.
 
-    def __init__(self, msg: str, position: Position) -> None:
-        note_pattern = re.compile(r'NOTE\s(\d+)\s(\d+)\s')
-        self.channel, midi_pitch = re.search(  # type:ignore
-            note_pattern,
-            msg
-        ).groups()
-        # print(f'channel: "{self.channel}", pitch: "{midi_pitch}"')
-        self.pitch = Pitch(int(midi_pitch))
-        self.notation_raw = re.sub(note_pattern, '', msg)
+    Raises
+    ------
+    ValueError
+        if the event is not the event of the note
+    """
+
+    def __init__(
+        self, msg: ty.Union[str, bytes], position: Position
+    ) -> None:
+        if isinstance(msg, str):
+            msg = msg.encode('utf-8')
+        parsed = parse_notation(msg)
+        if parsed is None:
+            raise ValueError(f'not a note notation event: {msg!r}')
+        self.channel = parsed.channel
+        self.pitch = Pitch(parsed.pitch)
+        self.notation_raw = parsed.raw
         self.position = position
-        self.parced, self.unparced = self._parce()
+        self.parced = parsed.attributes
+        self.unparced = parsed.unknown
+        self.post_events = parsed.post_events
+        self.after = ''
 
     def __repr__(self) -> str:
         return 'Notation<ch: {}, pitch: {}, raw: {}> at ppq: {}'.format(
             self.channel, self.pitch, self.notation_raw, self.position
         )
 
-    def _parce(self) -> ty.Tuple[ty.Dict[str, object], ty.List[str]]:
-        tokens = re.findall(r'(\S+\s\S+)', self.notation_raw)
-        known = {
-            "voice": int,
-            "staff": int,
-            "accidental": str,
-        }
-        parced = {}
-        unparced = []
-        for token in tokens:
-            key, val = token.split(' ')
-            if key in known:
-                parced[key] = known[key](val)
-            else:
-                unparced.append(token)
-        return parced, unparced
-
     def apply_to_note(self, note: 'Note') -> None:
         note.notation = self.unparced
+        note.post_events = self.post_events
+        note.after = self.after
         for key, val in self.parced.items():
             setattr(note, key, val)
 
 
 class Note(Event):
+    __slots__ = (
+        'pitch', 'position', 'length', 'channel', 'staff', 'voice',
+        'accidental', 'notehead', 'post_events', 'after', '_notation'
+    )
 
     def __init__(
         self,
         pitch: Pitch,
         position: Position,
         length: Length,
+        channel: int = 0,
     ) -> None:
         self.pitch = pitch
         self.position = position
         self.length = length
+        self.channel = channel
         self.staff: ty.Optional[int] = None
         self.voice: ty.Optional[int] = None
-        self.accidental = ''
+        # (alteration to spell with or None, suffix), see ACCIDENTALS
+        self.accidental: ty.Optional[ty.Tuple[ty.Optional[int], str]] = None
+        # LilyPond command before the pitch, see NOTEHEADS
+        self.notehead = ''
+        self.post_events = ''
+        # post-events on the empty chord after the last tied part
+        self.after = ''
         self._notation: ty.Optional[ty.List[str]] = None
 
     @property
@@ -308,26 +536,70 @@ class Note(Event):
             f'length={self.length}',
             f'staff={self.staff}',
             f'voice={self.voice}',
-            f'accidental="{self.accidental}"',
+            f'accidental={self.accidental}',
         ]
         return f"Note({', '.join(items)})"
 
     @property
     def for_ly(self) -> str:
-        return self.pitch.for_ly + self.length.for_ly
+        return join_pieces(self.pieces())
+
+    def heads(self) -> ty.Tuple[str, str]:
+        """Pitch with notehead of every duration, and of the first one.
+
+        Only the first duration shows the forced accidental.
+        """
+        if self.accidental is None:
+            head = self.notehead + self.pitch.for_ly
+            return head, head
+        alteration, suffix = self.accidental
+        name = None
+        if alteration is not None:
+            name = spell_altered(self.pitch.midi_pitch, alteration)
+        head = self.notehead + (name or self.pitch.for_ly)
+        return head, head + suffix
+
+    def pieces(self) -> ty.Tuple[PieceType, ...]:
+        head, first = self.heads()
+        pieces = self.length.pieces(head, post=self.post_events, first=first)
+        if self.after and not self.length.tie:
+            pieces += ((None, '<>' + self.after), )
+        return pieces
 
 
 class Rest(Event):
+    """Rest; big rest is the multi-measure rest of `count` measures.
 
-    def __init__(self, length: Length, big: bool = False) -> None:
+    Parameters
+    ----------
+    length : Length
+        for big rest — length of one measure
+    big : bool
+    count : int
+    """
+    __slots__ = ('length', 'big', 'count')
+
+    def __init__(
+        self, length: Length, big: bool = False, count: int = 1
+    ) -> None:
         self.length = length
         self.big = big
+        self.count = count
 
     @property
     def for_ly(self) -> str:
-        s = self.r
-        s += re.sub('~', f' {self.r}', self.length.for_ly)
-        return s
+        if not self.big:
+            return self.length.render(self.r, tie=False)
+        durations = self.length.durations
+        if len(durations) == 1 and durations[0].tuplet is None:
+            out = self.r + durations[0].ly
+            return out if self.count == 1 else f'{out}*{self.count}'
+        return f'{self.r}1*{self.length.fraction * self.count}'
+
+    def pieces(self) -> ty.Tuple[PieceType, ...]:
+        if not self.big:
+            return self.length.pieces(self.r, tie=False)
+        return super().pieces()
 
     @property
     def r(self) -> str:
@@ -335,112 +607,245 @@ class Rest(Event):
         return s
 
     def __repr__(self) -> str:
-        return f"<Rest {self.r} {self.length}>"
-
-
-@rpr.inside_reaper()
-def parce_notes(notes: rpr.NoteList, take: rpr.Take) -> ty.List[Note]:
-    ly_notes = []
-    for note in notes:
-        note_info = note.infos
-        midi_pitch = note_info['pitch']
-        pitch = Pitch(midi_pitch)
-        pos_ppq = note_info['ppq_position']
-        end = note_info['ppq_end']
-        length = Length(take.ppq_to_beat(end) - take.ppq_to_beat(pos_ppq))
-        pos = Position(pos_ppq, take)
-        # ly_note = ly.music.items.Note()
-        # ly_note.pitch = ly.music.items.Pitch(pitch.for_ly)
-        # ly_note.duration = length.fraction.denominator
-        # print(
-        #     f'pitch: {pitch} ,as midi: {midi_pitch}',
-        #     f'pos: {pos}, in beats: {take.ppq_to_beat(pos)}',
-        #     f'end: {end}, in beats: {take.ppq_to_beat(end)}',
-        #     f'length: {end - pos} in beats: {length}',
-        #     # f'length for ly: {length.for_ly}',
-        #     sep='\n---',
-        # )
-        # ly_note = ly.music.items.Note()
-        # ly_note.pitch = note.pitch
-        # print(ly_note)
-        ly_notes.append(Note(pitch, pos, length))
-    return ly_notes
-
-
-# parced_notes = parce_notes(notes)
-
-
-@rpr.inside_reaper()
-def examine_notation(eventlist: ty.List[rpr.MIDIEventDict],
-                     take: rpr.Take) -> ty.List[Notation]:
-    notations = []
-    for event in filter(
-        lambda event: event['buf'][0:2] == [0xff, 0x0f], eventlist
-    ):
-        pos = Position(event['ppq'], take)
-        msg = event['buf'][2:]
-        # print(
-        #     f'pos: {pos}, in beats: {take.ppq_to_beat(pos)}',
-        #     f"msg: {bytes(msg)}",
-        #     sep='\n---',
-        # )
-        notations.append(Notation(str(bytes(msg), encoding='utf-8'), pos))
-    return notations
+        return f"<Rest {self.r} {self.length} x{self.count}>"
+
+
+def examine_notation(eventlist: ty.List['rpr.MIDIEventDict'],
+                     time_map: TimeMap) -> 'Notations':
+    return make_notations(
+        (
+            (event['ppq'], bytes(event['buf'][2:])) for event in eventlist
+            if list(event['buf'][0:2]) == [0xff, 0x0f]
+        ), time_map
+    )
+
+
+class Notations(ty.Sequence[Notation]):
+    """Notation events of notes, made into Notation objects on access.
+
+    Only payloads and the keys, events are matched to notes by, are
+    stored. Notation of the note is made when the bar of the note is
+    rendered and is not kept, so, as notes, notations are held only for
+    the current bar window.
+
+    Dynamics and hairpins of the track are kept as (ppq, post-event)
+    lists, one per event, until `attach_track` gives them to notes.
+
+    Parameters
+    ----------
+    events : Iterable[Tuple[float, bytes]]
+        (ppq, text) of notation events. Events, which belong neither to
+        notes nor to dynamics of the track, are skipped.
+    time_map : TimeMap
+    """
+
+    def __init__(
+        self, events: ty.Iterable[ty.Tuple[float, bytes]], time_map: TimeMap
+    ) -> None:
+        self.time_map = time_map
+        self.payloads: ty.List[bytes] = []
+        self.track: ty.List[ty.List[ty.Tuple[float, str]]] = []
+        # notation index -> post-events of the track, given to its note
+        self._added: ty.Dict[int, str] = {}
+        self._after: ty.Dict[int, str] = {}
+        ppqs, keys = [], []
+        for ppq, payload in events:
+            event_keys = notation_keys(payload)
+            if event_keys is not None:
+                self.payloads.append(payload)
+                ppqs.append(ppq)
+                keys.append(event_keys)
+                continue
+            track = parse_track_notation(payload)
+            if track is not None:
+                beat = time_map.ppq_to_beat(ppq)
+                self.track.append(
+                    [
+                        (
+                            time_map.beat_to_ppq(beat + offset)
+                            if offset else ppq, event
+                        ) for offset, event in track
+                    ]
+                )
+        self.ppqs = np.array(ppqs, dtype=np.float64)
+        self.keys = np.array(keys, dtype=np.int64).reshape(-1, 4)
+
+    def __repr__(self) -> str:
+        return f'<Notations {len(self)}>'
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    @ty.overload
+    def __getitem__(self, idx: int) -> Notation:
+        ...
+
+    @ty.overload
+    def __getitem__(self, idx: slice) -> ty.List[Notation]:
+        ...
+
+    def __getitem__(
+        self, idx: ty.Union[int, slice]
+    ) -> ty.Union[Notation, ty.List[Notation]]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        notation = Notation(
+            self.payloads[idx],
+            Position(float(self.ppqs[idx]), self.time_map)
+        )
+        notation.post_events += self._added.get(idx, '')
+        notation.after = self._after.get(idx, '')
+        return notation
+
+    def raw(self, idx: int) -> bytes:
+        """Payload of the event, without parsing it."""
+        raw = self.payloads[idx]
+        if idx in self._added:
+            raw += self._added[idx].encode()
+        if idx in self._after:
+            raw += b'<>' + self._after[idx].encode()
+        return raw
+
+    def attach_track(
+        self, table: NoteTable
+    ) -> ty.List[ty.Tuple[float, str]]:
+        """Give dynamics of the track to the notes of table.
+
+        Every dynamic goes to the first note, started at or after it;
+        end of the hairpin goes at least to the next onset. The end
+        after the last onset is put on the empty chord after the last
+        note (``d'4\\< <>\\!``). Notes without notation event get
+        the empty one. Must be called after notations are assigned to
+        the table.
+
+        Returns
+        -------
+        List[Tuple[float, str]]
+            (ppq, post-event) of dynamics after the last note
+        """
+        orphaned: ty.List[ty.Tuple[float, str]] = []
+        if not self.track:
+            return orphaned
+        starts, bounds = table.onsets()
+        column = table.data['notation']
+        ppqs, keys = [], []
+        for events in self.track:
+            group = -1
+            for ppq, event in events:
+                # half a tick for ppq, computed from the hairpin length
+                group = max(
+                    int(np.searchsorted(starts, ppq - 0.5)), group + 1
+                )
+                added = self._added
+                if group >= len(starts):
+                    if event != HAIRPIN_END:
+                        orphaned.append((ppq, event))
+                        continue
+                    group, added = len(starts) - 1, self._after
+                row = int(bounds[group])
+                idx = int(column[row])
+                if idx == NO_NOTATION:
+                    idx = len(self.payloads)
+                    channel = int(table.data['channel'][row])
+                    pitch = int(table.data['pitch'][row])
+                    self.payloads.append(f'NOTE {channel} {pitch}'.encode())
+                    ppqs.append(float(starts[group]))
+                    keys.append((channel, pitch, 0, 0))
+                    column[row] = idx
+                added[idx] = added.get(idx, '') + event
+        if ppqs:
+            self.ppqs = np.append(self.ppqs, ppqs)
+            self.keys = np.concatenate(
+                (self.keys, np.array(keys, dtype=np.int64))
+            )
+        return orphaned
+
+    @property
+    def channels(self) -> np.ndarray:
+        return self.keys[:, 0]
+
+    @property
+    def pitches(self) -> np.ndarray:
+        return self.keys[:, 1]
+
+    @property
+    def voices(self) -> np.ndarray:
+        return self.keys[:, 2]
+
+    @property
+    def staves(self) -> np.ndarray:
+        return self.keys[:, 3]
+
+
+def make_notations(
+    events: ty.Iterable[ty.Tuple[float, bytes]], time_map: TimeMap
+) -> Notations:
+    """Notations from (ppq, text) of notation events of notes."""
+    return Notations(events, time_map)
 
 
 # notations = examine_notation(take.get_midi())
 # pprint(notations)
 
 
+def attach_notations(table: NoteTable, notations: Notations) -> None:
+    """Match notation events to notes of table.
+
+    Duplicated notation events and events without note are reported
+    with NotationWarning.
+    """
+    duplicated, orphaned = table.assign_notations(
+        notations.ppqs,
+        notations.channels,
+        notations.pitches,
+        voices=notations.voices,
+        staves=notations.staves,
+    )
+    for idx in duplicated:
+        warnings.warn(
+            f'duplicated notation event: {notations[idx]}', NotationWarning
+        )
+    for idx in orphaned:
+        warnings.warn(
+            f'notation event without note: {notations[idx]}',
+            NotationWarning
+        )
+    for ppq, event in notations.attach_track(table):
+        warnings.warn(
+            f'dynamic of the track after the last note: {event} at {ppq}',
+            NotationWarning
+        )
+
+
 def make_events(
-    notes: ty.List[Note], notations: ty.List[Notation]
+    table: NoteTable,
+    notations: Notations,
+    time_map: TimeMap,
+    key: str = DEFAULT_KEY,
 ) -> EventsDictType:
-    ppqs: EventsDictType = {}
-    for note in notes:
-        if note.position not in ppqs:
-            ppqs[note.position] = []
-        notation = tuple(
-            filter(
-                lambda x: (x.position == note.position) and
-                (x.pitch == note.pitch), notations
+    """Make Note objects from rows of the table, grouped by position."""
+    events: EventsDictType = {}
+    starts, bounds = table.onsets()
+    lengths = table.durations().tolist()
+    pitches = table.data['pitch'].tolist()
+    channels = table.data['channel'].tolist()
+    note_notations = table.data['notation'].tolist()
+    for idx, start in enumerate(starts.tolist()):
+        position = Position(start, time_map)
+        notes = events.setdefault(position, [])
+        for row in range(bounds[idx], bounds[idx + 1]):
+            note = Note(
+                Pitch(pitches[row], key), position, Length(lengths[row]),
+                channels[row]
             )
-        )
-        # print(notation)
-        if notation:
-            notation[0].apply_to_note(note)
-        ppqs[note.position].append(note)
-    return ppqs
-
-
-# pprint(make_events(parced_notes, notations))
-StaffType = ty.Tuple[EventsDictType, EventsDictType]
-
-
-def slpit_by_staff(
-    parced_events: EventsDictType,
-    split_note: int = 60,
-    divided: bool = False
-) -> ty.Union[StaffType, EventsDictType]:
-    staffs: StaffType = ({}, {})
-    divided = divided
-    for time, events in parced_events.items():
-        for event in events:
-            if event.staff:
-                idx = event.staff - 1
-                divided = True
-            elif event.pitch.midi_pitch >= split_note:
-                idx = 0
-            else:
-                idx = 1
-            if time not in staffs[idx]:
-                staffs[idx][time] = []
-            staffs[idx][time].append(event)
-    if not divided:
-        return parced_events
-    return staffs
+            if note_notations[row] != NO_NOTATION:
+                notations[note_notations[row]].apply_to_note(note)
+            notes.append(note)
+    return events
 
 
 class Chord(Event):
+    __slots__ = ('length', 'notes')
 
     def __init__(self, length: Length, *notes: Note) -> None:
         self.length = length
@@ -459,9 +864,25 @@ class Chord(Event):
 
     @property
     def for_ly(self) -> str:
-        return '<{}>{}'.format(
-            ' '.join(n.pitch.for_ly for n in self.notes), self.length.for_ly
+        return join_pieces(self.pieces())
+
+    def pieces(self) -> ty.Tuple[PieceType, ...]:
+        post_events: ty.List[str] = []
+        after: ty.List[str] = []
+        for note in self.notes:
+            if note.post_events and note.post_events not in post_events:
+                post_events.append(note.post_events)
+            if note.after and note.after not in after:
+                after.append(note.after)
+        heads, firsts = zip(*(note.heads() for note in self.notes))
+        pieces = self.length.pieces(
+            '<{}>'.format(' '.join(heads)),
+            post=''.join(post_events),
+            first='<{}>'.format(' '.join(firsts)),
         )
+        if after and not self.length.tie:
+            pieces += ((None, '<>' + ''.join(after)), )
+        return pieces
 
 
 class Music(LyExpr):
@@ -496,16 +917,27 @@ class Music(LyExpr):
     def __repr__(self) -> str:
         return f'<Music {self._music[:]}>'
 
+    def events(self) -> ty.Iterable[Event]:
+        return self._music
+
+    def write(self, out: ty.TextIO) -> None:
+        write_pieces(
+            out, (piece for event in self.events() for piece in event.pieces())
+        )
+
     @property
     def for_ly(self) -> str:
-        return " ".join([m.for_ly for m in self._music])
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
 
 
 class MusicList(Music):
 
-    @property
-    def for_ly(self) -> str:
-        return f"{{{' '.join([m.for_ly for m in self._music])}}}"
+    def write(self, out: ty.TextIO) -> None:
+        out.write('{')
+        super().write(out)
+        out.write('}')
 
 
 class ClefChange(Event):
@@ -530,17 +962,28 @@ class Staff(MusicList):
         self.staff_expr = 'Staff'
         self.clef = clef
 
-    @property
-    def for_ly(self) -> str:
-        list_ = ' '.join([m.for_ly for m in self._music])
-        return f"\\new {self.staff_expr} {{{self.clef.for_ly} {list_}}}"
+    def write(self, out: ty.TextIO) -> None:
+        out.write(f'\\new {self.staff_expr} {{')
+        self.clef.write(out)
+        out.write(' ')
+        Music.write(self, out)
+        out.write('}')
 
 
-StaffGroup_template = """\
-\\new {staff_expr} <<
-{contents}
->>
-"""
+class StaffStream(Staff):
+    """Staff, which takes events from iterator only while being written.
+
+    Can be written only once.
+    """
+
+    def __init__(
+        self, events: ty.Iterable[Event], clef: ClefChange = ClefChange()
+    ) -> None:
+        super().__init__(clef=clef)
+        self._events = events
+
+    def events(self) -> ty.Iterable[Event]:
+        return self._events
 
 
 class StaffGroup(Staff):
@@ -550,21 +993,44 @@ class StaffGroup(Staff):
         super().__init__(*staves)
         self.staff_expr = 'PianoStaff'
 
-    @property
-    def for_ly(self) -> str:
-        return StaffGroup_template.format(
-            staff_expr=self.staff_expr,
-            contents=f"\n".join((m.for_ly for m in self._music))
-        )
+    def write(self, out: ty.TextIO) -> None:
+        out.write(f'\\new {self.staff_expr} <<\n')
+        sep = ''
+        for staff in self._music:
+            out.write(sep)
+            staff.write(out)
+            sep = '\n'
+        out.write('\n>>\n')
 
 
 class Voice(MusicList):
 
     def __init__(self, *events: Event) -> None:
         super().__init__(*events)
+        self.end: ty.Optional[Fraction] = None
+
+    def build_music(
+        self,
+        events: EventsDictType,
+        start: ty.Optional[Fraction] = None,
+        end: ty.Optional[Fraction] = None,
+    ) -> Music:
+        """Build music from events.
 
-    def build_music(self, events: EventsDictType) -> Music:
+        Parameters
+        ----------
+        events : EventsDictType
+        start : Optional[Fraction]
+            position, the music starts from. If None — music starts
+            from the first bar.
+        end : Optional[Fraction]
+            position, the music is filled with rests up to.
+        """
         music = self._music
+        if not events:
+            if start is not None and end is not None and end > start:
+                music.append(Rest(Length(end - start)))
+            return music
         first_pos = None
         last_pos = tuple(events.keys())[0]
         last_length = Length(0)
@@ -572,35 +1038,33 @@ class Voice(MusicList):
             if first_pos is None:
                 first_pos = pos
                 last_pos = pos
-                if pos.bar > 0:
-                    music.extend(
-                        [Rest(length=Length(4), big=True)] * (pos.bar - 1)
-                    )
+                if start is not None:
+                    if pos > start:
+                        music.append(Rest(Length(pos - start)))
+                elif pos.bar > 0:
+                    if pos.bar > 1:
+                        music.append(
+                            Rest(Length(4), big=True, count=pos.bar - 1)
+                        )
                     if pos.bar_position > 0:
                         music.append(Rest(Length(pos.bar_position)))
 
             if pos > last_pos + last_length:
-                print(f'{pos} ({pos.fraction}) >  ({last_pos + last_length})')
                 music.append(Rest(Length(pos - (last_pos + last_length))))
             if len(notes) > 1:
-                # if VoiceSplit.check()
                 length = notes[0].length
                 event: ty.Union[Note, Chord] = Chord(length, *notes)
-                print('made chord:', event)
             else:
                 event = notes[0]
                 length = event.length
             if pos - last_pos < last_length:
-                print(f'{pos} - {last_pos} ({pos-last_pos}) < {last_length}')
                 prev = music[-1]
-                new_duration = Length(prev.length - (pos - last_pos))
                 prev.length = Length(pos - last_pos, tie=True)
                 if isinstance(prev, Chord):
                     prev = prev.notes
                 elif not isinstance(prev, tuple):
                     prev = prev,
                 if isinstance(event, Chord):
-                    print(event, prev)
                     event.extend(prev)
                 else:
                     event = Chord(length, *prev, event)
@@ -609,70 +1073,416 @@ class Voice(MusicList):
             last_length = length
             last_pos = pos
 
+        self.end = last_pos + last_length
+        if end is not None and end > self.end:
+            music.append(Rest(Length(end - self.end)))
         return music
 
 
-class VoiceSplit(Voice):
+class VoiceSplit(Event):
+    """Simultaneous voices, rendered as << { } \\ { } >>."""
 
-    def __init__(self) -> None:
-        self.voices = [[], []]
-        self._list = []
+    def __init__(self, *voices: Voice) -> None:
+        self.voices = list(voices)
 
-    def append(self, event: ty.Union[Note, Chord]) -> 'VoiceSplit':
-        self._list.append(event)
-        voice = note.voice if note.voice else 1
-        self.voices[voice].append(event)
+    def __repr__(self) -> str:
+        return f'<VoiceSplit {self.voices}>'
+
+    def write(self, out: ty.TextIO) -> None:
+        out.write('<< ')
+        sep = ''
+        for voice in self.voices:
+            out.write(sep)
+            voice.write(out)
+            sep = ' \\\\ '
+        out.write(' >>')
 
     @property
     def for_ly(self) -> str:
-        voices = []
-        for voice in self.voices:
-            voice.append(self.build_voice_music(voice).for_ly)
-        s = '\n//\n'.join(voices)
-        s = '<<\n{s}\n>>'
-        return s
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
 
-    @classmethod
-    def check(cls, note: Note) -> bool:
-        if note.voice:
-            return True
-        return False
 
-    def get_out_position(
-        self, staff: EventsDictType, start_pos: Position, take: rpr.Take
-    ) -> Position:
-        for pos, notes in staff:
-            if pos < start_pos:
+class Fragment(Event):
+    """Already rendered LilyPond code."""
+
+    def __init__(self, ly: str) -> None:
+        self.ly = ly
+
+    def __repr__(self) -> str:
+        return f'<Fragment "{self.ly}">'
+
+    @property
+    def for_ly(self) -> str:
+        return self.ly
+
+
+class FragmentCache:
+    """Bounded LRU cache of rendered bars, keyed by content hash."""
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache: ty.OrderedDict[bytes, ty.Tuple[str, SpillType]] = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, key: bytes) -> ty.Optional[ty.Tuple[str, SpillType]]:
+        try:
+            value = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._cache.move_to_end(key)
+        return value
+
+    def put(self, key: bytes, value: ty.Tuple[str, SpillType]) -> None:
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    def info(self) -> ty.Dict[str, int]:
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            maxsize=self.maxsize,
+            currsize=len(self._cache),
+        )
+
+
+BAR_CACHE = FragmentCache()
+
+
+def _bar_hash(*content: object) -> bytes:
+    return hashlib.blake2b(repr(content).encode(), digest_size=16).digest()
+
+
+def iter_bars(
+    table: NoteTable,
+    notations: Notations,
+    time_map: TimeMap,
+    key: str = DEFAULT_KEY,
+    cache: FragmentCache = BAR_CACHE,
+) -> ty.Iterator[str]:
+    """Render staff bar by bar, yielding LilyPond fragment of every bar.
+
+    Bars are walked once, together with the sorted notes. Notes, which
+    cross the barline, are cut into tied parts. Runs of empty bars are
+    skipped at once and yielded as one multi-measure rest per meter
+    (``R1*12``). Meter changes are prefixed with ``\\time``.
+
+    Every rendered bar is keyed by hash of its notes (relative to the
+    bar start), their notations, time signature, key and the notes of
+    the previous bar that sound into it. Only bars missing in cache are
+    rendered. Notes and notations are made only for the current bar, so
+    memory doesn't grow with the staff length.
+    """
+    if not len(table):
+        return
+    data = table.data
+    beats = np.round(time_map.ppq_to_beat(data['start']), 4)
+    end_beat = time_map.ppq_to_beat(float(data['end'].max()))
+    last_bar, last_bar_start, _ = time_map.beat_to_measure(end_beat)
+    if last_bar_start == end_beat:
+        last_bar -= 1
+    last_bar = max(last_bar, time_map.beat_to_measure(beats[-1])[0])
+    row = 0
+    spill: SpillType = ()
+    # LilyPond starts in 4/4
+    meter = (4, 4)
+    bar = 1
+    while bar <= last_bar:
+        if not spill:
+            next_bar = last_bar + 1
+            if row < len(beats):
+                next_bar = time_map.beat_to_measure(beats[row])[0]
+            if next_bar > bar:
+                for _, count, segment in time_map.measure_runs(
+                    bar, next_bar - 1
+                ):
+                    prefix, meter = _meter_change(
+                        meter, (segment.num, segment.denom)
+                    )
+                    rest = Rest(
+                        Length(Fraction(segment.num, segment.denom)),
+                        big=True,
+                        count=count
+                    )
+                    yield prefix + rest.for_ly
+                bar = next_bar
                 continue
+        bar_start = time_map.measure_to_beat(bar)
+        num, denom = time_map.time_signature_at(bar)
+        prefix, meter = _meter_change(meter, (num, denom))
+        bar_ticks = quarters_to_ticks(bar_start)
+        bar_length = num * TICKS_PER_WHOLE // denom
+        first = row
+        row = int(
+            np.searchsorted(
+                beats, time_map.measure_to_beat(bar + 1), side='left'
+            )
+        )
+        window = data[first:row]
+        content = tuple(
+            zip(
+                [
+                    quarters_to_ticks(beat) - bar_ticks
+                    for beat in beats[first:row].tolist()
+                ],
+                [
+                    quarters_to_ticks(ln)
+                    for ln in table._view(window).durations().tolist()
+                ],
+                *(
+                    window[name].tolist()
+                    for name in ('pitch', 'channel', 'voice', 'staff')
+                ),
+                [
+                    notations.raw(idx) if idx != NO_NOTATION else b''
+                    for idx in window['notation'].tolist()
+                ],
+            )
+        )
+        bar_hash = _bar_hash(content, num, denom, spill, key)
+        cached = cache.get(bar_hash)
+        if cached is None:
+            with stage('render_bar'):
+                cached = _render_bar(
+                    table._view(window), notations, time_map, key,
+                    bar_ticks, bar_length, spill
+                )
+            cache.put(bar_hash, cached)
+        fragment, spill = cached
+        yield prefix + fragment
+        bar += 1
+
+
+def _meter_change(
+    current: ty.Tuple[int, int], meter: ty.Tuple[int, int]
+) -> ty.Tuple[str, ty.Tuple[int, int]]:
+    """``\\time`` command if meter changes, and the new meter."""
+    if meter == current:
+        return '', meter
+    return f'\\time {meter[0]}/{meter[1]} ', meter
+
+
+def render_bars(
+    table: NoteTable,
+    notations: Notations,
+    time_map: TimeMap,
+    key: str = DEFAULT_KEY,
+    cache: FragmentCache = BAR_CACHE,
+) -> ty.List[str]:
+    """LilyPond fragments of all bars of staff. See iter_bars."""
+    return list(iter_bars(table, notations, time_map, key, cache))
+
+
+def _render_bar(
+    table: NoteTable,
+    notations: Notations,
+    time_map: TimeMap,
+    key: str,
+    bar_ticks: int,
+    bar_length: int,
+    spill: SpillType,
+) -> ty.Tuple[str, SpillType]:
+    """Render one bar, return fragment and notes sounding into next bar.
+
+    Notes of the previous bar, sounding into this one (spill), continue
+    from the bar start. Notes, crossing the bar end, are cut and tied.
+    If more than one voice sounds in the bar, every voice is rendered
+    separately inside VoiceSplit.
+    """
+    bar_start = Fraction(bar_ticks, TICKS_PER_WHOLE)
+    bar_end = Fraction(bar_ticks + bar_length, TICKS_PER_WHOLE)
+    spill_in: ty.Dict[int, ty.List[ty.Tuple[int, int, int, str]]] = {}
+    for number, pitch, channel, ticks, after in spill:
+        spill_in.setdefault(number, []).append((pitch, channel, ticks, after))
+    numbers = sorted(set(table.data['voice'].tolist()) | set(spill_in))
+    if not numbers:
+        return Rest(Length(Fraction(bar_length, TICKS_PER_WHOLE)),
+                    big=True).for_ly, ()
+    start_position: ty.Optional[Position] = None
+    voices = []
+    spill_out: ty.List[SpillPart] = []
+    for number in numbers:
+        voice = Voice()
+        rows = table.data[table.data['voice'] == number]
+        with stage('make_events'):
+            events = make_events(table._view(rows), notations, time_map, key)
+            spill_out.extend(
+                _cut_at_bar_end(events, number, bar_ticks + bar_length)
+            )
+            if number in spill_in:
+                if start_position is None:
+                    start_position = Position(
+                        time_map.beat_to_ppq(bar_ticks / TICKS_PER_QUARTER),
+                        time_map
+                    )
+                continued = []
+                for pitch, channel, ticks, after in spill_in[number]:
+                    length = Length(
+                        Fraction(min(ticks, bar_length), TICKS_PER_WHOLE),
+                        tie=ticks > bar_length
+                    )
+                    note = Note(
+                        Pitch(pitch, key), start_position, length, channel
+                    )
+                    note.after = after
+                    continued.append(note)
+                    if ticks > bar_length:
+                        spill_out.append(
+                            (number, pitch, channel, ticks - bar_length,
+                             after)
+                        )
+                events = _prepend_events(events, start_position, continued)
+        with stage('build_music'):
+            voice.build_music(events, bar_start, bar_end)
+        voices.append(voice)
+    with stage('for_ly'):
+        if len(voices) == 1:
+            fragment = Music(*voices[0][:]).for_ly
+        else:
+            fragment = VoiceSplit(*voices).for_ly
+    return fragment, tuple(spill_out)
+
+
+def _cut_at_bar_end(
+    events: EventsDictType, voice: int, bar_end: int
+) -> ty.List[SpillPart]:
+    """Shorten notes to the bar end and tie them, return the spill."""
+    spill = []
+    for position, notes in events.items():
+        for note in notes:
+            ticks = position.ticks + note.length.ticks - bar_end
+            if ticks > 0:
+                note.length = Length(
+                    Fraction(note.length.ticks - ticks, TICKS_PER_WHOLE),
+                    tie=True
+                )
+                spill.append(
+                    (
+                        voice, note.pitch.midi_pitch, note.channel, ticks,
+                        note.after
+                    )
+                )
+    return spill
 
 
-@rpr.inside_reaper()
-def item_to_ly(item: rpr.Item) -> str:
+def _prepend_events(
+    events: EventsDictType, position: Position, notes: ty.List[Note]
+) -> EventsDictType:
+    out: EventsDictType = {position: notes}
+    for pos, pos_notes in events.items():
+        if pos == position:
+            out[position] = notes + pos_notes
+        else:
+            out[pos] = pos_notes
+    return out
 
-    out = io.StringIO()
-    # printer = exp.Output_printer()
-    # printer.set_file(out)
-    # printer.dump_version("2.20.0")
-
-    take = item.active_take
-    midi = take.get_midi()
-    notes = take.notes
-    notations = examine_notation(midi, take)
-    parced_notes = parce_notes(notes, take)
-    parced_events = make_events(parced_notes, notations)
-    # pprint(parced_events)
-    staffs = slpit_by_staff(parced_events)
-    # pprint(staffs)
-    if isinstance(staffs, dict):
-        staffs_music = build_staff_music(staffs, take),
 
+def build_staff_music(
+    table: NoteTable,
+    notations: Notations,
+    time_map: TimeMap,
+    key: str = DEFAULT_KEY,
+    clef: ClefChange = ClefChange(),
+) -> Staff:
+    """Staff, rendering its bars only while being written."""
+    with stage('assign_voices'):
+        table.assign_voices()
+    fragments = iter_bars(table, notations, time_map, key)
+    return StaffStream((Fragment(f) for f in fragments if f), clef=clef)
+
+
+def source_music(source: Source, key: str = DEFAULT_KEY) -> MusicList:
+    """Music of the source, rendered lazily by StaffStream objects."""
+    with stage('time_map'):
+        time_map = source.get_time_map()
+    with stage('notations'):
+        notations = make_notations(source.get_notation_events(), time_map)
+    with stage('note_table'):
+        table = source.get_note_table(time_map.ppq_resolution)
+    with stage('attach_notations'):
+        attach_notations(table, notations)
+    with stage('split_by_staff'):
+        staffs = table.split_by_staff()
+    if len(staffs) == 1:
+        staffs_music: Staff = build_staff_music(
+            staffs[0], notations, time_map, key
+        )
     else:
         staffs_music = StaffGroup(
-            *(build_staff_music(staff, take) for staff in staffs)
+            *(
+                build_staff_music(staff, notations, time_map, key)
+                for staff in staffs
+            )
         )
-    out = MusicList(staffs_music).for_ly
+    return MusicList(staffs_music)
 
-    # ready_chords = parce_chords(parced_events)
-    # pprint(ready_chords)
 
-    return out
+def write_ly(
+    source: Source, out: ty.TextIO, key: str = DEFAULT_KEY
+) -> None:
+    """Stream music of the source to the file-like object bar by bar."""
+    music = source_music(source, key)
+    with stage('write'):
+        music.write(out)
+
+
+def write_ly_file(
+    sources: ty.Iterable[Source],
+    out: ty.TextIO,
+    key: str = DEFAULT_KEY,
+    version: str = LY_VERSION,
+) -> None:
+    """Stream complete LilyPond file with music of every source."""
+    out.write(f'\\version "{version}"\n')
+    for source in sources:
+        write_ly(source, out, key)
+        out.write('\n')
+
+
+def source_to_ly(source: Source, key: str = DEFAULT_KEY) -> str:
+    out = io.StringIO()
+    write_ly(source, out, key)
+    return out.getvalue()
+
+
+def item_to_ly(
+    item: 'rpr.Item',
+    key: str = DEFAULT_KEY,
+    report: ty.Optional[ty.Dict[str, ty.Any]] = None,
+) -> str:
+    """LilyPond music of the active take of item.
+
+    Parameters
+    ----------
+    item : rpr.Item
+    key : str
+    report : Optional[Dict[str, Any]]
+        if given, the export is profiled and the dict is filled with
+        numbers of its stages, see `profiling.Profiler.report`.
+    """
+    if report is None:
+        return source_to_ly(TakeSource(item.active_take), key)
+    with Profiler() as profiler:
+        ly = source_to_ly(TakeSource(item.active_take), key)
+    report.update(profiler.report())
+    return ly
+
+
+def ly_file(music: str, version: str = LY_VERSION) -> str:
+    """Wrap music expression into the complete LilyPond file."""
+    return f'\\version "{version}"\n{music}\n'
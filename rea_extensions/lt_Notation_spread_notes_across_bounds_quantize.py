@@ -1,33 +1,28 @@
 import typing as ty
+
+import numpy as np
 import reapy as rpr
 
+from rea_extensions.midi_codec import MidiEvents, get_midi_buffer
+from rea_extensions.write_back import write_back
+
 # editor = rpr.MIDIEditor()
 
 take = rpr.Project().selected_items[0].active_take
-midi = take.get_midi()
-filtered = ty.cast(
-    ty.Tuple[rpr.MIDIEventDict],
-    tuple(
-        filter(
-            lambda event: event['selected'] and event['buf'][0] == 144, midi
-        )
-    )
-)
+events = MidiEvents.decode(get_midi_buffer(take))
+selected = events.selected
+note_ons = selected & events.note_on_mask()
 
 
-def get_bounds(midi: ty.Iterable[rpr.MIDIEventDict]) -> ty.Tuple[float, float]:
-    start, end = float('inf'), 0
-    for event in midi:
-        if not event['selected']:
-            continue
-        if start > event['ppq']:
-            start = event['ppq']
-        if end < event['ppq']:
-            end = event['ppq']
-    return start, end
+def get_bounds(events: MidiEvents,
+               selected: np.ndarray) -> ty.Tuple[float, float]:
+    ppqs = events.ppq[selected]
+    if not len(ppqs):
+        return float('inf'), 0
+    return ppqs.min(), ppqs.max()
 
 
-start_ppq, end_ppq = get_bounds(midi)
+start_ppq, end_ppq = get_bounds(events, selected)
 
 
 def markers_to_ppq(take: rpr.Take, *ppqs: int) -> None:
@@ -39,36 +34,32 @@ def markers_to_ppq(take: rpr.Take, *ppqs: int) -> None:
 # markers_to_ppq(take, start_ppq, end_ppq)
 
 
-def spread_times(midi: ty.Tuple[rpr.MIDIEventDict], start: float,
-                 end: float) -> ty.List[int]:
-    step = (end - start) / (len(midi))
-    times = []
-    for i in range(len(midi) + 1):
-        times.append(int(start + i * step))
-    return times
+def spread_times(count: int, start: float, end: float) -> np.ndarray:
+    step = (end - start) / count
+    return (start + np.arange(count + 1) * step).astype(np.int64)
 
 
-times = spread_times(filtered, start_ppq, end_ppq)
+times = spread_times(int(note_ons.sum()), start_ppq, end_ppq)
 # markers_to_ppq(take,*times)
 
 
-def modify_list(midi: ty.List[rpr.MIDIEventDict],
-                times: ty.List[int]) -> ty.List[rpr.MIDIEventDict]:
-    modified: ty.List[rpr.MIDIEventDict] = []
-    times_on_i, times_off_i = 0, 1
-    for event_ in midi:
-        event = event_.copy()
-        if event['selected']:
-            msg = event['buf'][0]
-            if msg >= 0x90 and msg < 0xa0:
-                event['ppq'] = times[times_on_i]
-                times_on_i += 1
-            elif msg >= 0x80 and msg < 0x90:
-                event['ppq'] = times[times_off_i]
-                times_off_i += 1
-        modified.append(event)
-    return sorted(modified, key=lambda d: d['ppq'])
-
-
-modified = modify_list(midi, times)
-take.set_midi(modified)
+def modify_ppqs(
+    events: MidiEvents, note_ons: np.ndarray, times: np.ndarray
+) -> np.ndarray:
+    """Move selected notes to times, every note ends at the next time.
+
+    Note-offs are taken from the pairs of the selected note-ons, so
+    selection of note-offs doesn't matter.
+    """
+    ppqs = events.ppq.copy()
+    ons, offs = events.pair_notes()
+    chosen = note_ons[ons]
+    ons, offs = ons[chosen], offs[chosen]
+    ppqs[ons] = times[:-1]
+    closed = offs >= 0
+    ppqs[offs[closed]] = times[1:][closed]
+    return ppqs
+
+
+modified = modify_ppqs(events, note_ons, times)
+write_back(take, events, modified)
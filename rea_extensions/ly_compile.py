@@ -0,0 +1,283 @@
+"""Compile LilyPond sources concurrently, with content-addressed cache.
+
+usage: python -m rea_extensions.ly_compile [-h] [-j JOBS] [-f FORMATS]
+                                           [--lilypond LILYPOND]
+                                           [--cache CACHE] paths [paths ...]
+
+Outputs are stored under the hash of the source, the requested formats
+and the version of lilypond, so the same score is never compiled twice.
+The executable can be set by LILYPOND environment variable.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import typing as ty
+
+LILYPOND = os.environ.get('LILYPOND', 'lilypond')
+CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'rea_extensions', 'lilypond'
+)
+FORMATS = ('pdf', 'png', 'svg')
+SOURCE_NAME = 'score'
+
+
+class CompileError(RuntimeError):
+    """lilypond exited with error; `log` contains its output."""
+
+    def __init__(self, name: str, returncode: int, log: str) -> None:
+        super().__init__(f'{name}: lilypond exited with {returncode}')
+        self.name = name
+        self.returncode = returncode
+        self.log = log
+
+
+class CompileResult(ty.NamedTuple):
+    name: str
+    key: str
+    outputs: ty.Tuple[str, ...]
+    cached: bool
+    wall_time: float
+
+
+class LilypondCompiler:
+    """Pool of lilypond subprocesses.
+
+    Parameters
+    ----------
+    executable : str
+        path of lilypond (or of any program, accepting its arguments)
+    cache_dir : str
+    workers : Optional[int]
+        maximum of simultaneous processes, number of CPUs by default
+    formats : Sequence[str]
+        any of 'pdf', 'png' and 'svg'
+    """
+
+    def __init__(
+        self,
+        executable: str = LILYPOND,
+        cache_dir: str = CACHE_DIR,
+        workers: ty.Optional[int] = None,
+        formats: ty.Sequence[str] = ('pdf', ),
+    ) -> None:
+        unknown = set(formats) - set(FORMATS)
+        if unknown:
+            raise ValueError(f'unknown formats: {sorted(unknown)}')
+        self.executable = executable
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.formats = tuple(sorted(set(formats)))
+        self._version: ty.Optional[str] = None
+        self._semaphore: ty.Optional[asyncio.Semaphore] = None
+        self._version_lock: ty.Optional[asyncio.Lock] = None
+        self._running: ty.Dict[str, asyncio.Future] = {}
+
+    def __repr__(self) -> str:
+        return (
+            f'<LilypondCompiler "{self.executable}" '
+            f'workers: {self.workers} formats: {self.formats}>'
+        )
+
+    async def _run(self, *args: str,
+                   cwd: ty.Optional[str] = None) -> ty.Tuple[int, str]:
+        proc = await asyncio.create_subprocess_exec(
+            self.executable,
+            *args,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        out, _ = await proc.communicate()
+        return ty.cast(int, proc.returncode), out.decode('utf-8', 'replace')
+
+    async def version(self) -> str:
+        """First line of `lilypond --version`."""
+        if self._version_lock is None:
+            self._version_lock = asyncio.Lock()
+        async with self._version_lock:
+            if self._version is None:
+                _, out = await self._run('--version')
+                lines = out.strip().splitlines()
+                self._version = lines[0].strip() if lines else ''
+        return self._version
+
+    async def cache_key(self, source: str) -> str:
+        digest = hashlib.sha256()
+        for part in (await self.version(), ','.join(self.formats), source):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _cached_outputs(self, path: str) -> ty.Tuple[str, ...]:
+        return tuple(
+            sorted(
+                out for ext in self.formats
+                for out in glob.glob(os.path.join(path, f'*.{ext}'))
+            )
+        )
+
+    async def compile(self, source: str, name: str = SOURCE_NAME
+                      ) -> CompileResult:
+        """Compile LilyPond source or take outputs from cache.
+
+        Raises
+        ------
+        CompileError
+            if lilypond failed
+        """
+        start = time.perf_counter()
+        key = await self.cache_key(source)
+        path = os.path.join(self.cache_dir, key[:2], key)
+        if os.path.isdir(path):
+            return CompileResult(
+                name, key, self._cached_outputs(path), True,
+                time.perf_counter() - start
+            )
+        if key in self._running:
+            outputs = await asyncio.shield(self._running[key])
+            return CompileResult(
+                name, key, outputs, True, time.perf_counter() - start
+            )
+        future = asyncio.get_running_loop().create_future()
+        self._running[key] = future
+        try:
+            outputs = await self._compile(source, name, path)
+        except BaseException as e:
+            future.set_exception(e)
+            # mark as retrieved: there may be no waiters
+            future.exception()
+            raise
+        else:
+            future.set_result(outputs)
+        finally:
+            del self._running[key]
+        return CompileResult(
+            name, key, outputs, False, time.perf_counter() - start
+        )
+
+    async def _compile(self, source: str, name: str,
+                       path: str) -> ty.Tuple[str, ...]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(path))
+        try:
+            with open(
+                os.path.join(tmp, f'{SOURCE_NAME}.ly'), 'w', encoding='utf-8'
+            ) as f:
+                f.write(source)
+            async with self._semaphore:
+                for args in self._arguments():
+                    code, log = await self._run(
+                        *args, f'{SOURCE_NAME}.ly', cwd=tmp
+                    )
+                    if code:
+                        raise CompileError(name, code, log)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # the same score was compiled by another process
+                if not os.path.isdir(path):
+                    raise
+                shutil.rmtree(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return self._cached_outputs(path)
+
+    def _arguments(self) -> ty.List[ty.List[str]]:
+        """lilypond arguments, one list per run.
+
+        SVG needs its own backend, so it is compiled by separate run.
+        """
+        runs = []
+        ps_formats = [fmt for fmt in self.formats if fmt != 'svg']
+        if ps_formats:
+            runs.append([f'--formats={",".join(ps_formats)}'])
+        if 'svg' in self.formats:
+            runs.append(['-dbackend=svg'])
+        return runs
+
+    async def compile_many(
+        self, sources: ty.Iterable[ty.Tuple[str, str]]
+    ) -> ty.List[ty.Union[CompileResult, CompileError]]:
+        """Compile (name, source) pairs concurrently.
+
+        Result is in the order of sources; failed job gives CompileError
+        instead of the result.
+        """
+        tasks = [self.compile(source, name) for name, source in sources]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if not isinstance(result, (CompileResult, CompileError)):
+                raise result
+        return ty.cast(
+            ty.List[ty.Union[CompileResult, CompileError]], results
+        )
+
+
+def compile_sources(
+    sources: ty.Iterable[ty.Tuple[str, str]],
+    **kwargs: ty.Any,
+) -> ty.List[ty.Union[CompileResult, CompileError]]:
+    """Blocking wrapper of `LilypondCompiler.compile_many`.
+
+    kwargs are passed to LilypondCompiler.
+    """
+    return asyncio.run(LilypondCompiler(**kwargs).compile_many(sources))
+
+
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m rea_extensions.ly_compile',
+        description='Compile .ly files concurrently, reusing cached output.',
+    )
+    parser.add_argument('paths', nargs='+', help='.ly files')
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=None,
+        help='number of lilypond processes (default: number of CPUs)'
+    )
+    parser.add_argument(
+        '-f',
+        '--formats',
+        default='pdf',
+        help='comma separated: pdf, png, svg (default: pdf)'
+    )
+    parser.add_argument('--lilypond', default=LILYPOND, help='executable')
+    parser.add_argument('--cache', default=CACHE_DIR, help='cache folder')
+    args = parser.parse_args(argv)
+    sources = []
+    for path in args.paths:
+        with open(path, encoding='utf-8') as f:
+            sources.append((path, f.read()))
+    results = compile_sources(
+        sources,
+        executable=args.lilypond,
+        cache_dir=args.cache,
+        workers=args.jobs,
+        formats=args.formats.split(','),
+    )
+    failed = 0
+    for result in results:
+        if isinstance(result, CompileError):
+            failed += 1
+            print(result, result.log, sep='\n', file=sys.stderr)
+            continue
+        state = 'cached' if result.cached else 'compiled'
+        print(f'{result.name}: {state} in {result.wall_time:.3f}s')
+        for output in result.outputs:
+            print(f'    {output}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
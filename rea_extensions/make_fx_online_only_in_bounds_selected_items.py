@@ -1,62 +1,79 @@
+import argparse
 import reapy as rpr
+import sys
 import typing as ty
 
+from rea_extensions.envelopes import Point, square_points, sync_envelope
+from rea_extensions.fx_scheduler import IntervalType, merge_intervals
 
-def offline_fx_on_track(track: rpr.Track, on_pos: float, off_pos: float):
+
+def bypass_points(intervals: ty.Iterable[IntervalType]) -> ty.List[Point]:
+    """FX is bypassed everywhere except the intervals."""
+    return square_points(intervals, inside=0, outside=1)
+
+
+def offline_fx_on_track(
+    track: rpr.Track, intervals: ty.Iterable[IntervalType]
+):
+    points = bypass_points(intervals)
     for fx in track.fxs:
         param = fx.params['Bypass']
         env = param.envelope or param.add_envelope()
-        print(env)
-        # env = rpr.Envelope()
-        env.insert_point(
-            rpr.EnvelopePoint(
-                index=0, shape=1, tension=0, selected=False, time=0.0, value=1
-            ),
-            sort=False
-        )
-        env.insert_point(
-            rpr.EnvelopePoint(
-                index=0,
-                shape=1,
-                tension=0,
-                selected=False,
-                time=on_pos,
-                value=0
-            ),
-            sort=False
-        )
-        env.insert_point(
-            rpr.EnvelopePoint(
-                index=0,
-                shape=1,
-                tension=0,
-                selected=False,
-                time=off_pos,
-                value=1
-            ),
-            sort=True
-        )
+        deleted, inserted = sync_envelope(env, points)
+        print(f'{fx.name}: deleted {deleted}, inserted {inserted}')
 
 
-def get_bounds(pr: rpr.Project) -> ty.Tuple[float, float]:
-    left, right = (0.0, 0.0)
+def get_track_intervals(
+    pr: rpr.Project,
+    pre_roll: float = 0.0,
+    tail: float = 0.0
+) -> ty.List[ty.Tuple[rpr.Track, ty.List[IntervalType]]]:
+    """Tracks of selected items with the union of their own items.
+
+    So FX of every track are off in the gaps between its items.
+    """
+    by_track: ty.Dict[str, ty.Tuple[rpr.Track, ty.List[IntervalType]]] = {}
     for item in pr.selected_items:
-        if left > item.position or left == .0:
-            left = item.position
-        end = item.position + item.length
-        if right < end:
-            right = end
-    return left, right
+        track = item.track
+        by_track.setdefault(track.id, (track, []))[1].append(
+            (item.position, item.position + item.length)
+        )
+    return [
+        (track, merge_intervals(items, pre_roll, tail))
+        for track, items in by_track.values()
+    ]
 
 
-with rpr.inside_reaper():
-    pr = rpr.Project()
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Bypass FX of tracks outside of their selected items.'
+    )
+    parser.add_argument(
+        '-p',
+        '--pre-roll',
+        type=float,
+        default=0.0,
+        help='seconds FX are on before item (default: 0)'
+    )
+    parser.add_argument(
+        '-t',
+        '--tail',
+        type=float,
+        default=0.0,
+        help='seconds FX stay on after item (default: 0)'
+    )
+    args = parser.parse_args(argv)
+    with rpr.inside_reaper():
+        pr = rpr.Project()
+        for track, intervals in get_track_intervals(
+            pr, args.pre_roll, args.tail
+        ):
+            print(track.name, intervals)
+            offline_fx_on_track(track, intervals)
+        rpr.update_arrange()
+    return 0
 
-    left, right = get_bounds(pr)
-    print(left, right)
 
-    tracks = pr.selected_tracks
-    for track in tracks:
-        print(track.name)
-        offline_fx_on_track(track, left, right)
-    rpr.update_arrange()
+if __name__ == '__main__':
+    # REAPER runs scripts without command line
+    sys.exit(main(getattr(sys, 'argv', [''])[1:]))
@@ -0,0 +1,295 @@
+"""Codec of the packed MIDI buffer of `MIDI_GetAllEvts`/`MIDI_SetAllEvts`.
+
+Every event of the buffer is::
+
+    int32 offset  # ppq from the previous event, little endian
+    uint8 flags   # &1 selected, &2 muted, &0xF0 CC shape
+    int32 size    # size of the message
+    bytes message
+
+The buffer is read once through memoryview into numpy arrays; message
+bytes are not copied but referenced by offset. Notes are paired and
+notation events are extracted locally, without a call per note.
+"""
+import collections
+import struct
+import typing as ty
+
+import numpy as np
+
+from rea_extensions.note_table import NOTE_DTYPE, NO_NOTATION
+
+if ty.TYPE_CHECKING:
+    import reapy as rpr
+
+BufferType = ty.Union[bytes, bytearray, memoryview, str]
+
+EVENT_DTYPE = np.dtype(
+    [
+        ('ppq', np.int64),
+        ('flags', np.uint8),
+        ('offset', np.int64),
+        ('size', np.int32),
+        ('status', np.uint8),
+        ('data1', np.uint8),
+        ('data2', np.uint8),
+    ]
+)
+_header = struct.Struct('<iBi')
+_size = struct.Struct('<i')
+
+SELECTED = 1
+MUTED = 2
+
+
+def _as_bytes(buf: BufferType) -> ty.Union[bytes, bytearray, memoryview]:
+    if isinstance(buf, str):
+        # ReaScript strings carry raw bytes as latin-1 code points
+        return buf.encode('latin-1')
+    return buf
+
+
+class MidiEvents:
+    """Events of the packed MIDI buffer as numpy structured array.
+
+    Attributes
+    ----------
+    buffer : memoryview
+        the source buffer, messages are read from it on demand
+    events : np.ndarray
+        array of EVENT_DTYPE, `ppq` is absolute
+    """
+
+    def __init__(self, buffer: BufferType, events: np.ndarray) -> None:
+        self.buffer = memoryview(_as_bytes(buffer))
+        self.events = events
+
+    def __repr__(self) -> str:
+        return f'<MidiEvents events:{len(self)}>'
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    @classmethod
+    def decode(cls, buf: BufferType) -> 'MidiEvents':
+        view = memoryview(_as_bytes(buf)).cast('B')
+        end = len(view)
+        # only sizes are read in the loop, everything else is gathered
+        # by numpy from the same memory
+        unpack = _size.unpack_from
+        header_size = _header.size
+        heads = []
+        pos = 0
+        while pos + header_size <= end:
+            heads.append(pos)
+            pos += header_size + unpack(view, pos + 5)[0]
+        raw = np.frombuffer(view, dtype=np.uint8)
+        starts = np.array(heads, dtype=np.int64)
+        events = np.zeros(len(starts), dtype=EVENT_DTYPE)
+        events['ppq'] = np.cumsum(_gather_int32(raw, starts))
+        events['flags'] = raw[starts + 4]
+        events['size'] = sizes = _gather_int32(raw, starts + 5)
+        events['offset'] = offsets = starts + header_size
+        for column, shift in (('status', 0), ('data1', 1), ('data2', 2)):
+            has = sizes > shift
+            events[column][has] = raw[offsets[has] + shift]
+        return cls(view, events)
+
+    @property
+    def ppq(self) -> np.ndarray:
+        return self.events['ppq']
+
+    @property
+    def selected(self) -> np.ndarray:
+        return (self.events['flags'] & SELECTED).astype(bool)
+
+    @property
+    def muted(self) -> np.ndarray:
+        return (self.events['flags'] & MUTED).astype(bool)
+
+    def message(self, idx: int) -> memoryview:
+        event = self.events[idx]
+        start = int(event['offset'])
+        return self.buffer[start:start + int(event['size'])]
+
+    def note_on_mask(self) -> np.ndarray:
+        events = self.events
+        return ((events['status'] & 0xf0) == 0x90) & (events['data2'] > 0)
+
+    def note_off_mask(self) -> np.ndarray:
+        events = self.events
+        msg = events['status'] & 0xf0
+        return (msg == 0x80) | ((msg == 0x90) & (events['data2'] == 0))
+
+    def pair_notes(self) -> ty.Tuple[np.ndarray, np.ndarray]:
+        """Pair note-on and note-off events.
+
+        Events are walked in order; every note-off closes the earliest
+        open note of the same channel and pitch (first-in first-out).
+        Note-offs without open note are ignored. Notes without note-off
+        end at the last event.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            indices of note-on events and of their note-off events
+            (-1 if there is no note-off)
+        """
+        events = self.events
+        on_mask = self.note_on_mask()
+        idxs = np.flatnonzero(on_mask | self.note_off_mask())
+        keys = (events['status'][idxs] & 0x0f).astype(np.int64) << 7
+        keys |= events['data1'][idxs]
+        ons: ty.List[int] = []
+        closing: ty.List[int] = []
+        opened: ty.Dict[int, ty.Deque[int]] = {}
+        for idx, key, is_on in zip(
+            idxs.tolist(), keys.tolist(), on_mask[idxs].tolist()
+        ):
+            if is_on:
+                opened.setdefault(key, collections.deque()).append(len(ons))
+                ons.append(idx)
+                closing.append(-1)
+            elif opened.get(key):
+                closing[opened[key].popleft()] = idx
+        return (
+            np.array(ons, dtype=np.int64), np.array(closing, dtype=np.int64)
+        )
+
+    def notes(self) -> np.ndarray:
+        """Paired notes as array of NOTE_DTYPE, sorted by start."""
+        events = self.events
+        ons, offs = self.pair_notes()
+        last = events['ppq'][-1] if len(events) else 0
+        data = np.zeros(len(ons), dtype=NOTE_DTYPE)
+        data['start'] = events['ppq'][ons]
+        data['end'] = np.where(offs >= 0, events['ppq'][offs], last)
+        data['pitch'] = events['data1'][ons]
+        data['channel'] = events['status'][ons] & 0x0f
+        data['velocity'] = events['data2'][ons]
+        data['notation'] = NO_NOTATION
+        return data
+
+    def note_infos(self) -> ty.List[ty.Dict[str, ty.Any]]:
+        """Paired notes in the shape of `rpr.Note.infos`."""
+        data = self.notes()
+        columns = ('start', 'end', 'pitch', 'channel', 'velocity')
+        return [
+            {
+                'ppq_position': start,
+                'ppq_end': end,
+                'pitch': pitch,
+                'channel': channel,
+                'velocity': velocity,
+            } for start, end, pitch, channel, velocity in
+            zip(*(data[column].tolist() for column in columns))
+        ]
+
+    def notation_events(self) -> ty.List[ty.Tuple[int, bytes]]:
+        """(ppq, text) of REAPER notation events (0xFF 0x0F)."""
+        events = self.events
+        mask = (events['status'] == 0xff) & (events['data1'] == 0x0f)
+        out = []
+        for ppq, offset, size in zip(
+            events['ppq'][mask].tolist(), events['offset'][mask].tolist(),
+            events['size'][mask].tolist()
+        ):
+            out.append((ppq, bytes(self.buffer[offset + 2:offset + size])))
+        return out
+
+    def to_dicts(self) -> ty.List['rpr.MIDIEventDict']:
+        """Events in the shape of `rpr.Take.get_midi()`."""
+        flags = self.events['flags'].tolist()
+        return [
+            ty.cast(
+                'rpr.MIDIEventDict', {
+                    'ppq': ppq,
+                    'selected': bool(flag & SELECTED),
+                    'muted': bool(flag & MUTED),
+                    'cc_shape': flag >> 4,
+                    'buf': list(self.buffer[offset:offset + size]),
+                }
+            ) for ppq, flag, offset, size in zip(
+                self.events['ppq'].tolist(), flags,
+                self.events['offset'].tolist(), self.events['size'].tolist()
+            )
+        ]
+
+    def encode(
+        self,
+        ppq: ty.Optional[np.ndarray] = None,
+        flags: ty.Optional[np.ndarray] = None,
+    ) -> bytes:
+        """Pack events back for `MIDI_SetAllEvts`.
+
+        Parameters
+        ----------
+        ppq : Optional[np.ndarray]
+            new absolute positions of events. Events are stably sorted
+            by them.
+        flags : Optional[np.ndarray]
+            new flags of events
+        """
+        ppq = self.events['ppq'] if ppq is None else np.asarray(ppq)
+        flags = self.events['flags'] if flags is None else np.asarray(flags)
+        order = np.argsort(ppq, kind='stable')
+        ppq = np.rint(ppq[order]).astype(np.int64)
+        deltas = np.diff(ppq, prepend=0).tolist()
+        flags_list = flags[order].tolist()
+        offsets = self.events['offset'][order].tolist()
+        sizes = self.events['size'][order].tolist()
+        out = bytearray(_header.size * len(order) + sum(sizes))
+        pack = _header.pack_into
+        pos = 0
+        for delta, flag, offset, size in zip(
+            deltas, flags_list, offsets, sizes
+        ):
+            pack(out, pos, delta, flag, size)
+            pos += _header.size
+            out[pos:pos + size] = self.buffer[offset:offset + size]
+            pos += size
+        return bytes(out)
+
+
+def pack_events(events: ty.Iterable[ty.Tuple[int, int, bytes]]) -> bytes:
+    """Pack (ppq, flags, message) events into the buffer.
+
+    Events are stably sorted by ppq, as REAPER keeps them.
+    """
+    out = bytearray()
+    last = 0
+    for ppq, flags, msg in sorted(events, key=lambda event: event[0]):
+        out += _header.pack(ppq - last, flags, len(msg))
+        out += msg
+        last = ppq
+    return bytes(out)
+
+
+def _gather_int32(raw: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Little-endian int32 values, starting at given bytes of raw."""
+    idx = starts[:, None] + np.arange(4)
+    return raw[idx].copy().view('<i4')[:, 0].astype(np.int64)
+
+
+def get_midi_buffer(take: 'rpr.Take', size: int = 2**20) -> BufferType:
+    """Raw `MIDI_GetAllEvts` buffer of the take, in one call."""
+    import reapy as rpr
+    from reapy import reascript_api as RPR
+    with rpr.inside_reaper():
+        while True:
+            ok, _, buf, _ = RPR.MIDI_GetAllEvts(take.id, '', size)
+            if ok or size >= 2**30:
+                return ty.cast(BufferType, buf)
+            size *= 2
+
+
+def set_midi_buffer(take: 'rpr.Take', buf: BufferType) -> bool:
+    """Replace all events of the take with packed buffer, in one call."""
+    import reapy as rpr
+    from reapy import reascript_api as RPR
+    if not isinstance(buf, str):
+        buf = bytes(buf).decode('latin-1')
+    with rpr.inside_reaper():
+        ok = RPR.MIDI_SetAllEvts(take.id, buf, len(buf))[0]
+        RPR.MIDI_Sort(take.id)
+    return bool(ok)
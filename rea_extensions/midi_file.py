@@ -0,0 +1,227 @@
+"""Standard MIDI File reader, which doesn't need REAPER.
+
+Events are returned in the same shape as `rpr.Take.get_midi()` and notes
+in the shape of `rpr.Note.infos`, so the file can feed the same pipeline
+as the take.
+"""
+import struct
+import typing as ty
+
+from rea_extensions.time_map import TempoMarker, TimeMap
+
+EventDictType = ty.Dict[str, ty.Any]
+NoteInfoType = ty.Dict[str, ty.Any]
+
+META = 0xff
+META_TEXT_NOTATION = 0x0f
+META_END_OF_TRACK = 0x2f
+META_TEMPO = 0x51
+META_TIME_SIGNATURE = 0x58
+
+_data_length = {
+    0x80: 2,
+    0x90: 2,
+    0xa0: 2,
+    0xb0: 2,
+    0xc0: 1,
+    0xd0: 1,
+    0xe0: 2,
+}
+# system common and real-time messages, which have no place in file
+_system_length = {0xf1: 1, 0xf2: 2, 0xf3: 1}
+
+
+class MidiFileError(ValueError):
+    ...
+
+
+def _read_var_len(data: bytes, offset: int) -> ty.Tuple[int, int]:
+    value = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            return value, offset
+
+
+def _event(ppq: int, buf: ty.List[int]) -> EventDictType:
+    return {
+        'ppq': ppq,
+        'selected': False,
+        'muted': False,
+        'cc_shape': 0,
+        'buf': buf
+    }
+
+
+def parse_track(data: bytes) -> ty.List[EventDictType]:
+    """Parse MTrk chunk body into events with absolute ppq."""
+    events = []
+    offset, ppq, status = 0, 0, 0
+    while offset < len(data):
+        delta, offset = _read_var_len(data, offset)
+        ppq += delta
+        if 0xf0 < data[offset] < META and data[offset] != 0xf7:
+            if data[offset] < 0xf8:
+                status = 0
+            offset += 1 + _system_length.get(data[offset], 0)
+            continue
+        if data[offset] & 0x80:
+            status = data[offset]
+            offset += 1
+        elif not status:
+            raise MidiFileError(f'running status without status at {offset}')
+        if status == META:
+            meta_type = data[offset]
+            length, offset = _read_var_len(data, offset + 1)
+            body = data[offset:offset + length]
+            offset += length
+            if meta_type == META_END_OF_TRACK:
+                break
+            events.append(_event(ppq, [META, meta_type, *body]))
+            status = 0
+        elif status in (0xf0, 0xf7):
+            length, offset = _read_var_len(data, offset)
+            events.append(_event(ppq, [status, *data[offset:offset + length]]))
+            offset += length
+            status = 0
+        else:
+            length = _data_length[status & 0xf0]
+            body = data[offset:offset + length]
+            offset += length
+            events.append(_event(ppq, [status, *body]))
+    return events
+
+
+def pair_notes(events: ty.Iterable[EventDictType]) -> ty.List[NoteInfoType]:
+    """Pair note-on and note-off events into notes.
+
+    Overlapping notes of the same pitch and channel are closed in
+    first-in first-out order. Notes without note-off end at the last
+    event. Result is sorted by position.
+    """
+    notes: ty.List[NoteInfoType] = []
+    opened: ty.Dict[ty.Tuple[int, int], ty.List[NoteInfoType]] = {}
+    last_ppq = 0
+    for event in events:
+        buf = event['buf']
+        last_ppq = max(last_ppq, event['ppq'])
+        msg = buf[0] & 0xf0
+        if msg not in (0x80, 0x90) or buf[0] >= 0xf0:
+            continue
+        channel, pitch, velocity = buf[0] & 0x0f, buf[1], buf[2]
+        key = channel, pitch
+        if msg == 0x90 and velocity > 0:
+            note = {
+                'selected': event.get('selected', False),
+                'muted': event.get('muted', False),
+                'ppq_position': event['ppq'],
+                'ppq_end': None,
+                'channel': channel,
+                'pitch': pitch,
+                'velocity': velocity,
+            }
+            notes.append(note)
+            opened.setdefault(key, []).append(note)
+        elif opened.get(key):
+            opened[key].pop(0)['ppq_end'] = event['ppq']
+    for note in notes:
+        if note['ppq_end'] is None:
+            note['ppq_end'] = last_ppq
+    return sorted(notes, key=lambda note: note['ppq_position'])
+
+
+def time_map_from_events(
+    events: ty.Iterable[EventDictType], ppq_resolution: int
+) -> TimeMap:
+    """Build TimeMap from tempo and time-signature meta events."""
+    changes: ty.Dict[int, ty.Dict[str, ty.Any]] = {}
+    for event in events:
+        buf = event['buf']
+        if buf[0] != META or buf[1] not in (META_TEMPO, META_TIME_SIGNATURE):
+            continue
+        change = changes.setdefault(event['ppq'], {})
+        if buf[1] == META_TEMPO:
+            tempo = int.from_bytes(bytes(buf[2:5]), 'big')
+            change['bpm'] = 60_000_000 / tempo
+        else:
+            change['num'], change['denom'] = buf[2], 2**buf[3]
+    bpm = 120.0
+    markers = []
+    time, last_ppq = 0.0, 0
+    for ppq in sorted(changes):
+        time += (ppq - last_ppq) / ppq_resolution * 60 / bpm
+        last_ppq = ppq
+        change = changes[ppq]
+        bpm = change.get('bpm', bpm)
+        markers.append(
+            TempoMarker(
+                time=time,
+                qn=ppq / ppq_resolution,
+                bpm=bpm,
+                num=change.get('num', 0),
+                denom=change.get('denom', 0),
+            )
+        )
+    return TimeMap(ppq_resolution=ppq_resolution, markers=markers)
+
+
+class MidiFile:
+    """Parsed Standard MIDI File.
+
+    Attributes
+    ----------
+    ppq_resolution : int
+        ticks per quarter note from the file header
+    tracks : List[List[EventDictType]]
+        events of every track with absolute ppq
+    """
+
+    def __init__(self, data: bytes, name: str = '') -> None:
+        self.name = name
+        self.format, self.ppq_resolution, self.tracks = self._parse(data)
+
+    def __repr__(self) -> str:
+        return f'<MidiFile "{self.name}" tracks:{len(self.tracks)}>'
+
+    @classmethod
+    def read(cls, path: str) -> 'MidiFile':
+        with open(path, 'rb') as f:
+            return cls(f.read(), name=path)
+
+    @staticmethod
+    def _parse(
+        data: bytes
+    ) -> ty.Tuple[int, int, ty.List[ty.List[EventDictType]]]:
+        if data[:4] != b'MThd':
+            raise MidiFileError('not a Standard MIDI File')
+        length, = struct.unpack('>I', data[4:8])
+        fmt, n_tracks, division = struct.unpack('>HHH', data[8:14])
+        if division & 0x8000:
+            raise MidiFileError('SMPTE time division is not supported')
+        offset = 8 + length
+        tracks = []
+        while offset < len(data) and len(tracks) < n_tracks:
+            chunk_type = data[offset:offset + 4]
+            length, = struct.unpack('>I', data[offset + 4:offset + 8])
+            body = data[offset + 8:offset + 8 + length]
+            offset += 8 + length
+            if chunk_type == b'MTrk':
+                tracks.append(parse_track(body))
+        return fmt, division, tracks
+
+    def get_midi(self,
+                 track: ty.Optional[int] = None) -> ty.List[EventDictType]:
+        """Events of the track, or of all tracks merged by position."""
+        if track is not None:
+            return list(self.tracks[track])
+        merged = [event for events in self.tracks for event in events]
+        return sorted(merged, key=lambda event: event['ppq'])
+
+    def get_notes(self,
+                  track: ty.Optional[int] = None) -> ty.List[NoteInfoType]:
+        return pair_notes(self.get_midi(track))
+
+    def get_time_map(self) -> TimeMap:
+        return time_map_from_events(self.get_midi(), self.ppq_resolution)
@@ -0,0 +1,93 @@
+"""Convert Standard MIDI Files to LilyPond without REAPER.
+
+usage: python -m rea_extensions.midi_to_ly [-h] [-o OUTPUT] [-k KEY]
+                                            [-t TRACK] paths [paths ...]
+
+Every path can be .mid file or folder of them. Every file is written
+next to the source (or into OUTPUT folder) with .ly extension. Files,
+which would be written over the output of other file of the same run
+(same name in different folders), are reported as failed.
+"""
+import argparse
+import os
+import sys
+import typing as ty
+
+from rea_extensions.lilypond import ly_file, source_to_ly
+from rea_extensions.sources import MidiFileSource
+from rea_extensions.spelling import DEFAULT_KEY
+
+MIDI_EXTENSIONS = ('.mid', '.midi', '.smf')
+
+
+def find_midi_files(paths: ty.Iterable[str]) -> ty.List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(MIDI_EXTENSIONS)
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def ly_path(path: str, output_dir: ty.Optional[str] = None) -> str:
+    """Path of .ly file for .mid file."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir or os.path.dirname(path), name + '.ly')
+
+
+def convert_file(
+    path: str,
+    output_dir: ty.Optional[str] = None,
+    key: str = DEFAULT_KEY,
+    track: ty.Optional[int] = None,
+) -> str:
+    """Convert single .mid file and return path of written .ly file."""
+    out_path = ly_path(path, output_dir)
+    music = source_to_ly(MidiFileSource(path, track), key)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write(ly_file(music))
+    return out_path
+
+
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m rea_extensions.midi_to_ly',
+        description='Convert Standard MIDI Files to LilyPond.',
+    )
+    parser.add_argument('paths', nargs='+', help='.mid files or folders')
+    parser.add_argument('-o', '--output', help='folder for .ly files')
+    parser.add_argument('-k', '--key', default=DEFAULT_KEY)
+    parser.add_argument(
+        '-t', '--track', type=int, help='read only this track of files'
+    )
+    args = parser.parse_args(argv)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    failed = 0
+    written: ty.Dict[str, str] = {}
+    for path in find_midi_files(args.paths):
+        target = os.path.normcase(os.path.abspath(ly_path(path, args.output)))
+        if target in written:
+            failed += 1
+            print(
+                f'{path}: output clashes with {written[target]}, skipped',
+                file=sys.stderr
+            )
+            continue
+        written[target] = path
+        try:
+            out_path = convert_file(path, args.output, args.key, args.track)
+        except Exception as e:
+            failed += 1
+            print(f'{path}: {e}', file=sys.stderr)
+            continue
+        print(out_path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""Parser of REAPER notation events (0xFF 0x0F text meta events).
+
+Event of the note is::
+
+    NOTE <channel> <pitch> <key> <value> [<key> <value> ...]
+
+Values may be quoted (``text "dolce e legato"``). Payload is split
+once, keys are dispatched through tables, built at import: every known
+value maps to the ready LilyPond post-event, so parse and render of
+one event is linear in its length, without regular expressions.
+
+Dynamics and hairpins of the track are events of the track::
+
+    TRAC dynamic <value> [len <quarter notes>]
+
+They are parsed by `parse_track_notation` and rendered on the notes at
+and after them. Other events of the track are not parsed.
+"""
+import typing as ty
+
+# value -> LilyPond post-event
+ARTICULATIONS: ty.Dict[str, str] = {
+    'staccato': '-.',
+    'staccatissimo': '-!',
+    'accent': '->',
+    'marcato': '-^',
+    'tenuto': '--',
+    'portato': '-_',
+    'tenuto-staccato': '-_',
+    'accent-staccato': '->-.',
+    'marcato-staccato': '-^-.',
+    'accent-tenuto': '->--',
+    'fermata': '\\fermata',
+    'shortfermata': '\\shortfermata',
+    'longfermata': '\\longfermata',
+    'stopped': '-+',
+    'open': '\\open',
+    'harmonic': '\\flageolet',
+    'flageolet': '\\flageolet',
+    'upbow': '\\upbow',
+    'downbow': '\\downbow',
+    'snappizzicato': '\\snappizzicato',
+    'espressivo': '\\espressivo',
+    'thumb': '\\thumb',
+    'breath': '\\breathe',
+}
+ORNAMENTS: ty.Dict[str, str] = {
+    'trill': '\\trill',
+    'mordent': '\\mordent',
+    'invertedmordent': '\\prall',
+    'inverted-mordent': '\\prall',
+    'prall': '\\prall',
+    'turn': '\\turn',
+    'reverseturn': '\\reverseturn',
+    'inverted-turn': '\\reverseturn',
+    'prallprall': '\\prallprall',
+    'arpeggio': '\\arpeggio',
+    'glissando': '\\glissando',
+    'tremolo': ':32',
+}
+DYNAMICS: ty.Dict[str, str] = {
+    name: '\\' + name
+    for name in (
+        'ppppp', 'pppp', 'ppp', 'pp', 'p', 'mp', 'mf', 'f', 'ff', 'fff',
+        'ffff', 'fffff', 'fp', 'sf', 'sff', 'sp', 'spp', 'sfz', 'rfz',
+        'fz', 'sfp', 'sffz', 'n', 'cresc', 'decresc', 'dim'
+    )
+}
+DYNAMICS.update({'crescendo': '\\<', 'diminuendo': '\\>', 'end': '\\!'})
+HAIRPIN_END = '\\!'
+# value -> LilyPond command before the pitch
+NOTEHEADS: ty.Dict[str, str] = {
+    'normal': '',
+    'x': '\\xNote ',
+    'cross': '\\xNote ',
+    'xcircle': "\\tweak style #'xcircle ",
+    'circle-x': "\\tweak style #'xcircle ",
+    'diamond': "\\tweak style #'diamond ",
+    'harmonic': "\\tweak style #'harmonic ",
+    'triangle': "\\tweak style #'triangle ",
+    'slash': "\\tweak style #'slash ",
+    'ghost': '\\parenthesize ',
+    'parenthesized': '\\parenthesize ',
+}
+# value -> (alteration the pitch is spelled with or None, suffix)
+ACCIDENTALS: ty.Dict[str, ty.Tuple[ty.Optional[int], str]] = {
+    'doubleflat': (-2, '!'),
+    'flat': (-1, '!'),
+    'natural': (0, '!'),
+    'sharp': (1, '!'),
+    'doublesharp': (2, '!'),
+    'forced': (None, '!'),
+    'force': (None, '!'),
+    'courtesy': (None, '?'),
+    'cautionary': (None, '?'),
+    'parenthesized': (None, '?'),
+}
+
+# key -> value -> post-event, values are bytes as in the payload
+_POST_EVENTS: ty.Dict[bytes, ty.Dict[bytes, str]] = {
+    key.encode(): {
+        value.encode(): event
+        for value, event in table.items()
+    }
+    for key, table in (
+        ('articulation', ARTICULATIONS),
+        ('ornament', ORNAMENTS),
+        ('dynamic', DYNAMICS),
+        ('dynamics', DYNAMICS),
+    )
+}
+_INT_KEYS = {b'voice': 'voice', b'staff': 'staff'}
+# key -> value -> value of the note attribute, named as the key
+_ATTRIBUTES: ty.Dict[bytes, ty.Dict[bytes, object]] = {
+    b'accidental': {
+        value.encode(): item
+        for value, item in ACCIDENTALS.items()
+    },
+    b'notehead': {
+        value.encode(): item
+        for value, item in NOTEHEADS.items()
+    },
+}
+_DYNAMIC_KEYS = (b'dynamic', b'dynamics')
+_LENGTH_KEYS = (b'len', b'length')
+
+
+class ParsedNotation:
+    """Result of parsing the event of one note.
+
+    Attributes
+    ----------
+    channel, pitch : int
+    raw : str
+        payload after the note, as text
+    attributes : Dict[str, object]
+        note attributes: voice, staff, accidental (pair of
+        `ACCIDENTALS`), notehead (command of `NOTEHEADS`)
+    post_events : str
+        LilyPond post-events of the note
+    unknown : List[str]
+        "key value" pairs, the parser doesn't know
+    """
+    __slots__ = (
+        'channel', 'pitch', 'raw', 'attributes', 'post_events', 'unknown'
+    )
+
+    def __init__(self, channel: int, pitch: int, raw: str) -> None:
+        self.channel = channel
+        self.pitch = pitch
+        self.raw = raw
+        self.attributes: ty.Dict[str, object] = {}
+        self.post_events = ''
+        self.unknown: ty.List[str] = []
+
+    def __repr__(self) -> str:
+        return (
+            f'<ParsedNotation ch: {self.channel} pitch: {self.pitch} '
+            f'{self.attributes} "{self.post_events}" {self.unknown}>'
+        )
+
+
+def tokenize(payload: bytes) -> ty.List[bytes]:
+    """Split payload by whitespace; quoted values are single tokens.
+
+    Quotes are stripped, backslash escapes the next byte inside quotes.
+    """
+    if b'"' not in payload:
+        return payload.split()
+    tokens = []
+    pos, end = 0, len(payload)
+    while pos < end:
+        byte = payload[pos]
+        if byte <= 0x20:
+            pos += 1
+            continue
+        if byte != 0x22:
+            stop = pos
+            while stop < end and payload[stop] > 0x20:
+                stop += 1
+            tokens.append(payload[pos:stop])
+            pos = stop
+            continue
+        token = bytearray()
+        pos += 1
+        while pos < end and payload[pos] != 0x22:
+            if payload[pos] == 0x5c and pos + 1 < end:
+                pos += 1
+            token.append(payload[pos])
+            pos += 1
+        tokens.append(bytes(token))
+        pos += 1
+    return tokens
+
+
+def _text(value: bytes) -> str:
+    return value.decode('utf-8', 'replace')
+
+
+def _markup_string(value: bytes) -> str:
+    text = _text(value)
+    return '"{}"'.format(text.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def parse_notation(payload: bytes) -> ty.Optional[ParsedNotation]:
+    """Parse payload of the notation event (without 0xFF 0x0F).
+
+    Returns None for events, which are not events of the note.
+    """
+    head = payload.split(None, 3)
+    if len(head) < 3 or head[0] != b'NOTE':
+        return None
+    try:
+        channel, pitch = int(head[1]), int(head[2])
+    except ValueError:
+        return None
+    rest = head[3] if len(head) > 3 else b''
+    parsed = ParsedNotation(channel, pitch, _text(rest))
+    tokens = tokenize(rest)
+    post_events = []
+    for idx in range(0, len(tokens) - 1, 2):
+        key, value = tokens[idx], tokens[idx + 1]
+        table = _POST_EVENTS.get(key)
+        if table is not None:
+            for item in value.split(b','):
+                event = table.get(item)
+                if event is None:
+                    parsed.unknown.append(f'{_text(key)} {_text(item)}')
+                else:
+                    post_events.append(event)
+        elif key in _INT_KEYS:
+            try:
+                parsed.attributes[_INT_KEYS[key]] = int(value)
+            except ValueError:
+                parsed.unknown.append(f'{_text(key)} {_text(value)}')
+        elif key in _ATTRIBUTES and value in _ATTRIBUTES[key]:
+            parsed.attributes[key.decode()] = _ATTRIBUTES[key][value]
+        elif key == b'text':
+            post_events.append('^' + _markup_string(value))
+        elif key == b'fingering':
+            post_events.append('-' + _text(value))
+        else:
+            parsed.unknown.append(f'{_text(key)} {_text(value)}')
+    if len(tokens) % 2:
+        parsed.unknown.append(_text(tokens[-1]))
+    parsed.post_events = ''.join(post_events)
+    return parsed
+
+
+def notation_keys(
+    payload: bytes
+) -> ty.Optional[ty.Tuple[int, int, int, int]]:
+    """(channel, pitch, voice, staff) of the event of the note.
+
+    The rest of the event is not parsed. Voice and staff are 0 if not
+    set. Returns None for events, which are not events of the note.
+    """
+    head = payload.split(None, 3)
+    if len(head) < 3 or head[0] != b'NOTE':
+        return None
+    try:
+        channel, pitch = int(head[1]), int(head[2])
+    except ValueError:
+        return None
+    values = {b'voice': 0, b'staff': 0}
+    if len(head) > 3 and (b'voice' in head[3] or b'staff' in head[3]):
+        tokens = tokenize(head[3])
+        for idx in range(0, len(tokens) - 1, 2):
+            if tokens[idx] in values:
+                try:
+                    values[tokens[idx]] = int(tokens[idx + 1])
+                except ValueError:
+                    pass
+    return channel, pitch, values[b'voice'], values[b'staff']
+
+
+def parse_track_notation(
+    payload: bytes
+) -> ty.Optional[ty.List[ty.Tuple[float, str]]]:
+    """Dynamics and hairpins of the event of the track.
+
+    Returns
+    -------
+    Optional[List[Tuple[float, str]]]
+        (offset in quarter notes, post-event): the dynamic at 0, and
+        the end of hairpin at its length, if given. None if the event
+        is not the event of the track or has no known dynamic.
+    """
+    if not payload.startswith(b'TRAC'):
+        return None
+    tokens = tokenize(payload)
+    events: ty.List[ty.Tuple[float, str]] = []
+    length = None
+    for idx in range(1, len(tokens) - 1, 2):
+        key, value = tokens[idx], tokens[idx + 1]
+        if key in _DYNAMIC_KEYS:
+            for item in value.split(b','):
+                event = DYNAMICS.get(_text(item))
+                if event is not None:
+                    events.append((0.0, event))
+        elif key in _LENGTH_KEYS:
+            try:
+                length = float(value)
+            except ValueError:
+                pass
+    if not events:
+        return None
+    if length is not None and length > 0:
+        events.append((length, HAIRPIN_END))
+    return events
@@ -0,0 +1,200 @@
+"""Columnar storage of notes.
+
+Every note is a row of the numpy structured array instead of the set of
+Python objects. Grouping, splitting and durations are vectorized; the
+`lilypond.Note` objects are made from rows only when music is rendered.
+"""
+import typing as ty
+
+import numpy as np
+
+from rea_extensions.voices import separate_voices
+
+NoteInfoType = ty.Dict[str, ty.Any]
+
+NOTE_DTYPE = np.dtype(
+    [
+        ('start', np.float64),
+        ('end', np.float64),
+        ('pitch', np.uint8),
+        ('channel', np.uint8),
+        ('velocity', np.uint8),
+        ('voice', np.int8),
+        ('staff', np.int8),
+        ('notation', np.int32),
+    ]
+)
+NO_NOTATION = -1
+
+
+def _ppq_keys(
+    starts: np.ndarray, channels: np.ndarray, pitches: np.ndarray
+) -> np.ndarray:
+    """Pack (ppq, channel, pitch) into single int64 for matching."""
+    return (
+        np.rint(starts).astype(np.int64) << 11 |
+        channels.astype(np.int64) << 7 | pitches.astype(np.int64)
+    )
+
+
+class NoteTable:
+    """Notes of one take as structured numpy array, sorted by start.
+
+    Attributes
+    ----------
+    data : np.ndarray
+        array of NOTE_DTYPE
+    ppq_resolution : int
+        ticks per quarter note of the take
+    """
+
+    def __init__(self, data: np.ndarray, ppq_resolution: int = 960) -> None:
+        order = np.lexsort((data['pitch'], data['start']))
+        self.data = data[order]
+        self.ppq_resolution = ppq_resolution
+
+    def __repr__(self) -> str:
+        return f'<NoteTable notes:{len(self)}>'
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @classmethod
+    def from_notes(
+        cls,
+        notes: ty.Iterable[NoteInfoType],
+        ppq_resolution: int = 960
+    ) -> 'NoteTable':
+        """Make table from notes in the shape of `rpr.Note.infos`."""
+        notes = notes if isinstance(notes, ty.Sequence) else list(notes)
+        data = np.zeros(len(notes), dtype=NOTE_DTYPE)
+        for column, name in (
+            ('start', 'ppq_position'),
+            ('end', 'ppq_end'),
+            ('pitch', 'pitch'),
+            ('channel', 'channel'),
+            ('velocity', 'velocity'),
+        ):
+            data[column] = np.fromiter(
+                (note.get(name, 0) for note in notes),
+                dtype=NOTE_DTYPE[column],
+                count=len(notes)
+            )
+        data['notation'] = NO_NOTATION
+        return cls(data, ppq_resolution)
+
+    def _view(self, data: np.ndarray) -> 'NoteTable':
+        table = NoteTable.__new__(NoteTable)
+        table.data = data
+        table.ppq_resolution = self.ppq_resolution
+        return table
+
+    @property
+    def starts(self) -> np.ndarray:
+        return self.data['start']
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self.data['end']
+
+    @property
+    def pitches(self) -> np.ndarray:
+        return self.data['pitch']
+
+    def durations(self) -> np.ndarray:
+        """Lengths of all notes in quarter notes."""
+        return (self.data['end'] - self.data['start']) / self.ppq_resolution
+
+    def onsets(self) -> ty.Tuple[np.ndarray, np.ndarray]:
+        """Unique onset ppqs and the row index each onset group starts at.
+
+        Group `i` is the slice `bounds[i]:bounds[i + 1]`, the last bound
+        is the length of the table.
+        """
+        starts, first = np.unique(self.data['start'], return_index=True)
+        return starts, np.append(first, len(self.data))
+
+    def groups(self) -> ty.Iterator[ty.Tuple[float, np.ndarray]]:
+        """Iterate over (onset ppq, rows of notes, started at it)."""
+        starts, bounds = self.onsets()
+        for idx, start in enumerate(starts):
+            yield float(start), self.data[bounds[idx]:bounds[idx + 1]]
+
+    def assign_notations(
+        self,
+        starts: ty.Sequence[float],
+        channels: ty.Sequence[int],
+        pitches: ty.Sequence[int],
+        voices: ty.Optional[ty.Sequence[int]] = None,
+        staves: ty.Optional[ty.Sequence[int]] = None,
+    ) -> ty.Tuple[np.ndarray, np.ndarray]:
+        """Match notation events to notes by (ppq, channel, pitch).
+
+        The first of duplicated events is used. `voice` and `staff`
+        columns are set from the matched events, 0 means unset.
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            indices of duplicated events, indices of events without note
+        """
+        self.data['notation'] = NO_NOTATION
+        if not len(starts):
+            empty = np.array([], dtype=np.int64)
+            return empty, empty
+        keys = _ppq_keys(
+            np.asarray(starts, dtype=np.float64),
+            np.asarray(channels, dtype=np.int64),
+            np.asarray(pitches, dtype=np.int64),
+        )
+        unique_keys, first = np.unique(keys, return_index=True)
+        duplicated = np.setdiff1d(np.arange(len(keys)), first)
+        note_keys = _ppq_keys(
+            self.data['start'], self.data['channel'], self.data['pitch']
+        )
+        found = np.searchsorted(unique_keys, note_keys)
+        found[found == len(unique_keys)] = 0
+        has_notation = unique_keys[found] == note_keys
+        notation = np.where(has_notation, first[found], NO_NOTATION)
+        self.data['notation'] = notation
+        for column, values in (('voice', voices), ('staff', staves)):
+            if values is None:
+                continue
+            values = np.asarray(values, dtype=np.int8)
+            self.data[column] = np.where(
+                has_notation, values[notation], self.data[column]
+            )
+        used = np.zeros(len(unique_keys), dtype=bool)
+        used[found[has_notation]] = True
+        orphaned = first[~used]
+        return duplicated, np.sort(orphaned)
+
+    def assign_voices(self) -> int:
+        """Fill unset `voice` column, so overlapping notes are separated.
+
+        Returns
+        -------
+        int
+            number of voices
+        """
+        self.data['voice'] = separate_voices(
+            self.data['start'], self.data['end'], self.data['pitch'],
+            self.data['voice']
+        )
+        return int(self.data['voice'].max()) if len(self) else 0
+
+    def split_by_staff(self, split_note: int = 60,
+                       divided: bool = False) -> ty.Tuple['NoteTable', ...]:
+        """Split notes to upper and lower staff.
+
+        Explicit `staff` column wins, other notes are split by pitch.
+        If there is no explicit staff and `divided` is False, the table
+        is returned as single staff.
+        """
+        staff = self.data['staff']
+        if not divided and not staff.any():
+            return self,
+        upper = np.where(
+            staff > 0, staff == 1, self.data['pitch'] >= split_note
+        )
+        return self._view(self.data[upper]), self._view(self.data[~upper])
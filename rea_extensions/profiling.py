@@ -0,0 +1,200 @@
+"""Opt-in per-stage profiling of the export pipeline.
+
+Pipeline code marks its stages with `stage(name)`. While no Profiler is
+active, `stage` returns the same no-op context manager, so marks cost
+one global lookup. Inside ``with Profiler() as prof:`` every stage
+records wall time, number of entries, reapy round trips (requests of
+the distant API client) and the peak of memory allocated by Python
+inside it (tracemalloc)::
+
+    with Profiler() as prof:
+        ly = source_to_ly(source)
+    print(prof.to_json())
+
+Stages may be nested; numbers of the outer stage include the inner
+ones.
+"""
+import contextlib
+import json
+import sys
+import time
+import tracemalloc
+import typing as ty
+
+_CLIENT_MODULE = 'reapy.tools.network.client'
+
+_NULL_STAGE = contextlib.nullcontext()
+_active: ty.Optional['Profiler'] = None
+
+
+class StageStats:
+    """Accumulated numbers of one stage."""
+
+    def __init__(self) -> None:
+        self.wall = 0.0
+        self.calls = 0
+        self.round_trips = 0
+        self.peak_memory = 0
+
+    def __repr__(self) -> str:
+        return (
+            f'<StageStats wall: {self.wall:.6f} calls: {self.calls} '
+            f'round_trips: {self.round_trips} peak: {self.peak_memory}>'
+        )
+
+    def as_dict(self) -> ty.Dict[str, ty.Union[int, float]]:
+        return {
+            'wall': self.wall,
+            'calls': self.calls,
+            'round_trips': self.round_trips,
+            'peak_memory': self.peak_memory,
+        }
+
+
+class _Stage:
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> None:
+        prof = self.profiler
+        self._trips = prof.round_trips
+        if prof.memory:
+            prof._push_memory()
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc: object) -> None:
+        wall = time.perf_counter() - self._start
+        prof = self.profiler
+        stats = prof.stages.get(self.name)
+        if stats is None:
+            stats = prof.stages[self.name] = StageStats()
+        stats.wall += wall
+        stats.calls += 1
+        stats.round_trips += prof.round_trips - self._trips
+        if prof.memory:
+            stats.peak_memory = max(stats.peak_memory, prof._pop_memory())
+
+
+def stage(name: str) -> ty.ContextManager[None]:
+    """Mark the stage of pipeline for the active Profiler, if any."""
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, name)
+
+
+class Profiler:
+    """Collects stage numbers while used as context manager.
+
+    Parameters
+    ----------
+    memory : bool
+        trace peak memory of stages with tracemalloc. Tracing slows
+        Python code down several times, so wall times with memory
+        are only good for comparing stages between each other.
+    """
+
+    def __init__(self, memory: bool = True) -> None:
+        self.memory = memory
+        self.stages: ty.Dict[str, StageStats] = {}
+        self.round_trips = 0
+        self.wall = 0.0
+        self.peak_memory = 0
+        # [current memory at the stage start, peak of the stage so far]
+        self._memory_stack: ty.List[ty.List[int]] = []
+        self._previous: ty.Optional[Profiler] = None
+        self._started_tracing = False
+        self._client: ty.Optional[type] = None
+        self._request: ty.Optional[ty.Callable[..., ty.Any]] = None
+
+    def __repr__(self) -> str:
+        return f'<Profiler stages: {list(self.stages)} wall: {self.wall}>'
+
+    def __enter__(self) -> 'Profiler':
+        global _active
+        self._previous, _active = _active, self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._patch_client()
+        self._total = _Stage(self, '')
+        self._total.__enter__()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        global _active
+        self._total.__exit__()
+        total = self.stages.pop('')
+        self.wall, self.peak_memory = total.wall, total.peak_memory
+        self._unpatch_client()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        _active = self._previous
+
+    def stage(self, name: str) -> ty.ContextManager[None]:
+        return _Stage(self, name)
+
+    def report(self) -> ty.Dict[str, ty.Any]:
+        """Numbers of the whole run and of every stage.
+
+        Times are in seconds, memory in bytes.
+        """
+        return {
+            'wall': self.wall,
+            'round_trips': self.round_trips,
+            'peak_memory': self.peak_memory,
+            'stages': {
+                name: stats.as_dict()
+                for name, stats in self.stages.items()
+            },
+        }
+
+    def to_json(self, indent: ty.Optional[int] = 2) -> str:
+        return json.dumps(self.report(), indent=indent)
+
+    def _push_memory(self) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory_stack:
+            outer = self._memory_stack[-1]
+            outer[1] = max(outer[1], peak)
+        tracemalloc.reset_peak()
+        self._memory_stack.append([current, current])
+
+    def _pop_memory(self) -> int:
+        _, peak = tracemalloc.get_traced_memory()
+        start, stage_peak = self._memory_stack.pop()
+        stage_peak = max(stage_peak, peak)
+        if self._memory_stack:
+            outer = self._memory_stack[-1]
+            outer[1] = max(outer[1], stage_peak)
+        return stage_peak - start
+
+    def _patch_client(self) -> None:
+        """Count requests of reapy client to REAPER.
+
+        Inside REAPER there is no client, and round trips stay zero.
+        The client is looked up, not imported: importing reapy connects
+        to REAPER, and whoever passes reapy objects has imported it.
+        """
+        module = sys.modules.get(_CLIENT_MODULE)
+        if module is None:
+            return
+        client_cls = module.Client
+        request = client_cls.request
+
+        def counted(client: ty.Any, *args: ty.Any,
+                    **kwargs: ty.Any) -> ty.Any:
+            self.round_trips += 1
+            return request(client, *args, **kwargs)
+
+        self._client = client_cls
+        self._request = request
+        client_cls.request = counted
+
+    def _unpatch_client(self) -> None:
+        if self._client is not None and self._request is not None:
+            self._client.request = self._request
+            self._client = None
+            self._request = None
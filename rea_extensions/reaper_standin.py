@@ -0,0 +1,1052 @@
+"""Local stand-in of REAPER for the reapy distant API.
+
+The server speaks the reapy wire protocol (web interface for the port
+discovery and length-prefixed JSON requests), so scripts run against it
+with the usual ``import reapy`` — without REAPER. The project lives in
+memory; the subset of ReaScript the scripts of this package use is
+implemented (see `StandInAPI`), together with the reapy methods which
+are executed on the REAPER side.
+
+Every request can be delayed by the injected latency, and requests are
+counted per function, so the number of round trips and the time they
+take can be measured on any machine::
+
+    server = StandInServer(demo_project(), latency=0.001)
+    server.start()
+    import reapy  # connects to the stand-in
+    ...
+    print(server.stats())
+
+Ports are the reapy defaults, so REAPER itself must not be running.
+Tempo is constant between markers (linear tempo is not simulated).
+
+usage: python -m rea_extensions.reaper_standin [-h] [-p PORT] [-w WEB_PORT]
+                                               [-l LATENCY] [-n NOTES]
+"""
+import argparse
+import collections
+import hashlib
+import http.server
+import json
+import math
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import traceback
+import typing as ty
+
+from bisect import bisect_right
+
+REAPY_SERVER_PORT = 2308
+WEB_INTERFACE_PORT = 2309
+NULL_ID = '0x0000000000000000'
+
+_header = struct.Struct('<iBi')
+_length = struct.Struct('<Q')
+
+# ppq, flags, message
+EventType = ty.List[ty.Any]
+
+
+class StandInError(Exception):
+    ...
+
+
+class Ref:
+    """reapy object, as it is sent over the wire.
+
+    Not a NamedTuple: json would encode it as plain list.
+    """
+
+    def __init__(
+        self, cls: str, args: ty.List[ty.Any], kwargs: ty.Dict[str, ty.Any]
+    ) -> None:
+        self.cls = cls
+        self.args = args
+        self.kwargs = kwargs
+
+    def __repr__(self) -> str:
+        return f'<Ref {self.cls} {self.args} {self.kwargs}>'
+
+    @property
+    def id(self) -> ty.Any:
+        return self.args[0] if self.args else None
+
+    def to_dict(self) -> ty.Dict[str, ty.Any]:
+        return {
+            '__reapy__': True,
+            'class': self.cls,
+            'args': self.args,
+            'kwargs': self.kwargs
+        }
+
+
+class Marker(ty.NamedTuple):
+    time: float
+    qn: float
+    bpm: float
+    num: int = 0
+    denom: int = 0
+    linear: bool = False
+
+
+class Envelope:
+
+    def __init__(self) -> None:
+        # time, value, shape, tension, selected
+        self.points: ty.List[ty.List[ty.Any]] = []
+
+
+class FX:
+
+    def __init__(self, name: str, params: ty.Sequence[str]) -> None:
+        self.name = name
+        self.params = [[param, 0.0] for param in params]
+        self.envelopes: ty.Dict[int, Envelope] = {}
+        self.offline = False
+
+
+class Take:
+
+    def __init__(
+        self, item: 'Item', name: str, buffer: bytes, ppq: int
+    ) -> None:
+        self.item = item
+        self.name = name
+        self.ppq = ppq
+        self.events = unpack_buffer(buffer)
+
+    @property
+    def events(self) -> ty.List[EventType]:
+        return self._events
+
+    @events.setter
+    def events(self, events: ty.List[EventType]) -> None:
+        self._events = events
+        self._pairs: ty.Optional[ty.List[ty.List[int]]] = None
+
+    def note_pairs(self) -> ty.List[ty.List[int]]:
+        """`_note_pairs` of events, kept until events are replaced.
+
+        As in REAPER, note indices are stable until the take is sorted,
+        so MIDI_SetNote doesn't walk the whole take.
+        """
+        if self._pairs is None:
+            self._pairs = _note_pairs(self._events)
+        return self._pairs
+
+
+class Item:
+
+    def __init__(
+        self, track: 'Track', position: float, length: float, selected: bool
+    ) -> None:
+        self.track = track
+        self.position = position
+        self.length = length
+        self.selected = selected
+        self.takes: ty.List[Take] = []
+        self.active = 0
+
+
+class Track:
+
+    def __init__(self, name: str, selected: bool) -> None:
+        self.name = name
+        self.selected = selected
+        self.items: ty.List[Item] = []
+        self.fxs: ty.List[FX] = []
+
+    def add_midi_item(
+        self,
+        position: float,
+        length: float,
+        buffer: bytes = b'',
+        name: str = '',
+        selected: bool = False,
+        ppq: int = 960,
+    ) -> Item:
+        """Item with one MIDI take, `buffer` is packed as MIDI_GetAllEvts."""
+        item = Item(self, position, length, selected)
+        item.takes.append(Take(item, name, buffer, ppq))
+        self.items.append(item)
+        return item
+
+    def add_fx(
+        self, name: str, params: ty.Sequence[str] = ('Bypass', )
+    ) -> FX:
+        fx = FX(name, params)
+        self.fxs.append(fx)
+        return fx
+
+
+class Project:
+    """In-memory project: tracks, tempo markers and transport."""
+
+    def __init__(
+        self,
+        bpm: float = 120.0,
+        time_signature: ty.Tuple[int, int] = (4, 4),
+    ) -> None:
+        self.bpm = bpm
+        self.time_signature = time_signature
+        self.tracks: ty.List[Track] = []
+        self.markers: ty.List[Marker] = []
+        self.state_count = 0
+        self.cursor = 0.0
+        self.play_state = 0
+        self.play_position = 0.0
+
+    def add_track(self, name: str = '', selected: bool = False) -> Track:
+        track = Track(name, selected)
+        self.tracks.append(track)
+        return track
+
+    def add_marker(
+        self, qn: float, bpm: float, num: int = 0, denom: int = 0
+    ) -> Marker:
+        """Tempo/time signature marker at QN, its time is computed."""
+        marker = Marker(self.qn_to_time(qn), qn, bpm, num, denom)
+        self.markers.append(marker)
+        self.markers.sort(key=lambda m: m.qn)
+        return marker
+
+    @property
+    def items(self) -> ty.List[Item]:
+        return [item for track in self.tracks for item in track.items]
+
+    def _tempo_at_qn(self, qn: float) -> ty.Tuple[float, float, float]:
+        idx = bisect_right([m.qn for m in self.markers], qn) - 1
+        if idx < 0:
+            return 0.0, 0.0, self.bpm
+        marker = self.markers[idx]
+        return marker.time, marker.qn, marker.bpm
+
+    def qn_to_time(self, qn: float) -> float:
+        start_time, start_qn, bpm = self._tempo_at_qn(qn)
+        return start_time + (qn - start_qn) * 60 / bpm
+
+    def time_to_qn(self, time: float) -> float:
+        idx = bisect_right([m.time for m in self.markers], time) - 1
+        if idx < 0:
+            return time * self.bpm / 60
+        marker = self.markers[idx]
+        return marker.qn + (time - marker.time) * marker.bpm / 60
+
+    def meters(self) -> ty.List[ty.Tuple[float, int, int, int]]:
+        """(qn, first measure, num, denom) of every meter segment."""
+        num, denom = self.time_signature
+        meters = [(0.0, 1, num, denom)]
+        for marker in self.markers:
+            if not marker.num:
+                continue
+            qn, measure, num, denom = meters[-1]
+            passed = (marker.qn - qn) / (num * 4 / denom)
+            measure += int(math.ceil(round(passed, 6)))
+            if marker.qn == qn:
+                meters[-1] = (qn, meters[-1][1], marker.num, marker.denom)
+            else:
+                meters.append((marker.qn, measure, marker.num, marker.denom))
+        return meters
+
+    def qn_to_measure(self, qn: float) -> ty.Tuple[int, float, float]:
+        meters = self.meters()
+        idx = max(bisect_right([m[0] for m in meters], qn) - 1, 0)
+        start, measure, num, denom = meters[idx]
+        length = num * 4 / denom
+        passed = int(math.floor(round((qn - start) / length, 6)))
+        start += passed * length
+        return measure + passed, start, start + length
+
+    def time_signature_at(self, qn: float) -> ty.Tuple[int, int, float]:
+        meters = self.meters()
+        idx = max(bisect_right([m[0] for m in meters], qn) - 1, 0)
+        return meters[idx][2], meters[idx][3], self._tempo_at_qn(qn)[2]
+
+
+def unpack_buffer(buffer: bytes) -> ty.List[EventType]:
+    events, pos, ppq = [], 0, 0
+    while pos + _header.size <= len(buffer):
+        offset, flags, size = _header.unpack_from(buffer, pos)
+        pos += _header.size
+        ppq += offset
+        events.append([ppq, flags, bytes(buffer[pos:pos + size])])
+        pos += size
+    return events
+
+
+def pack_buffer(events: ty.Iterable[EventType]) -> bytes:
+    out, last = bytearray(), 0
+    for ppq, flags, msg in events:
+        out += _header.pack(ppq - last, flags, len(msg))
+        out += msg
+        last = ppq
+    return bytes(out)
+
+
+def _note_pairs(events: ty.Sequence[EventType]) -> ty.List[ty.List[int]]:
+    """[on index, off index or -1] of every note, in order of note-ons."""
+    pairs: ty.List[ty.List[int]] = []
+    opened: ty.Dict[ty.Tuple[int, int], ty.Deque[int]] = {}
+    for idx, (_, _, msg) in enumerate(events):
+        if len(msg) < 3:
+            continue
+        kind, key = msg[0] & 0xf0, (msg[0] & 0x0f, msg[1])
+        if kind == 0x90 and msg[2]:
+            opened.setdefault(key, collections.deque()).append(len(pairs))
+            pairs.append([idx, -1])
+        elif kind == 0x80 or kind == 0x90:
+            if opened.get(key):
+                pairs[opened[key].popleft()][1] = idx
+    return pairs
+
+
+class StandInAPI:
+    """ReaScript functions over the in-memory project.
+
+    Functions have ReaScript names and return values in the shape of
+    `reapy.reascript_api`. Objects are referenced by pointer strings,
+    as in REAPER.
+    """
+
+    def __init__(self, project: Project) -> None:
+        self.project = project
+        self._ids: ty.Dict[int, str] = {}
+        self._objects: ty.Dict[str, ty.Any] = {}
+
+    def names(self) -> ty.List[str]:
+        return sorted(
+            name for name in dir(self)
+            if name[0].isupper() and callable(getattr(self, name))
+        )
+
+    def pointer(self, obj: ty.Any) -> str:
+        """ReaScript id of the object."""
+        if obj is None:
+            return f'(void*){NULL_ID}'
+        key = id(obj)
+        if key not in self._ids:
+            kind = {
+                Project: 'ReaProject',
+                Track: 'MediaTrack',
+                Item: 'MediaItem',
+                Take: 'MediaItem_Take',
+                Envelope: 'TrackEnvelope',
+            }[type(obj)]
+            pointer = f'({kind}*)0x{len(self._ids) + 1:016X}'
+            self._ids[key] = pointer
+            self._objects[pointer] = obj
+        return self._ids[key]
+
+    def get(self, pointer: str) -> ty.Any:
+        try:
+            return self._objects[pointer]
+        except KeyError:
+            raise StandInError(f'invalid pointer: {pointer}')
+
+    def _changed(self) -> None:
+        self.project.state_count += 1
+
+    def _take(self, pointer: str) -> Take:
+        return ty.cast(Take, self.get(pointer))
+
+    # project
+
+    def EnumProjects(self, idx: int, fn: str,
+                     size: int) -> ty.Tuple[str, int, str, int]:
+        return self.pointer(self.project), idx, '', size
+
+    def GetProjectStateChangeCount(self, proj: str) -> int:
+        return self.project.state_count
+
+    def GetProjectTimeSignature2(self, proj: str, bpm: float,
+                                 bpi: float) -> ty.Tuple[str, float, float]:
+        return proj, self.project.bpm, float(self.project.time_signature[0])
+
+    def UpdateArrange(self) -> None:
+        ...
+
+    def GetPlayState(self) -> int:
+        return self.project.play_state
+
+    def GetPlayPosition2(self) -> float:
+        return self.project.play_position
+
+    def GetCursorPosition(self) -> float:
+        return self.project.cursor
+
+    # time map
+
+    def TimeMap_GetTimeSigAtTime(self, proj: str, time: float, *_: ty.Any
+                                 ) -> ty.Tuple[str, float, int, int, float]:
+        num, denom, bpm = self.project.time_signature_at(
+            self.project.time_to_qn(time)
+        )
+        return proj, time, num, denom, bpm
+
+    def CountTempoTimeSigMarkers(self, proj: str) -> int:
+        return len(self.project.markers)
+
+    def GetTempoTimeSigMarker(self, proj: str, idx: int,
+                              *_: ty.Any) -> ty.Tuple[ty.Any, ...]:
+        marker = self.project.markers[idx]
+        measure, start, _ = self.project.qn_to_measure(marker.qn)
+        return (
+            True, proj, idx, marker.time, measure - 1, marker.qn - start,
+            marker.bpm, marker.num, marker.denom, marker.linear
+        )
+
+    def TimeMap2_timeToQN(self, proj: str, time: float) -> float:
+        return self.project.time_to_qn(time)
+
+    def TimeMap2_QNToTime(self, proj: str, qn: float) -> float:
+        return self.project.qn_to_time(qn)
+
+    def TimeMap_QNToMeasures(self, proj: str, qn: float,
+                             *_: ty.Any) -> ty.Tuple[int, str, float, float,
+                                                     float]:
+        measure, start, end = self.project.qn_to_measure(qn)
+        return measure, proj, qn, start, end
+
+    # tracks and items
+
+    def CountTracks(self, proj: str) -> int:
+        return len(self.project.tracks)
+
+    def GetTrack(self, proj: str, idx: int) -> str:
+        tracks = self.project.tracks
+        return self.pointer(tracks[idx] if 0 <= idx < len(tracks) else None)
+
+    def CountSelectedTracks(self, proj: str) -> int:
+        return sum(1 for track in self.project.tracks if track.selected)
+
+    def GetSelectedTrack(self, proj: str, idx: int) -> str:
+        return self.pointer(
+            [track for track in self.project.tracks if track.selected][idx]
+        )
+
+    def GetTrackName(self, track: str, buf: str,
+                     size: int) -> ty.Tuple[bool, str, str, int]:
+        return True, track, self.get(track).name, size
+
+    def CountMediaItems(self, proj: str) -> int:
+        return len(self.project.items)
+
+    def GetMediaItem(self, proj: str, idx: int) -> str:
+        return self.pointer(self.project.items[idx])
+
+    def CountSelectedMediaItems(self, proj: str) -> int:
+        return sum(1 for item in self.project.items if item.selected)
+
+    def GetSelectedMediaItem(self, proj: str, idx: int) -> str:
+        return self.pointer(
+            [item for item in self.project.items if item.selected][idx]
+        )
+
+    def CountTrackMediaItems(self, track: str) -> int:
+        return len(self.get(track).items)
+
+    def GetTrackMediaItem(self, track: str, idx: int) -> str:
+        return self.pointer(self.get(track).items[idx])
+
+    def GetMediaItemInfo_Value(self, item: str, name: str) -> float:
+        obj = self.get(item)
+        values = {
+            'D_POSITION': obj.position,
+            'D_LENGTH': obj.length,
+            'B_UISEL': float(obj.selected),
+        }
+        return float(values.get(name, 0.0))
+
+    def GetMediaItemTrack(self, item: str) -> str:
+        return self.pointer(self.get(item).track)
+
+    def GetItemProjectContext(self, item: str) -> str:
+        return self.pointer(self.project)
+
+    def GetActiveTake(self, item: str) -> str:
+        obj = self.get(item)
+        return self.pointer(obj.takes[obj.active] if obj.takes else None)
+
+    def GetMediaItemNumTakes(self, item: str) -> int:
+        return len(self.get(item).takes)
+
+    def GetMediaItemTake(self, item: str, idx: int) -> str:
+        return self.pointer(self.get(item).takes[idx])
+
+    def GetMediaItemTake_Item(self, take: str) -> str:
+        return self.pointer(self._take(take).item)
+
+    def GetMediaItemTake_Track(self, take: str) -> str:
+        return self.pointer(self._take(take).item.track)
+
+    def GetTakeName(self, take: str) -> str:
+        return self._take(take).name
+
+    def TakeIsMIDI(self, take: str) -> bool:
+        return True
+
+    def ValidatePtr2(self, proj: str, pointer: str, kind: str) -> bool:
+        return pointer in self._objects
+
+    # MIDI
+
+    def _qn_offset(self, take: Take) -> float:
+        return self.project.time_to_qn(take.item.position)
+
+    def MIDI_GetProjQNFromPPQPos(self, take: str, ppq: float) -> float:
+        obj = self._take(take)
+        return self._qn_offset(obj) + ppq / obj.ppq
+
+    def MIDI_GetPPQPosFromProjQN(self, take: str, qn: float) -> float:
+        obj = self._take(take)
+        return (qn - self._qn_offset(obj)) * obj.ppq
+
+    def MIDI_GetProjTimeFromPPQPos(self, take: str, ppq: float) -> float:
+        return self.project.qn_to_time(
+            self.MIDI_GetProjQNFromPPQPos(take, ppq)
+        )
+
+    def MIDI_GetPPQPosFromProjTime(self, take: str, time: float) -> float:
+        return self.MIDI_GetPPQPosFromProjQN(
+            take, self.project.time_to_qn(time)
+        )
+
+    def MIDI_GetAllEvts(self, take: str, buf: str,
+                        size: int) -> ty.Tuple[bool, str, str, int]:
+        packed = pack_buffer(self._take(take).events)
+        if len(packed) > size:
+            return False, take, '', size
+        return True, take, packed.decode('latin-1'), size
+
+    def MIDI_SetAllEvts(self, take: str, buf: str,
+                        size: int) -> ty.Tuple[bool, str, str, int]:
+        self._take(take).events = unpack_buffer(buf.encode('latin-1'))
+        self._changed()
+        return True, take, buf, size
+
+    def MIDI_Sort(self, take: str) -> None:
+        obj = self._take(take)
+        obj.events = sorted(obj.events, key=lambda event: event[0])
+
+    def MIDI_CountEvts(self, take: str,
+                       *_: ty.Any) -> ty.Tuple[int, str, int, int, int]:
+        events = self._take(take).events
+        notes = len(_note_pairs(events))
+        ccs = sum(1 for e in events if 0xb0 <= e[2][0] < 0xf0)
+        sysex = sum(1 for e in events if e[2][0] >= 0xf0)
+        return len(events), take, notes, ccs, sysex
+
+    def MIDI_GetNote(self, take: str, idx: int,
+                     *_: ty.Any) -> ty.Tuple[ty.Any, ...]:
+        events = self._take(take).events
+        on, off = self._take(take).note_pairs()[idx]
+        ppq, flags, msg = events[on]
+        end = events[off][0] if off >= 0 else events[-1][0]
+        return (
+            True, take, idx, bool(flags & 1), bool(flags & 2), ppq, end,
+            msg[0] & 0x0f, msg[1], msg[2]
+        )
+
+    def MIDI_SetNote(
+        self, take: str, idx: int, selected: ty.Optional[bool],
+        muted: ty.Optional[bool], start: ty.Optional[float],
+        end: ty.Optional[float], chan: ty.Optional[int],
+        pitch: ty.Optional[int], vel: ty.Optional[int],
+        no_sort: ty.Optional[bool]
+    ) -> ty.Tuple[ty.Any, ...]:
+        obj = self._take(take)
+        on, off = obj.note_pairs()[idx]
+        flags = (1 if selected else 0) | (2 if muted else 0)
+        msg_on, msg_off = obj.events[on][2], obj.events[off][2]
+        obj.events[on] = [
+            int(start), flags,
+            bytes((0x90 | chan, pitch, vel)) + msg_on[3:]
+        ]
+        if off >= 0:
+            obj.events[off] = [
+                int(end), flags,
+                bytes((msg_off[0] & 0xf0 | chan, pitch)) + msg_off[2:]
+            ]
+        if not no_sort:
+            self.MIDI_Sort(take)
+        self._changed()
+        return (
+            True, take, idx, selected, muted, start, end, chan, pitch, vel,
+            no_sort
+        )
+
+    def MIDI_GetHash(self, take: str, notes_only: bool, buf: str,
+                     size: int) -> ty.Tuple[bool, str, bool, str, int]:
+        events = self._take(take).events
+        if notes_only:
+            events = [e for e in events if 0x80 <= e[2][0] < 0xa0]
+        digest = hashlib.md5(pack_buffer(events)).hexdigest()
+        return True, take, notes_only, digest, size
+
+    # FX and envelopes
+
+    def _fx(self, track: str, idx: int) -> FX:
+        return ty.cast(FX, self.get(track).fxs[idx])
+
+    def TrackFX_GetCount(self, track: str) -> int:
+        return len(self.get(track).fxs)
+
+    def TrackFX_GetFXName(self, track: str, idx: int, buf: str,
+                          size: int) -> ty.Tuple[bool, str, int, str, int]:
+        return True, track, idx, self._fx(track, idx).name, size
+
+    def TrackFX_GetNumParams(self, track: str, idx: int) -> int:
+        return len(self._fx(track, idx).params)
+
+    def TrackFX_GetParamName(
+        self, track: str, idx: int, param: int, buf: str, size: int
+    ) -> ty.Tuple[bool, str, int, int, str, int]:
+        name = self._fx(track, idx).params[param][0]
+        return True, track, idx, param, name, size
+
+    def TrackFX_GetParam(self, track: str, idx: int, param: int,
+                         *_: ty.Any) -> ty.Tuple[ty.Any, ...]:
+        value = self._fx(track, idx).params[param][1]
+        return value, track, idx, param, 0.0, 1.0
+
+    def TrackFX_SetParam(
+        self, track: str, idx: int, param: int, value: float
+    ) -> bool:
+        self._fx(track, idx).params[param][1] = value
+        self._changed()
+        return True
+
+    def TrackFX_GetOffline(self, track: str, idx: int) -> bool:
+        return self._fx(track, idx).offline
+
+    def TrackFX_SetOffline(self, track: str, idx: int, offline: bool) -> None:
+        self._fx(track, idx).offline = bool(offline)
+        self._changed()
+
+    def GetFXEnvelope(
+        self, track: str, idx: int, param: int, create: bool
+    ) -> str:
+        envelopes = self._fx(track, idx).envelopes
+        if param not in envelopes:
+            if not create:
+                return f'(TrackEnvelope*){NULL_ID}'
+            envelopes[param] = Envelope()
+            self._changed()
+        return self.pointer(envelopes[param])
+
+    def CountEnvelopePoints(self, env: str) -> int:
+        return len(self.get(env).points)
+
+    def GetEnvelopePoint(self, env: str, idx: int,
+                         *_: ty.Any) -> ty.Tuple[ty.Any, ...]:
+        time, value, shape, tension, selected = self.get(env).points[idx]
+        return True, env, idx, time, value, shape, tension, selected
+
+    def InsertEnvelopePoint(
+        self, env: str, time: float, value: float, shape: int,
+        tension: float, selected: bool, no_sort: ty.Optional[bool]
+    ) -> ty.Tuple[ty.Any, ...]:
+        points = self.get(env).points
+        points.append([time, value, shape, tension, bool(selected)])
+        if not no_sort:
+            points.sort(key=lambda point: point[0])
+        self._changed()
+        return True, env, time, value, shape, tension, selected, no_sort
+
+    def DeleteEnvelopePointEx(self, env: str, ai: int, idx: int) -> bool:
+        del self.get(env).points[idx]
+        self._changed()
+        return True
+
+    def Envelope_SortPoints(self, env: str) -> bool:
+        self.get(env).points.sort(key=lambda point: point[0])
+        return True
+
+
+class _Methods:
+    """reapy methods, which reapy executes on the REAPER side.
+
+    Names are qualified names of the methods in reapy.
+    """
+
+    def __init__(self, api: StandInAPI) -> None:
+        self.api = api
+
+    def _list(self, cls: str, ids: ty.Iterable[str]) -> ty.List[Ref]:
+        return [Ref(cls, [id_], {}) for id_ in ids]
+
+    def handlers(self) -> ty.Dict[str, ty.Callable[..., ty.Any]]:
+        api = self.api
+        return {
+            'Project._selected_items_inside': lambda p: self._list(
+                'Item', (
+                    api.GetSelectedMediaItem(p.id, i)
+                    for i in range(api.CountSelectedMediaItems(p.id))
+                )
+            ),
+            'Project._selected_tracks_inside': lambda p: self._list(
+                'Track', (
+                    api.GetSelectedTrack(p.id, i)
+                    for i in range(api.CountSelectedTracks(p.id))
+                )
+            ),
+            'Project._items_inside': lambda p: self._list(
+                'Item', (
+                    api.GetMediaItem(p.id, i)
+                    for i in range(api.CountMediaItems(p.id))
+                )
+            ),
+            'TrackList._get_items_from_slice': lambda _, key: self._list(
+                'Track', (
+                    api.pointer(track) for track in api.project.tracks[key]
+                )
+            ),
+            'Track._items_inside': lambda t: self._list(
+                'Item', (
+                    api.GetTrackMediaItem(t.id, i)
+                    for i in range(api.CountTrackMediaItems(t.id))
+                )
+            ),
+            'Item._track_inside': lambda i: Ref(
+                'Track', [api.GetMediaItemTrack(i.id)], {}
+            ),
+            'Item._takes_inside': lambda i: self._list(
+                'Take', (
+                    api.GetMediaItemTake(i.id, n)
+                    for n in range(api.GetMediaItemNumTakes(i.id))
+                )
+            ),
+            'Take._project_inside': lambda t: Ref(
+                'Project', [api.pointer(api.project)], {}
+            ),
+            'Take.get_midi': self.get_midi,
+            'Take.set_midi': self.set_midi,
+            'FXParamsList._get_param_index': self.param_index,
+            'FXParamsList._get_values': lambda params: [
+                param[1] for param in self._fx(params).params
+            ],
+            '_get_api_names': api.names,
+        }
+
+    def get_midi(self, take: Ref, size: int = 0) -> ty.List[ty.Any]:
+        return [
+            {
+                'ppq': ppq,
+                'selected': bool(flags & 1),
+                'muted': bool(flags & 2),
+                'cc_shape': flags >> 4,
+                'buf': list(msg),
+            } for ppq, flags, msg in self.api._take(take.id).events
+        ]
+
+    def set_midi(
+        self,
+        take: Ref,
+        midi: ty.List[ty.Dict[str, ty.Any]],
+        start: ty.Optional[float] = None,
+        unit: str = 'seconds',
+        sort: bool = True
+    ) -> None:
+        if start is not None:
+            raise StandInError('set_midi with start is not supported')
+        events = [
+            [
+                int(event['ppq']),
+                int(event['selected']) | int(event['muted']) << 1
+                | int(event['cc_shape']) << 4,
+                bytes(event['buf'])
+            ] for event in midi
+        ]
+        if sort:
+            events.sort(key=lambda event: event[0])
+        self.api._take(take.id).events = events
+        self.api._changed()
+
+    def _fx(self, params: Ref) -> FX:
+        return self.api._fx(
+            params.kwargs['parent_id'], params.kwargs['parent_fx_index']
+        )
+
+    def param_index(self, params: Ref, name: str) -> int:
+        names = [param[0] for param in self._fx(params).params]
+        if name not in names:
+            raise IndexError(f'FX has no param named {name}')
+        return names.index(name)
+
+
+def _object_hook(obj: ty.Dict[str, ty.Any]) -> ty.Any:
+    if '__reapy__' in obj:
+        return Ref(obj['class'], obj['args'], obj['kwargs'])
+    if '__callable__' in obj:
+        return obj['name']
+    if '__slice__' in obj:
+        return slice(*obj['args'])
+    return obj
+
+
+def _default(obj: ty.Any) -> ty.Any:
+    if isinstance(obj, Ref):
+        return obj.to_dict()
+    if isinstance(obj, bytes):
+        return obj.decode('latin-1')
+    raise TypeError(f'can not encode {obj!r}')
+
+
+def _recv_exact(conn: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = conn.recv(size)
+        if not chunk:
+            raise ConnectionAbortedError()
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv(conn: socket.socket) -> bytes:
+    return _recv_exact(conn, _length.unpack(_recv_exact(conn, 8))[0])
+
+
+def _send(conn: socket.socket, data: bytes) -> None:
+    conn.sendall(_length.pack(len(data)) + data)
+
+
+class StandInServer:
+    """Serves the project to reapy clients.
+
+    Parameters
+    ----------
+    project : Project
+    latency : float
+        seconds every request is delayed by, emulating the round trip
+    port, web_port : int
+        reapy server port and the port of REAPER web interface, which
+        reapy asks for the server port
+    """
+
+    def __init__(
+        self,
+        project: Project,
+        latency: float = 0.0,
+        port: int = REAPY_SERVER_PORT,
+        web_port: int = WEB_INTERFACE_PORT,
+    ) -> None:
+        self.api = StandInAPI(project)
+        self.latency = latency
+        self.port = port
+        self.web_port = web_port
+        self.calls: ty.Counter[str] = collections.Counter()
+        self.requests = 0
+        self.wait = 0.0
+        # REAPER runs one request at a time; HOLD keeps it for a client
+        self._lock = threading.RLock()
+        self._handlers = _Methods(self.api).handlers()
+        self._servers: ty.List[socketserver.BaseServer] = []
+
+    def __repr__(self) -> str:
+        return (
+            f'<StandInServer port: {self.port} latency: {self.latency} '
+            f'requests: {self.requests}>'
+        )
+
+    def __enter__(self) -> 'StandInServer':
+        self.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def stats(self) -> ty.Dict[str, ty.Any]:
+        """Number of requests, per function, and injected wait."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'wait': self.wait,
+                'calls': dict(self.calls.most_common()),
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.requests = 0
+            self.wait = 0.0
+
+    def call(self, function: str, args: ty.Sequence[ty.Any],
+             kwargs: ty.Dict[str, ty.Any]) -> ty.Any:
+        """Execute one request, without latency and accounting."""
+        handler = self._handlers.get(function)
+        if handler is None:
+            name = function.rsplit('.', 1)[-1]
+            handler = getattr(self.api, name, None)
+            if handler is None or not name[0].isupper():
+                raise StandInError(f'{function} is not supported')
+        return handler(*args, **kwargs)
+
+    def handle(self, request: ty.Dict[str, ty.Any]) -> ty.Dict[str, ty.Any]:
+        function = request['function']
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            self.wait += self.latency
+            self.calls[function] += 1
+            if function == 'HOLD':
+                self._lock.acquire()
+                return {'type': 'result', 'value': None}
+            if function == 'RELEASE':
+                self._lock.release()
+                return {'type': 'result', 'value': None}
+            payload = request.get('input') or {}
+            try:
+                value = self.call(
+                    function, payload.get('args', ()),
+                    payload.get('kwargs', {})
+                )
+            except Exception:
+                return {'type': 'error', 'traceback': traceback.format_exc()}
+        return {'type': 'result', 'value': value}
+
+    def start(self) -> None:
+        """Serve in daemon threads."""
+        server = self
+
+        class Connection(socketserver.BaseRequestHandler):
+
+            def handle(self) -> None:
+                conn = self.request
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                _send(conn, str(self.client_address).encode('ascii'))
+                holds = 0
+                try:
+                    while True:
+                        request = json.loads(
+                            _recv(conn), object_hook=_object_hook
+                        )
+                        holds += {'HOLD': 1, 'RELEASE': -1
+                                  }.get(request['function'], 0)
+                        result = server.handle(request)
+                        _send(conn, json.dumps(result,
+                                               default=_default).encode())
+                except (ConnectionError, OSError):
+                    pass
+                finally:
+                    for _ in range(holds):
+                        server._lock.release()
+
+        class WebInterface(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self) -> None:
+                if self.path.rstrip('/').endswith('/server_port'):
+                    section = self.path.split('/')[-2]
+                    body = f'EXTSTATE\t{section}\tserver_port\t{server.port}\n'
+                elif self.path == '/stats':
+                    body = json.dumps(server.stats())
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: ty.Any) -> None:
+                ...
+
+        class TCPServer(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        class HTTPServer(http.server.ThreadingHTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._servers = [
+            TCPServer(('127.0.0.1', self.port), Connection),
+            HTTPServer(('127.0.0.1', self.web_port), WebInterface),
+        ]
+        for srv in self._servers:
+            threading.Thread(target=srv.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        for srv in self._servers:
+            srv.shutdown()
+            srv.server_close()
+        self._servers = []
+
+
+def demo_project(notes: int = 1000) -> Project:
+    """Project with selected track and MIDI item of synthetic notes."""
+    project = Project()
+    project.add_marker(16.0, 100.0, 3, 4)
+    track = project.add_track('Piano', selected=True)
+    track.add_fx('ReaEQ', ('Bypass', 'Gain'))
+    # synthetic scale, quarter notes
+    events = []
+    for idx in range(notes):
+        pitch = 60 + idx % 12
+        events.append([idx * 960, 0, bytes((0x90, pitch, 100))])
+        events.append([idx * 960 + 960, 0, bytes((0x80, pitch, 0))])
+    events.sort(key=lambda e: (e[0], e[2][0] != 0x80))
+    buffer = pack_buffer(events)
+    length = project.qn_to_time(float(notes))
+    track.add_midi_item(0.0, length, buffer, 'demo', selected=True)
+    return project
+
+
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m rea_extensions.reaper_standin',
+        description='Serve in-memory project to reapy clients.',
+    )
+    parser.add_argument(
+        '-p',
+        '--port',
+        type=int,
+        default=REAPY_SERVER_PORT,
+        help=f'(default: {REAPY_SERVER_PORT})'
+    )
+    parser.add_argument(
+        '-w',
+        '--web-port',
+        type=int,
+        default=WEB_INTERFACE_PORT,
+        help=f'(default: {WEB_INTERFACE_PORT})'
+    )
+    parser.add_argument(
+        '-l',
+        '--latency',
+        type=float,
+        default=0.0,
+        help='seconds every request is delayed by (default: 0)'
+    )
+    parser.add_argument(
+        '-n',
+        '--notes',
+        type=int,
+        default=1000,
+        help='notes in the demo item (default: 1000)'
+    )
+    args = parser.parse_args(argv)
+    server = StandInServer(
+        demo_project(args.notes), args.latency, args.port, args.web_port
+    )
+    server.start()
+    print(server)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(server.stats(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
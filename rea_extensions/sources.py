@@ -0,0 +1,168 @@
+"""Backend-neutral MIDI input of the lilypond pipeline."""
+import os
+import typing as ty
+
+from rea_extensions.midi_codec import BufferType, MidiEvents, get_midi_buffer
+from rea_extensions.midi_file import META, META_TEXT_NOTATION, MidiFile
+from rea_extensions.note_table import NoteTable
+from rea_extensions.profiling import stage
+from rea_extensions.time_map import TimeMap
+
+if ty.TYPE_CHECKING:
+    import reapy as rpr
+
+NoteInfoType = ty.Dict[str, ty.Any]
+NotationEventType = ty.Tuple[float, bytes]
+
+
+class Source:
+    """MIDI events, notes and tempo map of one item.
+
+    Events are in the shape of `rpr.Take.get_midi()`, notes are in the
+    shape of `rpr.Note.infos`.
+    """
+
+    @property
+    def name(self) -> str:
+        raise NotImplementedError()
+
+    def get_midi(self) -> ty.List['rpr.MIDIEventDict']:
+        raise NotImplementedError()
+
+    def get_notes(self) -> ty.List[NoteInfoType]:
+        raise NotImplementedError()
+
+    def get_time_map(self) -> TimeMap:
+        raise NotImplementedError()
+
+    def get_notation_events(self) -> ty.List[NotationEventType]:
+        """(ppq, text) of every REAPER notation event."""
+        return [
+            (event['ppq'], bytes(event['buf'][2:]))
+            for event in self.get_midi()
+            if list(event['buf'][0:2]) == [META, META_TEXT_NOTATION]
+        ]
+
+    def get_note_table(self, ppq_resolution: int) -> NoteTable:
+        return NoteTable.from_notes(self.get_notes(), ppq_resolution)
+
+
+class TakeSource(Source):
+    """Source, reading MIDI take from the running REAPER.
+
+    Raw MIDI buffer of the take is fetched once and decoded locally,
+    so notes don't cost a call each.
+    """
+
+    def __init__(self, take: 'rpr.Take') -> None:
+        self.take = take
+        self._events: ty.Optional[MidiEvents] = None
+
+    def __repr__(self) -> str:
+        return f'<TakeSource {self.take}>'
+
+    @property
+    def name(self) -> str:
+        return ty.cast(str, self.take.name)
+
+    @property
+    def events(self) -> MidiEvents:
+        if self._events is None:
+            with stage('fetch_midi'):
+                buf = get_midi_buffer(self.take)
+            with stage('decode_midi'):
+                self._events = MidiEvents.decode(buf)
+        return self._events
+
+    def get_midi(self) -> ty.List['rpr.MIDIEventDict']:
+        return self.events.to_dicts()
+
+    def get_notes(self) -> ty.List[NoteInfoType]:
+        return self.events.note_infos()
+
+    def get_time_map(self) -> TimeMap:
+        return TimeMap.from_take(self.take)
+
+    def get_notation_events(self) -> ty.List[NotationEventType]:
+        return ty.cast(
+            ty.List[NotationEventType], self.events.notation_events()
+        )
+
+    def get_note_table(self, ppq_resolution: int) -> NoteTable:
+        return NoteTable(self.events.notes(), ppq_resolution)
+
+
+class BufferSource(TakeSource):
+    """Source over raw `MIDI_GetAllEvts` buffer. Doesn't need REAPER.
+
+    Parameters
+    ----------
+    buffer : BufferType
+    time_map : TimeMap
+    name : str
+    """
+
+    def __init__(
+        self, buffer: BufferType, time_map: TimeMap, name: str = 'buffer'
+    ) -> None:
+        self.buffer = buffer
+        self.time_map = time_map
+        self._name = name
+        self._events: ty.Optional[MidiEvents] = None
+
+    def __repr__(self) -> str:
+        return f'<BufferSource "{self._name}" bytes: {len(self.buffer)}>'
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def events(self) -> MidiEvents:
+        if self._events is None:
+            with stage('decode_midi'):
+                self._events = MidiEvents.decode(self.buffer)
+        return self._events
+
+    def get_time_map(self) -> TimeMap:
+        return self.time_map
+
+
+class MidiFileSource(Source):
+    """Source, reading Standard MIDI File. Doesn't need REAPER.
+
+    Parameters
+    ----------
+    path : str
+    track : Optional[int]
+        if None — all tracks of file are merged
+    """
+
+    def __init__(self, path: str, track: ty.Optional[int] = None) -> None:
+        self.path = path
+        self.track = track
+        self._file: ty.Optional[MidiFile] = None
+
+    def __repr__(self) -> str:
+        return f'<MidiFileSource "{self.path}" track: {self.track}>'
+
+    @property
+    def name(self) -> str:
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def file(self) -> MidiFile:
+        if self._file is None:
+            self._file = MidiFile.read(self.path)
+        return self._file
+
+    def get_midi(self) -> ty.List['rpr.MIDIEventDict']:
+        return ty.cast(
+            ty.List['rpr.MIDIEventDict'], self.file.get_midi(self.track)
+        )
+
+    def get_notes(self) -> ty.List[NoteInfoType]:
+        return self.file.get_notes(self.track)
+
+    def get_time_map(self) -> TimeMap:
+        return self.file.get_time_map()
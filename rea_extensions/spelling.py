@@ -0,0 +1,197 @@
+"""Key-aware spelling of MIDI pitches as LilyPond note names.
+
+Tables of 128 names are built once for every major and minor key,
+so spelling a pitch is a single lookup.
+"""
+import re
+import typing as ty
+
+DEFAULT_KEY = 'c:major'
+
+LETTERS = 'cdefgab'
+NATURALS = (0, 2, 4, 5, 7, 9, 11)
+MODES = {
+    'major': (0, 2, 4, 5, 7, 9, 11),
+    # natural minor with the raised leading tone
+    'minor': (0, 2, 3, 5, 7, 8, 11),
+}
+MODE_ALIASES = {
+    '': 'major',
+    'maj': 'major',
+    'major': 'major',
+    'min': 'minor',
+    'minor': 'minor',
+    'm': 'minor',
+}
+MAJOR_TONICS = (
+    'c', 'g', 'd', 'a', 'e', 'b', 'fis', 'cis', 'f', 'bes', 'ees', 'aes',
+    'des', 'ges', 'ces'
+)
+MINOR_TONICS = (
+    'a', 'e', 'b', 'fis', 'cis', 'gis', 'dis', 'ais', 'd', 'g', 'c', 'f',
+    'bes', 'ees', 'aes'
+)
+ACCIDENTALS = {-2: 'eses', -1: 'es', 0: '', 1: 'is', 2: 'isis'}
+
+_key_pattern = re.compile(
+    r'^\s*([a-g])(isis|is|eses|es|s|##|#|bb|b|x)?\s*[:\s]?\s*(\w*)\s*$',
+    re.IGNORECASE
+)
+_alteration = {
+    None: 0,
+    '': 0,
+    'is': 1,
+    '#': 1,
+    'isis': 2,
+    '##': 2,
+    'x': 2,
+    'es': -1,
+    's': -1,
+    'b': -1,
+    'eses': -2,
+    'bb': -2,
+}
+
+
+class SpelledPitch(ty.NamedTuple):
+    letter: int
+    alteration: int
+
+    @property
+    def pitch_class(self) -> int:
+        return (NATURALS[self.letter] + self.alteration) % 12
+
+    @property
+    def name(self) -> str:
+        letter = LETTERS[self.letter]
+        acc = ACCIDENTALS[self.alteration]
+        if acc.startswith('es') and letter in ('a', 'e'):
+            acc = acc[1:]
+        return letter + acc
+
+
+def parse_key(key: str) -> ty.Tuple[SpelledPitch, str]:
+    """Parse key like 'C:min', 'Bb', 'fis:major' or 'ees minor'."""
+    match = _key_pattern.match(key)
+    if match is None:
+        raise ValueError(f"can't parse key: {key}")
+    letter, acc, mode = match.groups()
+    acc = acc.lower() if acc else acc
+    if mode.lower() not in MODE_ALIASES:
+        raise ValueError(f"unknown mode of key: {key}")
+    tonic = SpelledPitch(LETTERS.index(letter.lower()), _alteration[acc])
+    return tonic, MODE_ALIASES[mode.lower()]
+
+
+def key_name(key: str) -> str:
+    """Normalized key name, like 'ees:minor'."""
+    tonic, mode = parse_key(key)
+    return f'{_tonic_name(tonic)}:{mode}'
+
+
+def _tonic_name(tonic: SpelledPitch) -> str:
+    return LETTERS[tonic.letter] + ACCIDENTALS[tonic.alteration]
+
+
+def _signature_direction(tonic: SpelledPitch, mode: str) -> int:
+    """Sum of key signature alterations: > 0 for sharps, < 0 for flats."""
+    if mode == 'minor':
+        # relative major is a minor third higher
+        letter = (tonic.letter + 2) % 7
+        pc = (tonic.pitch_class + 3) % 12
+        tonic = SpelledPitch(letter, _alter_to(letter, pc))
+    return sum(scale.alteration for scale in _scale(tonic, 'major'))
+
+
+def _alter_to(letter: int, pitch_class: int) -> int:
+    return (pitch_class - NATURALS[letter] + 6) % 12 - 6
+
+
+def _scale(tonic: SpelledPitch, mode: str) -> ty.List[SpelledPitch]:
+    scale = []
+    for degree, interval in enumerate(MODES[mode]):
+        letter = (tonic.letter + degree) % 7
+        pc = (tonic.pitch_class + interval) % 12
+        scale.append(SpelledPitch(letter, _alter_to(letter, pc)))
+    return scale
+
+
+def _pitch_classes(tonic: SpelledPitch,
+                   mode: str) -> ty.Tuple[SpelledPitch, ...]:
+    by_pc: ty.Dict[int, SpelledPitch] = {
+        spelled.pitch_class: spelled
+        for spelled in _scale(tonic, mode)
+    }
+    direction = _signature_direction(tonic, mode)
+    for pc in range(12):
+        if pc in by_pc:
+            continue
+        if pc in NATURALS:
+            by_pc[pc] = SpelledPitch(NATURALS.index(pc), 0)
+        elif direction < 0:
+            by_pc[pc] = SpelledPitch(NATURALS.index(pc + 1), -1)
+        else:
+            by_pc[pc] = SpelledPitch(NATURALS.index(pc - 1), 1)
+    return tuple(by_pc[pc] for pc in range(12))
+
+
+def _with_octave(midi_pitch: int, spelled: SpelledPitch) -> str:
+    natural = NATURALS[spelled.letter] + spelled.alteration
+    # LilyPond `c` without octave marks is midi 48
+    octave = (midi_pitch - natural) // 12 - 4
+    if octave > 0:
+        marks = "'" * octave
+    else:
+        marks = "," * -octave
+    return spelled.name + marks
+
+
+def _build_table(tonic: SpelledPitch, mode: str) -> ty.Tuple[str, ...]:
+    pcs = _pitch_classes(tonic, mode)
+    return tuple(
+        _with_octave(midi_pitch, pcs[midi_pitch % 12])
+        for midi_pitch in range(128)
+    )
+
+
+def _build_tables() -> ty.Dict[str, ty.Tuple[str, ...]]:
+    tables = {}
+    for mode, tonics in (('major', MAJOR_TONICS), ('minor', MINOR_TONICS)):
+        for tonic_name in tonics:
+            tonic, _ = parse_key(tonic_name)
+            name = f'{_tonic_name(tonic)}:{mode}'
+            tables[name] = _build_table(tonic, mode)
+    return tables
+
+
+TABLES = _build_tables()
+
+
+def key_table(key: str = DEFAULT_KEY) -> ty.Tuple[str, ...]:
+    """128 LilyPond note names for the given key."""
+    if key in TABLES:
+        return TABLES[key]
+    name = key_name(key)
+    if name not in TABLES:
+        # enharmonic or theoretical key, like 'gis:major'
+        tonic, mode = parse_key(key)
+        TABLES[name] = _build_table(tonic, mode)
+    TABLES[key] = TABLES[name]
+    return TABLES[key]
+
+
+def spell(midi_pitch: int, key: str = DEFAULT_KEY) -> str:
+    """LilyPond note name (with octave marks) of midi pitch in key."""
+    return key_table(key)[midi_pitch]
+
+
+def spell_altered(midi_pitch: int, alteration: int) -> ty.Optional[str]:
+    """LilyPond note name of midi pitch, spelled with the alteration.
+
+    None if no letter gives the pitch with the alteration (as C flat
+    for D).
+    """
+    for letter, natural in enumerate(NATURALS):
+        if (natural + alteration - midi_pitch) % 12 == 0:
+            return _with_octave(midi_pitch, SpelledPitch(letter, alteration))
+    return None
@@ -0,0 +1,237 @@
+import math
+import typing as ty
+
+from bisect import bisect_right
+
+if ty.TYPE_CHECKING:
+    import reapy as rpr
+
+
+class TempoMarker(ty.NamedTuple):
+    """Snapshot of one REAPER tempo/time-signature marker.
+
+    `num` and `denom` are 0 if the marker does not change the meter.
+    """
+    time: float
+    qn: float
+    bpm: float
+    num: int = 0
+    denom: int = 0
+    linear: bool = False
+
+
+class MeterSegment(ty.NamedTuple):
+    qn: float
+    measure: int
+    num: int
+    denom: int
+
+    @property
+    def measure_length(self) -> float:
+        """Length of one measure in quarter notes."""
+        return self.num * 4 / self.denom
+
+
+class TimeMap:
+    """Local copy of the take tempo map.
+
+    Fetched once per take, then resolves ppq -> beat (project QN),
+    beat -> measure and ppq -> seconds in pure Python, without calling
+    REAPER for every note.
+
+    Measures are counted from 1, as in `RPR.TimeMap_QNToMeasures`.
+    """
+
+    def __init__(
+        self,
+        ppq_resolution: int = 960,
+        qn_offset: float = 0.0,
+        markers: ty.Sequence[TempoMarker] = tuple(),
+        time_signature: ty.Tuple[int, int] = (4, 4),
+        bpm: float = 120.0,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        ppq_resolution : int
+            ticks per quarter note of the take
+        qn_offset : float
+            project QN of the take ppq 0
+        markers : Sequence[TempoMarker]
+            project tempo/time-signature markers
+        time_signature : Tuple[int, int]
+            project meter before the first time-signature marker
+        bpm : float
+            project tempo before the first marker
+        """
+        self.ppq_resolution = ppq_resolution
+        self.qn_offset = qn_offset
+        self.markers = tuple(
+            sorted((TempoMarker(*m) for m in markers), key=lambda m: m.qn)
+        )
+        self.time_signature = (time_signature[0], time_signature[1])
+        self.bpm = bpm
+        self._meters = self._build_meters()
+        self._meter_qns = [m.qn for m in self._meters]
+        self._meter_measures = [m.measure for m in self._meters]
+        self._tempo_qns = [m.qn for m in self.markers]
+
+    def __repr__(self) -> str:
+        return '<TimeMap ppq:{} offset:{} markers:{}>'.format(
+            self.ppq_resolution, self.qn_offset, len(self.markers)
+        )
+
+    @classmethod
+    def from_take(cls, take: 'rpr.Take') -> 'TimeMap':
+        """Fetch the tempo map of the take, see `fetch_take_time_map`."""
+        return cls(**fetch_take_time_map(take))
+
+    def _build_meters(self) -> ty.List[MeterSegment]:
+        num, denom = self.time_signature
+        meters = [MeterSegment(0.0, 1, num, denom)]
+        for marker in self.markers:
+            if not marker.num:
+                continue
+            last = meters[-1]
+            measures = (marker.qn - last.qn) / last.measure_length
+            measure = last.measure + int(math.ceil(round(measures, 6)))
+            segment = MeterSegment(
+                marker.qn, measure, marker.num, marker.denom
+            )
+            if segment.qn == last.qn:
+                meters[-1] = segment._replace(measure=last.measure)
+            else:
+                meters.append(segment)
+        return meters
+
+    def ppq_to_beat(self, ppq: float) -> float:
+        """Convert take ppq to project QN."""
+        return self.qn_offset + ppq / self.ppq_resolution
+
+    def ppq_to_beats(self, ppqs: ty.Iterable[float]) -> ty.List[float]:
+        """Convert whole sequence of take ppq to project QN."""
+        offset, res = self.qn_offset, self.ppq_resolution
+        return [offset + ppq / res for ppq in ppqs]
+
+    def beat_to_ppq(self, beat: float) -> float:
+        return (beat - self.qn_offset) * self.ppq_resolution
+
+    def meter_at(self, beat: float) -> MeterSegment:
+        idx = bisect_right(self._meter_qns, beat) - 1
+        return self._meters[max(idx, 0)]
+
+    def beat_to_measure(self, beat: float) -> ty.Tuple[int, float, float]:
+        """Find measure of the given project QN.
+
+        Returns
+        -------
+        Tuple[int, float, float]
+            measure, QN of measure start, QN of measure end
+        """
+        meter = self.meter_at(beat)
+        length = meter.measure_length
+        passed = int(math.floor(round((beat - meter.qn) / length, 6)))
+        start = meter.qn + passed * length
+        return meter.measure + passed, start, start + length
+
+    def beats_to_measures(
+        self, beats: ty.Iterable[float]
+    ) -> ty.List[ty.Tuple[int, float, float]]:
+        return [self.beat_to_measure(beat) for beat in beats]
+
+    def measure_meter(self, measure: int) -> MeterSegment:
+        """Meter segment, the measure belongs to."""
+        idx = bisect_right(self._meter_measures, measure) - 1
+        return self._meters[max(idx, 0)]
+
+    def measure_to_beat(self, measure: int) -> float:
+        """QN of the start of the given measure."""
+        meter = self.measure_meter(measure)
+        return meter.qn + (measure - meter.measure) * meter.measure_length
+
+    def time_signature_at(self, measure: int) -> ty.Tuple[int, int]:
+        meter = self.measure_meter(measure)
+        return meter.num, meter.denom
+
+    def measure_runs(
+        self, first: int, last: int
+    ) -> ty.Iterator[ty.Tuple[int, int, MeterSegment]]:
+        """Split measures first..last (inclusive) by meter.
+
+        Yields
+        ------
+        Tuple[int, int, MeterSegment]
+            first measure of the run, number of measures, meter
+        """
+        idx = max(bisect_right(self._meter_measures, first) - 1, 0)
+        while first <= last:
+            meter = self._meters[idx]
+            end = last + 1
+            if idx + 1 < len(self._meters):
+                end = min(end, self._meters[idx + 1].measure)
+            yield first, end - first, meter
+            first = end
+            idx += 1
+
+    def beat_to_time(self, beat: float) -> float:
+        """Convert project QN to project time in seconds."""
+        idx = bisect_right(self._tempo_qns, beat) - 1
+        if idx < 0:
+            return beat * 60 / self.bpm
+        marker = self.markers[idx]
+        span = beat - marker.qn
+        if marker.linear and idx + 1 < len(self.markers):
+            nxt = self.markers[idx + 1]
+            slope = (nxt.bpm - marker.bpm) / (nxt.qn - marker.qn)
+            if slope:
+                bpm = marker.bpm + slope * span
+                return marker.time + 60 / slope * math.log(bpm / marker.bpm)
+        return marker.time + span * 60 / marker.bpm
+
+    def ppq_to_time(self, ppq: float) -> float:
+        return self.beat_to_time(self.ppq_to_beat(ppq))
+
+    def ppq_to_times(self, ppqs: ty.Iterable[float]) -> ty.List[float]:
+        return [self.beat_to_time(beat) for beat in self.ppq_to_beats(ppqs)]
+
+
+def fetch_take_time_map(take: 'rpr.Take') -> ty.Dict[str, ty.Any]:
+    """Kwargs of TimeMap of the take, fetched in one batch.
+
+    The connection is held, but every call is its own round trip: five
+    for the take and the project, and two per tempo marker.
+    """
+    import reapy as rpr
+    from reapy import reascript_api as RPR
+    with rpr.inside_reaper():
+        project = take.project
+        qn_offset = take.ppq_to_beat(0)
+        ppq_resolution = round(take.beat_to_ppq(qn_offset + 1))
+        _, _, num, denom, bpm = RPR.TimeMap_GetTimeSigAtTime(
+            project.id, 0.0, 0, 0, 0
+        )
+        markers = []
+        for idx in range(RPR.CountTempoTimeSigMarkers(project.id)):
+            (
+                _, _, _, time, _, _, marker_bpm, marker_num, marker_denom,
+                linear
+            ) = RPR.GetTempoTimeSigMarker(
+                project.id, idx, 0, 0, 0, 0, 0, 0, 0
+            )
+            markers.append(
+                TempoMarker(
+                    time=time,
+                    qn=RPR.TimeMap2_timeToQN(project.id, time),
+                    bpm=marker_bpm,
+                    num=marker_num,
+                    denom=marker_denom,
+                    linear=bool(linear),
+                )
+            )
+    return dict(
+        ppq_resolution=ppq_resolution,
+        qn_offset=qn_offset,
+        markers=markers,
+        time_signature=(num, denom),
+        bpm=bpm,
+    )
@@ -0,0 +1,185 @@
+"""Separation of overlapping notes into voices.
+
+Notes, sharing start and end, are one chord of one voice (notes with
+unset voice join the explicit chord of the same span). Other
+overlapping notes are distributed to the fewest voices by sweeping
+onsets and offsets in time order (interval partitioning), in
+O(n log n). Voices, set explicitly by notation events, are kept.
+"""
+import bisect
+import heapq
+import typing as ty
+
+import numpy as np
+
+VoiceGroup = ty.Tuple[float, float, int]
+
+# groups are converted to Python objects by chunks, to keep memory flat
+CHUNK_SIZE = 4096
+
+
+class Chords(ty.NamedTuple):
+    """Notes, grouped into chords.
+
+    Attributes
+    ----------
+    starts, ends, voices : np.ndarray
+        start, end and explicit voice of groups in sweep order
+    sweep : np.ndarray
+        group indices in sweep order
+    order : np.ndarray
+        note rows, ordered by group
+    sizes : np.ndarray
+        size of every group
+    """
+    starts: np.ndarray
+    ends: np.ndarray
+    voices: np.ndarray
+    sweep: np.ndarray
+    order: np.ndarray
+    sizes: np.ndarray
+
+    def iter_chunks(
+        self
+    ) -> ty.Iterator[ty.Tuple[slice, ty.List[VoiceGroup]]]:
+        for first in range(0, len(self.sweep), CHUNK_SIZE):
+            chunk = slice(first, first + CHUNK_SIZE)
+            yield chunk, list(
+                zip(
+                    self.starts[chunk].tolist(),
+                    self.ends[chunk].tolist(),
+                    self.voices[chunk].tolist(),
+                )
+            )
+
+
+def group_chords(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    pitches: np.ndarray,
+    voices: np.ndarray,
+) -> Chords:
+    """Group notes by (start, end, explicit voice).
+
+    At the same start explicit voices go first, then chords from the
+    highest one, so the upper voice gets the lower number.
+    """
+    order = np.lexsort((voices, ends, starts))
+    same = np.ones(len(order), dtype=bool)
+    same[0] = False
+    for column in (starts, ends, voices):
+        sorted_column = column[order]
+        same[1:] &= sorted_column[1:] == sorted_column[:-1]
+    firsts = np.flatnonzero(~same)
+    sizes = np.diff(np.append(firsts, len(order)))
+    heads = order[firsts]
+    top = np.maximum.reduceat(pitches[order].astype(np.int16), firsts)
+    sweep = np.lexsort((-top, voices[heads] == 0, starts[heads]))
+    heads = heads[sweep]
+    return Chords(
+        starts[heads], ends[heads], voices[heads], sweep, order, sizes
+    )
+
+
+def separate_voices(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    pitches: np.ndarray,
+    voices: ty.Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Assign voice (starting from 1) to every note.
+
+    Parameters
+    ----------
+    starts, ends, pitches : np.ndarray
+    voices : Optional[np.ndarray]
+        explicit voices, 0 means unset
+
+    Returns
+    -------
+    np.ndarray
+        voice of every note
+    """
+    if voices is None:
+        voices = np.zeros(len(starts), dtype=np.int64)
+    out = np.asarray(voices, dtype=np.int64).copy()
+    if not len(starts):
+        return out
+    chords = group_chords(
+        np.asarray(starts, dtype=np.float64),
+        np.asarray(ends, dtype=np.float64), np.asarray(pitches), out
+    )
+    # starts of explicit chords per voice, to not take the voice away
+    # from the note, which is coming before the auto-assigned one ends
+    pinned: ty.Dict[int, ty.List[float]] = {}
+    explicit = chords.voices != 0
+    for start, voice in zip(
+        chords.starts[explicit].tolist(), chords.voices[explicit].tolist()
+    ):
+        pinned.setdefault(voice, []).append(start)
+    last_voice = max([1, *pinned])
+    free = list(range(1, last_voice + 1))
+    is_free = set(free)
+    busy: ty.List[ty.Tuple[float, int]] = []
+    busy_until: ty.Dict[int, float] = {}
+    # voices of explicit chords at the current start by their end
+    spans: ty.Dict[float, int] = {}
+    spans_start = None
+    group_voices = np.zeros(len(chords.sweep), dtype=np.int64)
+    for chunk, groups in chords.iter_chunks():
+        chunk_voices = []
+        for start, end, voice in groups:
+            while busy and busy[0][0] <= start:
+                until, released = heapq.heappop(busy)
+                if busy_until.get(released) == until:
+                    del busy_until[released]
+                    heapq.heappush(free, released)
+                    is_free.add(released)
+            if start != spans_start:
+                spans.clear()
+                spans_start = start
+            if voice:
+                spans.setdefault(end, voice)
+            elif end in spans:
+                # the same duration as explicit chord: join it
+                voice = spans[end]
+            else:
+                voice = _take_free(free, is_free, pinned, start, end)
+                if voice is None:
+                    last_voice += 1
+                    voice = last_voice
+            is_free.discard(voice)
+            until = max(busy_until.get(voice, end), end)
+            busy_until[voice] = until
+            heapq.heappush(busy, (until, voice))
+            chunk_voices.append(voice)
+        group_voices[chords.sweep[chunk]] = chunk_voices
+    out[chords.order] = np.repeat(group_voices, chords.sizes)
+    return out
+
+
+def _take_free(
+    free: ty.List[int],
+    is_free: ty.Set[int],
+    pinned: ty.Dict[int, ty.List[float]],
+    start: float,
+    end: float,
+) -> ty.Optional[int]:
+    """Pop the lowest free voice, not needed by explicit notes in time."""
+    skipped = []
+    found = None
+    while free:
+        voice = heapq.heappop(free)
+        if voice not in is_free:
+            # taken by explicit note after it was released
+            continue
+        starts = pinned.get(voice, ())
+        idx = bisect.bisect_right(starts, start)
+        if idx < len(starts) and starts[idx] < end:
+            skipped.append(voice)
+            continue
+        found = voice
+        break
+    for voice in skipped:
+        heapq.heappush(free, voice)
+    return found
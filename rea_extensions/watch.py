@@ -0,0 +1,204 @@
+"""Live preview: re-export item to LilyPond whenever its MIDI changes.
+
+usage: python -m rea_extensions.watch [-h] [-i INTERVAL] [-d DEBOUNCE]
+                                      [-k KEY] output
+
+Watches the first selected item. REAPER is polled for the project state
+change count and the MIDI hash of the take: two cheap calls, one round
+trip each. The export starts only after the signal stayed unchanged for
+DEBOUNCE seconds (so never while notes are being dragged), and only if
+MIDI or tempo map of the take really differ from the last successful
+export. Failed export is retried only after MIDI or tempo map change.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import traceback
+import typing as ty
+
+import reapy as rpr
+
+from reapy import reascript_api as RPR
+
+from rea_extensions.lilypond import item_to_ly, ly_file
+from rea_extensions.spelling import DEFAULT_KEY
+from rea_extensions.time_map import fetch_take_time_map
+
+SignalType = ty.Tuple[int, str]
+
+
+def _change_signal(project_id: str, take_id: str) -> SignalType:
+    """State change count of project and MIDI hash of take.
+
+    Two round trips from outside REAPER: holding the connection for
+    them would cost two more.
+    """
+    count = RPR.GetProjectStateChangeCount(project_id)
+    midi_hash = RPR.MIDI_GetHash(take_id, False, '', 64)[3]
+    return count, midi_hash
+
+
+@rpr.inside_reaper()
+def _content_key(take: rpr.Take) -> str:
+    midi_hash = RPR.MIDI_GetHash(take.id, False, '', 64)[3]
+    return f'{midi_hash} {sorted(fetch_take_time_map(take).items())}'
+
+
+class TakeWatcher:
+    """Calls back with new LilyPond code of the item after it's edited.
+
+    Parameters
+    ----------
+    item : rpr.Item
+    callback : Callable[[str], None]
+        receives music of the item, as returned by `item_to_ly`
+    key : str
+    interval : float
+        seconds between polls
+    debounce : float
+        seconds the change signal has to stay the same before export
+    clock : Callable[[], float]
+        monotonic time source
+    """
+
+    def __init__(
+        self,
+        item: rpr.Item,
+        callback: ty.Callable[[str], None],
+        key: str = DEFAULT_KEY,
+        interval: float = 0.25,
+        debounce: float = 0.5,
+        clock: ty.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.item = item
+        self.take = item.active_take
+        self._project_id = self.take.project.id
+        self.callback = callback
+        self.key = key
+        self.interval = interval
+        self.debounce = debounce
+        self.clock = clock
+        self.exports = 0
+        self.last_duration = 0.0
+        self._signal: ty.Optional[SignalType] = None
+        self._changed_at = float('-inf')
+        self._pending = True
+        self._exported: ty.Optional[str] = None
+        self._failed: ty.Optional[str] = None
+        self._stop = threading.Event()
+
+    def __repr__(self) -> str:
+        return f'<TakeWatcher {self.take} exports: {self.exports}>'
+
+    def poll(self) -> bool:
+        """Check the change signal once, export if needed.
+
+        Returns
+        -------
+        bool
+            True if the item was exported
+        """
+        now = self.clock()
+        signal = _change_signal(self._project_id, self.take.id)
+        if signal != self._signal:
+            self._signal = signal
+            self._changed_at = now
+            self._pending = True
+            return False
+        if not self._pending or now - self._changed_at < self.debounce:
+            return False
+        content = _content_key(self.take)
+        self._pending = False
+        if content in (self._exported, self._failed):
+            return False
+        start = time.perf_counter()
+        try:
+            music = item_to_ly(self.item, self.key)
+            self.last_duration = time.perf_counter() - start
+            self.callback(music)
+        except Exception:
+            # the same content would fail again: wait for the next edit
+            self._failed = content
+            raise
+        # marked only after success
+        self._exported = content
+        self._failed = None
+        self.exports += 1
+        return True
+
+    def run(self) -> None:
+        """Poll until `stop()` is called.
+
+        Failed export is reported to stderr and retried after the
+        MIDI or tempo map of the take change.
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def file_writer(path: str) -> ty.Callable[[str], None]:
+    """Callback, replacing LilyPond file at path atomically."""
+
+    def write(music: str) -> None:
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(ly_file(music))
+        os.replace(tmp, path)
+
+    return write
+
+
+def main(argv: ty.Optional[ty.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m rea_extensions.watch',
+        description='Re-export selected item to LilyPond on every edit.',
+    )
+    parser.add_argument('output', help='.ly file to write')
+    parser.add_argument(
+        '-i',
+        '--interval',
+        type=float,
+        default=0.25,
+        help='seconds between polls (default: 0.25)'
+    )
+    parser.add_argument(
+        '-d',
+        '--debounce',
+        type=float,
+        default=0.5,
+        help='seconds without edits before export (default: 0.5)'
+    )
+    parser.add_argument('-k', '--key', default=DEFAULT_KEY)
+    args = parser.parse_args(argv)
+    item = rpr.Project().selected_items[0]
+    write = file_writer(args.output)
+
+    def callback(music: str) -> None:
+        write(music)
+        print(
+            f'{time.strftime("%H:%M:%S")} {args.output} '
+            f'({watcher.last_duration:.3f}s)'
+        )
+
+    watcher = TakeWatcher(
+        item, callback, args.key, args.interval, args.debounce
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
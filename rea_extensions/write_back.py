@@ -0,0 +1,219 @@
+"""Write edited MIDI events back to take by the cheaper way.
+
+The edit is diffed against the original events. Small edits are sent as
+one MIDI_SetNote per changed note (other events are left untouched);
+large ones as the single MIDI_SetAllEvts of the whole buffer. The path
+is chosen by the cost model::
+
+    sparse = changed_notes * call
+    bulk = base + events * per_event
+
+so sparse is used while changed_notes < (base + events * per_event) /
+call. Every call is a round trip over the distant API, so sparse pays
+off only for a few notes. The default costs are measured by `calibrate`
+against the stand-in server with 1 ms latency (``python -m
+rea_extensions.benchmark --write-back``); `calibrate` measures them on
+the real take as well.
+"""
+import time
+import typing as ty
+
+import numpy as np
+
+from rea_extensions.midi_codec import (
+    SELECTED, MUTED, MidiEvents, get_midi_buffer, set_midi_buffer
+)
+
+if ty.TYPE_CHECKING:
+    import reapy as rpr
+
+NONE = 'none'
+SPARSE = 'sparse'
+BULK = 'bulk'
+
+# note index, selected, muted, start, end, channel, pitch, velocity
+NoteRowType = ty.Tuple[int, bool, bool, int, int, int, int, int]
+
+
+class WriteCosts(ty.NamedTuple):
+    """Seconds per MIDI_SetNote call, per bulk write and per its event."""
+    call: float = 1.4e-3
+    base: float = 4e-3
+    per_event: float = 4e-6
+
+    def crossover(self, events: int) -> int:
+        """Number of changed notes, from which bulk write is cheaper."""
+        return int((self.base + events * self.per_event) / self.call)
+
+
+DEFAULT_COSTS = WriteCosts()
+
+
+class EventDiff(ty.NamedTuple):
+    """Changed notes and the count of changed other events.
+
+    Attributes
+    ----------
+    notes : np.ndarray
+        REAPER indices of changed notes (order of note-on events)
+    ons, offs : np.ndarray
+        event indices of note-on and note-off of changed notes
+    others : int
+        changed events, which are not paired notes
+    total : int
+        number of events
+    """
+    notes: np.ndarray
+    ons: np.ndarray
+    offs: np.ndarray
+    others: int
+    total: int
+
+
+class WritePlan(ty.NamedTuple):
+    """`path` and its payload: note rows or raw buffer (latin-1)."""
+    path: str
+    rows: ty.List[NoteRowType]
+    buffer: str
+
+
+def diff_events(
+    events: MidiEvents,
+    ppq: np.ndarray,
+    flags: ty.Optional[np.ndarray] = None,
+) -> EventDiff:
+    """Compare new ppq and flags of events with the original ones."""
+    ppq = np.asarray(ppq)
+    flags = events.events['flags'] if flags is None else np.asarray(flags)
+    changed = (ppq != events.ppq) | (flags != events.events['flags'])
+    ons, offs = events.pair_notes()
+    note_changed = changed[ons] | np.where(offs >= 0, changed[offs], False)
+    in_notes = np.zeros(len(events), dtype=bool)
+    in_notes[ons] = True
+    in_notes[offs[offs >= 0]] = True
+    notes = np.flatnonzero(note_changed)
+    return EventDiff(
+        notes, ons[notes], offs[notes], int((changed & ~in_notes).sum()),
+        len(events)
+    )
+
+
+def choose_path(diff: EventDiff, costs: WriteCosts = DEFAULT_COSTS) -> str:
+    if not len(diff.notes) and not diff.others:
+        return NONE
+    if diff.others or len(diff.notes) >= costs.crossover(diff.total):
+        return BULK
+    return SPARSE
+
+
+def plan_write_back(
+    events: MidiEvents,
+    ppq: np.ndarray,
+    flags: ty.Optional[np.ndarray] = None,
+    costs: WriteCosts = DEFAULT_COSTS,
+) -> WritePlan:
+    """Diff the edit and prepare the data for the cheaper path."""
+    ppq = np.asarray(ppq)
+    flags = events.events['flags'] if flags is None else np.asarray(flags)
+    diff = diff_events(events, ppq, flags)
+    path = choose_path(diff, costs)
+    if path == BULK:
+        buf = events.encode(ppq, flags).decode('latin-1')
+        return WritePlan(path, [], buf)
+    if path == NONE:
+        return WritePlan(path, [], '')
+    data = events.events
+    last = int(ppq.max())
+    ends = np.where(diff.offs >= 0, ppq[diff.offs], last)
+    rows = list(
+        zip(
+            diff.notes.tolist(),
+            (flags[diff.ons] & SELECTED).astype(bool).tolist(),
+            (flags[diff.ons] & MUTED).astype(bool).tolist(),
+            ppq[diff.ons].tolist(),
+            ends.tolist(),
+            (data['status'][diff.ons] & 0x0f).tolist(),
+            data['data1'][diff.ons].tolist(),
+            data['data2'][diff.ons].tolist(),
+        )
+    )
+    return WritePlan(path, ty.cast(ty.List[NoteRowType], rows), '')
+
+
+def apply_plans(
+    plans: ty.Sequence[ty.Tuple['rpr.Take', WritePlan]]
+) -> None:
+    """Apply write plans of many takes, one batch per take.
+
+    The connection is held for all of them, but every RPR call is still
+    its own round trip.
+    """
+    import reapy as rpr
+    with rpr.inside_reaper():
+        for take, plan in plans:
+            path, rows, buf = plan
+            if path == BULK:
+                set_midi_buffer(take, buf)
+            elif path == SPARSE:
+                _set_notes(take, rows)
+
+
+def _set_notes(take: 'rpr.Take', rows: ty.Sequence[NoteRowType]) -> None:
+    from reapy import reascript_api as RPR
+    for idx, selected, muted, start, end, channel, pitch, vel in rows:
+        RPR.MIDI_SetNote(
+            take.id, idx, selected, muted, start, end, channel, pitch, vel,
+            True
+        )
+    RPR.MIDI_Sort(take.id)
+
+
+def write_back(
+    take: 'rpr.Take',
+    events: MidiEvents,
+    ppq: np.ndarray,
+    flags: ty.Optional[np.ndarray] = None,
+    costs: WriteCosts = DEFAULT_COSTS,
+) -> str:
+    """Write edited events to take, return the used path."""
+    plan = plan_write_back(events, ppq, flags, costs)
+    if plan.path != NONE:
+        apply_plans([(take, plan)])
+    return plan.path
+
+
+def calibrate(take: 'rpr.Take', calls: int = 200) -> WriteCosts:
+    """Measure write costs on the take.
+
+    The take is rewritten with its own unchanged data, by both paths.
+    Costs include local encoding and the transfer to REAPER.
+    """
+    events = MidiEvents.decode(get_midi_buffer(take))
+    ons, offs = events.pair_notes()
+    if not len(ons):
+        return DEFAULT_COSTS
+    ppq = events.ppq
+    data = events.events
+    count = min(calls, len(ons))
+    rows = [
+        (
+            idx, bool(data['flags'][on] & SELECTED),
+            bool(data['flags'][on] & MUTED), int(ppq[on]),
+            int(ppq[off] if off >= 0 else ppq[-1]),
+            int(data['status'][on] & 0x0f), int(data['data1'][on]),
+            int(data['data2'][on])
+        ) for idx, on, off in zip(range(count), ons.tolist(), offs.tolist())
+    ]
+    timings = []
+    for make_plan in (
+        lambda: WritePlan(SPARSE, [], ''),
+        lambda: WritePlan(SPARSE, rows, ''),
+        lambda: WritePlan(BULK, [], events.encode().decode('latin-1')),
+    ):
+        start = time.perf_counter()
+        apply_plans([(take, make_plan())])
+        timings.append(time.perf_counter() - start)
+    base_trip, sparse, bulk = timings
+    call = max((sparse - base_trip) / count, 1e-9)
+    per_event = max((bulk - base_trip) / len(events), 0.0)
+    return WriteCosts(call, base_trip, per_event)
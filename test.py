@@ -10,4 +10,4 @@ from pprint import pprint
 item = rpr.Project().selected_items[0]
 out = ly.item_to_ly(item)
 
-print('\\version "2.19"', out, sep='\n')
+print(ly.ly_file(out))
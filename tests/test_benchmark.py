@@ -0,0 +1,27 @@
+import json
+import os
+
+import pytest
+
+from rea_extensions.benchmark import KINDS, digest, export, generate
+
+GOLDEN = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'benchmarks', 'golden.json'
+)
+
+
+@pytest.fixture(scope='module')
+def golden():
+    with open(GOLDEN) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('size', (100, 1000))
+@pytest.mark.parametrize('kind', KINDS)
+def test_export_matches_golden(golden, kind, size):
+    score = generate(kind, size)
+    code, _ = export(score)
+    assert score.name in golden, 'run benchmark with --update-golden'
+    assert len(code) == golden[score.name]['bytes']
+    assert digest(code) == golden[score.name]['sha256']
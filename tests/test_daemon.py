@@ -0,0 +1,39 @@
+import pytest
+
+from rea_extensions.daemon import Daemon
+
+
+class LostOnce:
+    """Command, which loses the connection on the first call."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError('REAPER is gone')
+        return self.calls
+
+
+def daemon_with(command):
+    reconnects = []
+    daemon = Daemon(
+        {command: LostOnce(), '_reconnect': lambda: reconnects.append(1)}
+    )
+    return daemon, reconnects
+
+
+def test_idempotent_command_is_retried_after_reconnect():
+    daemon, reconnects = daemon_with('export')
+    assert daemon.run_job('export', {}) == 2
+    assert reconnects == [1]
+
+
+def test_other_command_is_not_run_twice():
+    daemon, reconnects = daemon_with('quantize')
+    with pytest.raises(ConnectionError):
+        daemon.run_job('quantize', {})
+    assert daemon.commands['quantize'].calls == 1
+    # the next job finds the connection restored
+    assert reconnects == [1]
@@ -0,0 +1,119 @@
+import os
+import stat
+import sys
+import textwrap
+
+import pytest
+
+from rea_extensions.ly_compile import CompileError, compile_sources
+
+# Stand-in for lilypond: writes empty outputs next to the source, logs
+# every compile run as "start end" and fails on sources with FAIL.
+STUB = textwrap.dedent(
+    '''\
+    #!{python}
+    import os, sys, time
+    if sys.argv[1] == '--version':
+        print('GNU LilyPond 2.24.0 (stub)')
+        sys.exit(0)
+    *options, source = sys.argv[1:]
+    with open(source) as f:
+        text = f.read()
+    start = time.monotonic()
+    time.sleep({delay})
+    with open({log!r}, 'a') as f:
+        f.write(f'{{start}} {{time.monotonic()}}\\n')
+    if 'FAIL' in text:
+        print('score.ly:1:1: error: stub failure')
+        sys.exit(1)
+    formats = ['svg'] if options == ['-dbackend=svg'] else (
+        options[0].split('=')[1].split(',')
+    )
+    for fmt in formats:
+        open('score.' + fmt, 'w').close()
+    '''
+)
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    log = tmp_path / 'runs.log'
+    log.touch()
+    path = bin_dir / 'lilypond'
+    path.write_text(
+        STUB.format(python=sys.executable, delay=0.2, log=str(log))
+    )
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+
+    def runs():
+        return [
+            tuple(map(float, line.split()))
+            for line in log.read_text().splitlines()
+        ]
+
+    return runs
+
+
+def compile_(sources, tmp_path, **kwargs):
+    return compile_sources(
+        sources,
+        executable='lilypond',
+        cache_dir=str(tmp_path / 'cache'),
+        **kwargs
+    )
+
+
+def test_identical_sources_are_compiled_once(stub, tmp_path):
+    results = compile_(
+        [('a', '{ c }'), ('b', '{ c }'), ('c', '{ d }')], tmp_path
+    )
+    assert len(stub()) == 2
+    first, second, other = results
+    assert first.key == second.key != other.key
+    assert first.outputs == second.outputs
+    assert [r.cached for r in results] == [False, True, False]
+    assert [os.path.basename(p) for p in first.outputs] == ['score.pdf']
+
+
+def test_cache_hit_skips_lilypond(stub, tmp_path):
+    compile_([('a', '{ c }')], tmp_path, formats=('pdf', 'svg'))
+    assert len(stub()) == 2  # svg has its own run
+    result, = compile_([('a', '{ c }')], tmp_path, formats=('svg', 'pdf'))
+    assert result.cached
+    assert len(stub()) == 2
+    assert [os.path.basename(p) for p in result.outputs] == [
+        'score.pdf', 'score.svg'
+    ]
+
+
+def test_number_of_processes_is_limited(stub, tmp_path):
+    sources = [(str(idx), f'{{ c{idx} }}') for idx in range(6)]
+    results = compile_(sources, tmp_path, workers=2)
+    assert not any(isinstance(r, CompileError) for r in results)
+    runs = stub()
+    assert len(runs) == 6
+    most = max(
+        sum(start <= moment < end for start, end in runs)
+        for moment, _ in runs
+    )
+    assert most == 2
+
+
+def test_failed_compile_is_reported_and_not_cached(stub, tmp_path):
+    failed, ok = compile_([('bad', 'FAIL'), ('good', '{ c }')], tmp_path)
+    assert isinstance(failed, CompileError)
+    assert failed.name == 'bad'
+    assert failed.returncode == 1
+    assert 'stub failure' in failed.log
+    assert not ok.cached
+    again = compile_([('bad', 'FAIL')], tmp_path)[0]
+    assert isinstance(again, CompileError)
+    assert len(stub()) == 3
+    leftovers = [
+        name for _, dirs, _ in os.walk(tmp_path / 'cache') for name in dirs
+        if name.startswith('.tmp-')
+    ]
+    assert leftovers == []
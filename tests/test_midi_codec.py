@@ -0,0 +1,46 @@
+from rea_extensions.midi_codec import MidiEvents, pack_events
+from rea_extensions.midi_file import pair_notes
+
+
+def on(ppq: int, pitch: int = 60, channel: int = 0):
+    return ppq, 0, bytes([0x90 | channel, pitch, 100])
+
+
+def off(ppq: int, pitch: int = 60, channel: int = 0):
+    return ppq, 0, bytes([0x80 | channel, pitch, 0])
+
+
+def spans(events: MidiEvents):
+    return [
+        (int(note['start']), int(note['end'])) for note in events.notes()
+    ]
+
+
+def test_orphan_note_off_is_ignored():
+    raw = [off(0), on(100), off(200), on(300), off(400)]
+    events = MidiEvents.decode(pack_events(raw))
+    assert spans(events) == [(100, 200), (300, 400)]
+    # the same as the Standard MIDI File reader
+    dicts = events.to_dicts()
+    assert [
+        (n['ppq_position'], n['ppq_end']) for n in pair_notes(dicts)
+    ] == [(100, 200), (300, 400)]
+
+
+def test_overlapping_notes_close_first_in_first_out():
+    raw = [on(0), on(100), off(200), off(300), on(0, 62), off(50, 62)]
+    events = MidiEvents.decode(pack_events(raw))
+    assert sorted(spans(events)) == [(0, 50), (0, 200), (100, 300)]
+
+
+def test_note_without_off_ends_at_last_event():
+    raw = [on(0), on(100, 62), off(500, 62)]
+    events = MidiEvents.decode(pack_events(raw))
+    ons, offs = events.pair_notes()
+    assert offs.tolist()[0] == -1
+    assert spans(events) == [(0, 500), (100, 500)]
+
+
+def test_note_on_with_zero_velocity_is_note_off():
+    raw = [on(0), (240, 0, bytes([0x90, 60, 0]))]
+    assert spans(MidiEvents.decode(pack_events(raw))) == [(0, 240)]
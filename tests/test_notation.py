@@ -0,0 +1,85 @@
+import io
+
+from rea_extensions.lilypond import BAR_CACHE, write_ly
+from rea_extensions.midi_codec import pack_events
+from rea_extensions.notation import parse_notation, parse_track_notation
+from rea_extensions.sources import BufferSource
+from rea_extensions.time_map import TimeMap
+
+PPQ = 960
+
+
+def export(notes, texts):
+    events = []
+    for start, end, pitch in notes:
+        events.append((end, 0, bytes((0x80, pitch, 0))))
+        events.append((start, 0, bytes((0x90, pitch, 100))))
+    events.sort(key=lambda event: (event[0], event[2][0] != 0x80))
+    events.extend((ppq, 0, b'\xff\x0f' + text) for ppq, text in texts)
+    BAR_CACHE.clear()
+    out = io.StringIO()
+    write_ly(BufferSource(pack_events(events), TimeMap(PPQ)), out)
+    return out.getvalue()
+
+
+def quarters(*pitches):
+    return [
+        (idx * PPQ, (idx + 1) * PPQ, pitch)
+        for idx, pitch in enumerate(pitches)
+    ]
+
+
+def test_notehead_and_accidentals_are_rendered():
+    code = export(
+        quarters(60, 61, 62, 64), [
+            (0, b'NOTE 0 60 notehead x'),
+            (PPQ, b'NOTE 0 61 accidental flat'),
+            (PPQ * 2, b'NOTE 0 62 accidental courtesy'),
+            (PPQ * 3, b'NOTE 0 64 notehead diamond accidental forced'),
+        ]
+    )
+    assert (
+        "\\xNote c'4 des'!4 d'?4 \\tweak style #'diamond e'!4" in code
+    )
+
+
+def test_forced_accidental_only_on_first_tied_duration():
+    code = export(
+        [(0, PPQ * 5 // 4, 61)], [(0, b'NOTE 0 61 accidental flat')]
+    )
+    assert "des'!4~ des'16" in code
+
+
+def test_track_dynamics_and_hairpin_go_to_notes():
+    code = export(
+        quarters(60, 62, 64, 65), [
+            (0, b'TRAC dynamic p'),
+            (PPQ, b'TRAC dynamic crescendo len 2'),
+            (PPQ * 2, b'NOTE 0 64 articulation staccato'),
+        ]
+    )
+    assert "c'4\\p d'4\\< e'4-. f'4\\!" in code
+
+
+def test_unknown_values_are_kept_not_rendered():
+    parsed = parse_notation(
+        b'NOTE 0 60 notehead weird lyric "la" fingering \xff3'
+    )
+    assert parsed.attributes == {}
+    assert parsed.unknown == ['notehead weird', 'lyric la']
+    assert parsed.post_events == '-\ufffd3'
+    assert parse_track_notation(b'TRAC clef treble') is None
+
+
+def test_hairpin_ending_after_last_note_is_terminated():
+    code = export(quarters(60, 62), [(PPQ, b'TRAC dynamic crescendo len 2')])
+    assert "d'4\\< <>\\! r2" in code
+
+
+def test_hairpin_end_follows_note_tied_over_barline():
+    code = export(
+        [(PPQ * 3, PPQ * 5, 65)], [(PPQ * 3, b'TRAC dynamic crescendo len 3')]
+    )
+    assert "f'4\\<~" in code
+    assert "f'4 <>\\!" in code
+    assert code.count('\\!') == 1
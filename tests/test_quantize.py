@@ -0,0 +1,44 @@
+import numpy as np
+
+from rea_extensions.midi_codec import SELECTED, MidiEvents, pack_events
+from rea_extensions.quantize import quantize, quantize_events
+from rea_extensions.time_map import TimeMap
+
+
+def test_grid_is_chosen_for_every_beat():
+    starts = np.array([0.02, 0.26, 0.49, 0.76, 1.01, 1.34, 1.65])
+    ends = np.append(starts[1:], 2.0)
+    result = quantize(starts, ends)
+    # straight, triplet, and the last end alone on the straight grid
+    assert result.beats.tolist() == [0, 1, 2]
+    assert result.grids.tolist() == [0, 1, 0]
+    assert np.allclose(
+        result.starts, [0, 0.25, 0.5, 0.75, 1, 4 / 3, 5 / 3]
+    )
+    assert np.allclose(result.ends[-1], 2.0)
+
+
+def test_collapsed_note_gets_one_step_of_its_grid():
+    result = quantize([0.1, 1.02], [0.15, 1.05], divisions=(4, 3))
+    assert np.allclose(result.starts, [0, 1])
+    assert np.allclose(result.ends, [0.25, 1.25])
+    result = quantize([0.3], [0.36], divisions=(3, ))
+    assert np.allclose(result.ends, [2 / 3])
+
+
+def test_note_offs_of_selected_notes_are_snapped():
+    raw = [
+        (10, SELECTED, bytes((0x90, 60, 100))),
+        (470, SELECTED, bytes((0x80, 60, 0))),
+        (500, 0, bytes((0x90, 62, 100))),
+        (700, 0, bytes((0x80, 62, 0))),
+    ]
+    events = MidiEvents.decode(pack_events(raw))
+    new_ppq = quantize_events(events, TimeMap(960), divisions=(4, ))
+    assert new_ppq.tolist() == [0, 480, 500, 700]
+
+
+def test_nothing_selected_is_not_quantized():
+    raw = [(10, 0, bytes((0x90, 60, 100))), (470, 0, bytes((0x80, 60, 0)))]
+    events = MidiEvents.decode(pack_events(raw))
+    assert quantize_events(events, TimeMap(960)) is None
@@ -0,0 +1,104 @@
+import importlib.util
+
+import pytest
+
+from rea_extensions.reaper_standin import StandInServer, demo_project
+
+LATENCY = 0.001
+
+
+@pytest.fixture(scope='module')
+def standin():
+    if importlib.util.find_spec('reapy') is None:
+        pytest.skip('reapy is not installed')
+    # reapy connects on import, so the server goes first
+    with StandInServer(demo_project(200), latency=LATENCY) as server:
+        yield server
+
+
+@pytest.fixture(scope='module')
+def rpr(standin):
+    import reapy
+    return reapy
+
+
+def test_export_costs_constant_round_trips(standin, rpr):
+    from rea_extensions.lilypond import item_to_ly
+    item = rpr.Project().selected_items[0]
+    standin.reset_stats()
+    ly = item_to_ly(item)
+    stats = standin.stats()
+    calls = stats['calls']
+    assert ly.startswith('{\\new Staff')
+    assert '\\time 3/4' in ly
+    # the whole MIDI in one call, nothing per note
+    assert calls['MIDI_GetAllEvts'] == 1
+    assert 'MIDI_GetNote' not in calls
+    # one marker of the demo project
+    assert calls['CountTempoTimeSigMarkers'] == 1
+    assert calls['GetTempoTimeSigMarker'] == 1
+    assert calls['HOLD'] == calls['RELEASE']
+    assert stats['requests'] == sum(calls.values())
+    assert stats['requests'] <= 16
+    assert stats['wait'] == pytest.approx(stats['requests'] * LATENCY)
+
+
+def test_round_trips_do_not_grow_with_notes(standin, rpr):
+    from rea_extensions.lilypond import item_to_ly
+    item = rpr.Project().selected_items[0]
+    standin.reset_stats()
+    item_to_ly(item)
+    requests = standin.stats()['requests']
+    take = standin.api.project.tracks[0].items[0].takes[0]
+    take.events = demo_project(2000).tracks[0].items[0].takes[0].events
+    standin.reset_stats()
+    item_to_ly(item)
+    assert standin.stats()['requests'] == requests
+
+
+def test_failed_export_is_retried_after_edit(standin, rpr):
+    from rea_extensions.watch import TakeWatcher
+    now = [0.0]
+    calls = []
+
+    def callback(music):
+        calls.append(music)
+        if len(calls) == 1:
+            raise RuntimeError('disk is full')
+
+    item = rpr.Project().selected_items[0]
+    watcher = TakeWatcher(item, callback, debounce=1, clock=lambda: now[0])
+
+    def poll_for(seconds):
+        for _ in range(seconds):
+            now[0] += 1
+            try:
+                watcher.poll()
+            except RuntimeError:
+                pass
+
+    poll_for(5)
+    assert len(calls) == 1 and watcher.exports == 0
+    take = standin.api.project.tracks[0].items[0].takes[0]
+    take.events = demo_project(100).tracks[0].items[0].takes[0].events
+    poll_for(5)
+    assert len(calls) == 2 and watcher.exports == 1
+
+
+def test_fx_scheduler_waits_for_shared_connection(standin, rpr):
+    import threading
+    import time
+
+    from rea_extensions.fx_scheduler import FxScheduler
+    lock = threading.Lock()
+    scheduler = FxScheduler.from_project(interval=0.01, lock=lock)
+    with lock:
+        standin.reset_stats()
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        time.sleep(0.05)
+        assert standin.stats()['requests'] == 0
+    time.sleep(0.05)
+    scheduler.stop()
+    thread.join()
+    assert standin.stats()['requests'] > 0
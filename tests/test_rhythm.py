@@ -0,0 +1,43 @@
+from fractions import Fraction
+
+from rea_extensions.lilypond import (
+    Length, Music, Note, Pitch, Rest, quarters_to_ticks
+)
+
+
+def note(pitch: int, length: float) -> Note:
+    return Note(Pitch(pitch), None, Length(length))
+
+
+def test_consecutive_tuplet_notes_share_block():
+    music = Music(*(note(60 + i, 1 / 3) for i in range(3)), note(65, 1))
+    assert music.for_ly == "\\tuplet 3/2 { c'8 cis'8 d'8 } f'4"
+
+
+def test_different_tuplets_are_not_merged():
+    music = Music(
+        note(60, 1 / 3), note(62, 1 / 5), Rest(Length(Fraction(1, 12)))
+    )
+    assert music.for_ly == (
+        "\\tuplet 3/2 { c'8 } \\tuplet 5/4 { d'16 } \\tuplet 3/2 { r8 }"
+    )
+
+
+def test_ties_stay_inside_tuplet_block():
+    length = Length(Fraction(1, 3), tie=True)
+    assert length.render("c'") == "\\tuplet 3/2 { c'2~ }"
+    assert Length(5 / 3).render("c'") == "c'4.~ \\tuplet 3/2 { c'16 }"
+
+
+def test_lengths_snap_to_grid():
+    # 128th notes and 32nd notes of triplets, quintuplets, septuplets
+    assert quarters_to_ticks(1 / 3) == 1120
+    assert quarters_to_ticks(1 / 5) == 672
+    assert quarters_to_ticks(1 / 7) == 480
+    # slightly late triplet is still a triplet
+    assert quarters_to_ticks(318 / 960) == 1120
+
+
+def test_slightly_long_note_is_not_short_tuplet():
+    # 1000 ticks of 960 per quarter
+    assert Length(1000 / 960).render("c'") == "c'4~ c'128"
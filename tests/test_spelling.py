@@ -0,0 +1,40 @@
+from rea_extensions.spelling import key_name, spell, spell_altered
+
+
+def test_black_keys_follow_key_signature():
+    assert spell(61, 'f:major') == "des'"
+    assert spell(70, 'F') == "bes'"
+    assert spell(61, 'd:major') == "cis'"
+    assert spell(66, 'D') == "fis'"
+    # a and e lose the e of es
+    assert spell(63, 'bes:major') == "es'"
+    assert spell(68, 'ees:major') == "as'"
+
+
+def test_minor_keys_raise_leading_tone():
+    assert spell(68, 'a:minor') == "gis'"
+    assert spell(63, 'c:min') == "es'"
+    assert spell(71, 'c minor') == "b'"
+    assert spell(70, 'e:minor') == "ais'"
+
+
+def test_octave_marks_across_octave_boundary():
+    # B sharp sounds as the c of the next octave and vice versa
+    assert spell(60, 'cis:major') == 'bis'
+    assert spell(72, 'cis:major') == "bis'"
+    assert spell(59, 'ces:major') == "ces'"
+    assert spell(71, 'ces:major') == "ces''"
+
+
+def test_spell_altered():
+    assert spell_altered(60, 1) == 'bis'
+    assert spell_altered(59, -1) == "ces'"
+    assert spell_altered(62, 2) == "cisis'"
+    assert spell_altered(64, 0) == "e'"
+    # no letter gives D with a single flat
+    assert spell_altered(62, -1) is None
+
+
+def test_key_names_are_normalized():
+    assert key_name('Bb') == 'bes:major'
+    assert key_name('ees minor') == 'ees:minor'
@@ -0,0 +1,45 @@
+import numpy as np
+
+from rea_extensions.voices import separate_voices
+
+
+def voices(notes, explicit=None):
+    starts, ends, pitches = (np.array(column) for column in zip(*notes))
+    if explicit is not None:
+        explicit = np.array(explicit)
+    return separate_voices(starts, ends, pitches, explicit).tolist()
+
+
+def test_explicit_voices_are_kept():
+    notes = [(0, 2, 60), (0, 2, 64), (1, 2, 67)]
+    assert voices(notes, [3, 3, 0]) == [3, 3, 1]
+
+
+def test_free_voice_is_not_taken_from_later_pinned_note():
+    # voice 1 is free at 0, but its explicit note starts at 1
+    notes = [(0, 2, 60), (1, 2, 72)]
+    assert voices(notes, [0, 1]) == [2, 1]
+    assert voices(notes) == [1, 2]
+
+
+def test_overlapping_notes_get_fewest_voices():
+    notes = [(0, 2, 60), (1, 3, 62), (2, 4, 64), (3, 5, 65), (3, 4, 67)]
+    result = voices(notes)
+    assert len(set(result)) == 3
+    # at the same start the upper note takes the lower voice
+    assert result == [1, 2, 1, 3, 2]
+
+
+def test_chords_share_voice_upper_goes_first():
+    notes = [(0, 1, 60), (0, 1, 64), (0, 2, 48), (0, 2, 52)]
+    assert voices(notes) == [1, 1, 2, 2]
+
+
+def test_unset_note_joins_explicit_chord_of_same_span():
+    notes = [(0, 1, 60), (0, 1, 64), (0, 1, 67)]
+    assert voices(notes, [2, 0, 0]) == [2, 2, 2]
+
+
+def test_no_notes():
+    empty = np.array([], dtype=np.float64)
+    assert separate_voices(empty, empty, empty).tolist() == []
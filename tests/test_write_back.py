@@ -0,0 +1,59 @@
+from rea_extensions.midi_codec import SELECTED, MidiEvents, pack_events
+from rea_extensions.write_back import (
+    BULK, NONE, SPARSE, WriteCosts, diff_events, plan_write_back
+)
+
+# orphan note-off, then notes (60, ch 0) 100-200 and (62, ch 1) 300-400
+RAW = [
+    (0, 0, bytes([0x80, 60, 0])),
+    (100, 0, bytes([0x90, 60, 100])),
+    (200, 0, bytes([0x80, 60, 0])),
+    (300, SELECTED, bytes([0x91, 62, 90])),
+    (350, 0, bytes([0xb0, 1, 64])),
+    (400, SELECTED, bytes([0x81, 62, 0])),
+]
+
+
+def decode() -> MidiEvents:
+    return MidiEvents.decode(pack_events(RAW))
+
+
+def test_unchanged_events_need_no_write():
+    events = decode()
+    assert plan_write_back(events, events.ppq).path == NONE
+
+
+def test_sparse_rows_address_the_moved_note():
+    events = decode()
+    ppq = events.ppq.copy()
+    ppq[[3, 5]] = [320, 420]
+    diff = diff_events(events, ppq)
+    assert diff.notes.tolist() == [1]
+    assert diff.others == 0
+    plan = plan_write_back(events, ppq)
+    assert plan.path == SPARSE
+    assert plan.rows == [(1, True, False, 320, 420, 1, 62, 90)]
+
+
+def test_end_of_note_comes_from_its_own_note_off():
+    events = decode()
+    ppq = events.ppq.copy()
+    ppq[2] = 250
+    flags = events.events['flags'].copy()
+    flags[1] |= SELECTED
+    plan = plan_write_back(events, ppq, flags)
+    assert plan.rows == [(0, True, False, 100, 250, 0, 60, 100)]
+
+
+def test_other_events_and_expensive_calls_go_bulk():
+    events = decode()
+    ppq = events.ppq.copy()
+    ppq[0] = 10  # the orphan note-off is not a note
+    plan = plan_write_back(events, ppq)
+    assert plan.path == BULK
+    written = MidiEvents.decode(plan.buffer)
+    assert written.ppq.tolist() == [10, 100, 200, 300, 350, 400]
+    ppq = events.ppq.copy()
+    ppq[1] = 110
+    expensive_calls = WriteCosts(call=1.0, base=0.0, per_event=0.0)
+    assert plan_write_back(events, ppq, costs=expensive_calls).path == BULK